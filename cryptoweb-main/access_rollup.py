@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+AccessLogs Hourly Rollup for Credit Card Vault
+Per-hour, per-action, per-user event counts for audit statistics
+
+The audit flusher (audit_queue.py) folds every batch it writes to
+AccessLogs into AccessLogRollup right after the insert commits, so auditor
+statistics and time-range reports read a few rollup rows per hour instead
+of scanning the raw log. Counts are occurrences: an AccessLogs row adds its
+event_count (a LOGIN_THROTTLED summary stands for many rejections). Rows
+without a user are stored with userid ''. Hours missed by a failed rollup
+write (audit rollup_errors) are repaired with --backfill.
+
+Counts are bucketed by hour, so "last 7 days" means "since the start of
+the hour 7 days ago".
+
+Usage:
+    python access_rollup.py --backfill                    # all history before this hour
+    python access_rollup.py --backfill --since 2026-01-01 --until 2026-02-01
+"""
+
+import argparse
+from collections import Counter
+from datetime import datetime, timedelta
+
+import mysql.connector
+from mysql.connector import Error
+
+from config import db_config
+
+ROLLUP_TABLE = """
+    CREATE TABLE IF NOT EXISTS AccessLogRollup (
+        hour_start DATETIME NOT NULL,
+        action VARCHAR(100) NOT NULL,
+        userid VARCHAR(50) NOT NULL DEFAULT '',
+        event_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour_start, action, userid),
+        KEY idx_rollup_user_hour (userid, hour_start)
+    )
+"""
+
+
+def hour_start(timestamp):
+    """Truncate a datetime to its hour bucket"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+# ==================== INCREMENTAL MAINTENANCE ====================
+def record_batch(cursor, events):
+    """
+    Add a batch of audit events to the rollup
+
+    `events` are audit_queue tuples:
+    (userid, action, table_name, record_id, ip_address, user_agent, timestamp, event_count)
+    Issues one multi-row upsert; the caller commits.
+    """
+    counts = Counter()
+    for event in events:
+        counts[(hour_start(event[6]), event[1], event[0] or '')] += event[7]
+    if not counts:
+        return
+
+    placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(counts))
+    params = [value for key, count in counts.items() for value in (*key, count)]
+    cursor.execute(
+        "INSERT INTO AccessLogRollup (hour_start, action, userid, event_count) "
+        f"VALUES {placeholders} "
+        "ON DUPLICATE KEY UPDATE event_count = event_count + VALUES(event_count)",
+        params
+    )
+
+
+# ==================== READS ====================
+def auditor_stats(cursor, now=None):
+    """Auditor dashboard: events in the last 7 days and distinct users in the last day"""
+    now = now or datetime.now()
+
+    cursor.execute(
+        "SELECT COALESCE(SUM(event_count), 0) AS recent_logs FROM AccessLogRollup WHERE hour_start >= %s",
+        (hour_start(now - timedelta(days=7)),)
+    )
+    recent_logs = cursor.fetchone()['recent_logs']
+
+    cursor.execute(
+        "SELECT COUNT(DISTINCT userid) AS active_users FROM AccessLogRollup "
+        "WHERE hour_start >= %s AND userid <> ''",
+        (hour_start(now - timedelta(days=1)),)
+    )
+    active_users = cursor.fetchone()['active_users']
+
+    return {'recent_logs': int(recent_logs), 'active_users': active_users}
+
+
+def hourly_counts(cursor, since, until, action_prefix=None, userid=None):
+    """Event counts per hour for a time range, optionally filtered"""
+    sql = ("SELECT hour_start, SUM(event_count) AS events FROM AccessLogRollup "
+           "WHERE hour_start >= %s AND hour_start < %s")
+    params = [hour_start(since), until]
+    if action_prefix:
+        sql += " AND action LIKE %s ESCAPE '!'"
+        params.append(action_prefix.replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%')
+    if userid is not None:
+        sql += " AND userid = %s"
+        params.append(userid)
+    sql += " GROUP BY hour_start ORDER BY hour_start"
+    cursor.execute(sql, tuple(params))
+    return cursor.fetchall()
+
+
+# ==================== BACKFILL ====================
+def backfill(conn, since=None, until=None):
+    """
+    Rebuild rollup rows from raw AccessLogs, one day per transaction
+
+    Hours are recomputed absolutely (not incremented), so re-running is
+    safe. `until` defaults to the start of the current hour so the hour the
+    flusher is still writing to is left alone.
+    """
+    cursor = conn.cursor()
+    until = until or hour_start(datetime.now())
+    if since is None:
+        cursor.execute("SELECT MIN(timestamp) FROM AccessLogs")
+        since = cursor.fetchone()[0]
+        if since is None:
+            print("✓ AccessLogs is empty - nothing to backfill")
+            return 0
+    since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    total = 0
+    day = since
+    while day < until:
+        day_end = min(day + timedelta(days=1), until)
+        cursor.execute("""
+            INSERT INTO AccessLogRollup (hour_start, action, userid, event_count)
+            SELECT DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00'), action, COALESCE(userid, ''), SUM(event_count)
+            FROM AccessLogs
+            WHERE timestamp >= %s AND timestamp < %s
+            GROUP BY 1, 2, 3
+            ON DUPLICATE KEY UPDATE event_count = VALUES(event_count)
+        """, (day, day_end))
+        conn.commit()
+        total += cursor.rowcount
+        print(f"   ✓ {day:%Y-%m-%d}")
+        day = day_end
+
+    print(f"\n✓ Rollup backfilled from {since:%Y-%m-%d} to {until:%Y-%m-%d %H:%M}")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AccessLogs hourly rollup maintenance')
+    parser.add_argument('--backfill', action='store_true', help='rebuild rollup rows from AccessLogs')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='first day (default: oldest log)')
+    parser.add_argument('--until', type=datetime.fromisoformat, help='end (default: start of current hour)')
+    args = parser.parse_args()
+
+    if not args.backfill:
+        parser.print_help()
+        return
+
+    try:
+        conn = mysql.connector.connect(**db_config)
+        conn.cursor().execute(ROLLUP_TABLE)
+        backfill(conn, args.since, args.until)
+        conn.close()
+    except Error as e:
+        print(f"✗ Error: {e}")
+
+
+if __name__ == '__main__':
+    main()
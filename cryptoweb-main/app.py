@@ -1,16 +1,34 @@
 # app.py - Credit Card Vault Application with Kerberos Security
-from flask import Flask, render_template, request, redirect, session, flash, url_for, jsonify
+from flask import Flask, render_template, request, redirect, session, flash, url_for, jsonify, g
 import mysql.connector
-from functools import wraps
 import os
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from flask import current_app # Import current_app
 
+# Shared per-process connection pool and audit writer
+import db_pool
+import audit_queue
+import session_store
+import ticket_revocation
+import auth_middleware
+import rate_limit
+import vault_crypto
+import metrics
+import health_checks
+import slow_query_log
+from auth_middleware import PUBLIC, require
+from access_rollup import auditor_stats
+from dashboard_counters import read_admin_stats, read_merchant_stats
+from pagination import (
+    PAGE_SIZE, InvalidCursor, decode_cursor, keyset_clause, build_page, page_size
+)
+
 # Import Kerberos authentication module
 from kerberos_auth import (
     KerberosAuth, KerberosTicket, KerberosLogger,
-    kerberos_required, kerberos_role_required, get_ticket_info
+    kerberos_required, kerberos_role_required, get_ticket_info,
+    service_ticket_required, service_ticket_stats, revoke_session_tickets
 )
 
 load_dotenv()
@@ -18,6 +36,10 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "credit-vault-secret-key-2024")
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(seconds=1800)
+db_pool.init_app(app)
+
+# Per-route latency / DB / template timings, served on /metrics
+metrics.init_app(app)
 
 # Database Configuration
 db_config = {
@@ -28,51 +50,80 @@ db_config = {
     'charset': 'utf8mb4'
 }
 
-# AES Encryption Key for sensitive data
-AES_KEY = os.getenv("AES_KEY", "my-secure-aes-key-2024")
+# Session data lives server-side; the cookie only carries the session ID
+session_store.init_app(app, db_config)
+ticket_revocation.configure(db_config)
+
+# Login attempts over the per-IP / per-user budget get a 429 before touching MySQL
+rate_limit.init_app(app, db_config)
+
+# Statements over SLOW_QUERY_MS are logged with their route and EXPLAIN plan
+slow_query_log.init_app(app, db_config)
+
+# /livez and /readyz; the DB is probed in the background, never by the probe request
+health_checks.init_app(app, db_config)
+
+# Card data is encrypted in the app (vault_crypto); MySQL never sees a key
 
 # ==================== DATABASE FUNCTIONS ====================
 def get_db():
-    """Create database connection"""
-    return mysql.connector.connect(**db_config)
+    """Get the request's pooled database connection (close() is a no-op inside a request)"""
+    return db_pool.get_connection(db_config)
+
+def card_mask_columns(alias=''):
+    """Listing columns for mask_cards(): stored last4, ciphertext only where it is missing"""
+    return f"{alias}card_last4, CASE WHEN {alias}card_last4 IS NULL THEN {alias}card_number END AS card_blob"
+
+def mask_cards(rows):
+    """
+    Set masked_card from card_last4 / card_blob (card_mask_columns)
+    Only rows without a stored last4 are decrypted, as one batch.
+    """
+    missing = [row for row in rows if row['card_last4'] is None and row['card_blob'] is not None]
+    numbers = vault_crypto.decrypt_many([row['card_blob'] for row in missing], 'card_number')
+    for row, number in zip(missing, numbers):
+        row['card_last4'] = number[-4:]
+    for row in rows:
+        last4 = row.pop('card_last4')
+        row.pop('card_blob')
+        row['masked_card'] = f"****{last4}" if last4 else None
+    return rows
 
 def log_access(action, table_name=None, record_id=None):
-    """Log user actions"""
+    """Log user actions (queued; written to AccessLogs in batches by the audit flusher)"""
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO AccessLogs (userid, action, table_name, record_id, ip_address, user_agent)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (session.get('userid'), action, table_name, record_id,
-              request.remote_addr, request.headers.get('User-Agent')))
-        conn.commit()
-        conn.close()
+        audit_queue.record(db_config, session.get('userid'), action, table_name, record_id)
     except Exception as e:
         app.logger.error(f"Log error: {e}")
 
-# ==================== DECORATORS ====================
-def login_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        if 'userid' not in session:
-            flash('Please login to continue.', 'warning')
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
-    return decorated
-
-def role_required(*roles):
-    def decorator(f):
-        @wraps(f)
-        def decorated(*args, **kwargs):
-            if 'userid' not in session:
-                return redirect(url_for('login'))
-            if session.get('role') not in roles:
-                flash('Access denied. Insufficient privileges.', 'danger')
-                return redirect(url_for('dashboard'))
-            return f(*args, **kwargs)
-        return decorated
-    return decorator
+# ==================== ACCESS POLICY ====================
+# One auth pass per request (auth_middleware); endpoints not listed require a login
+AUTH_POLICY = {
+    'login': PUBLIC,
+    'logout': PUBLIC,
+    'test': PUBLIC,
+    'health': PUBLIC,
+    'livez': PUBLIC,
+    'readyz': PUBLIC,
+    'metrics': PUBLIC,  # metrics_view requires METRICS_TOKEN (closed unless METRICS_PUBLIC=1)
+    'register': require('admin'),
+    'dashboard': require(),
+    'vault': require('admin', 'merchant', 'customer'),
+    'add_card': require('customer', 'admin'),
+    'card_details': require('admin', 'merchant'),
+    'delete_card': require('admin', 'customer'),
+    'invoices': require(),
+    'api_invoices': require(api=True),
+    'create_invoice': require('merchant', 'admin'),
+    'reports': require('admin', 'merchant', 'auditor'),
+    'audit_logs': require('admin', 'auditor'),
+    'api_audit_logs': require('admin', 'auditor', api=True),
+    'profile': require(),
+    'change_password': require(),
+    'kerberos_status': require(),
+    'renew_ticket': require(),
+}
+auth_middleware.init_app(app, db_config, AUTH_POLICY)
 
 # ==================== AUTHENTICATION ====================
 @app.route('/', methods=['GET', 'POST'])
@@ -87,53 +138,38 @@ def login():
             return render_template('login.html')
         
         try:
-            conn = get_db()
-            cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute("""
-                SELECT userid, role, full_name, is_active 
-                FROM Users 
-                WHERE userid = %s AND password_hash = SHA2(%s, 256)
-            """, (userid, password))
-            
-            user = cursor.fetchone()
+            # Verify once, issue the TGT from the same row, defer the audit writes
+            user, ticket, msg = KerberosAuth.login(userid, password, db_config)
             
-            if user and user['is_active']:
-                cursor.execute("UPDATE Users SET last_login = NOW() WHERE userid = %s", (userid,))
-                conn.commit()
-                conn.close()
-                
+            if user:
+                # Fresh server-side session ID on login (no fixation)
+                session_store.regenerate(session)
+
                 # Standard session authentication
                 session['userid'] = user['userid']
                 session['role'] = user['role']
                 session['full_name'] = user['full_name']
                 session.permanent = True
                 
-                # Issue Kerberos TGT (Ticket Granting Ticket)
-                ticket, msg = KerberosAuth.authenticate(userid, password, db_config)
-                if ticket:
-                    session['kerberos_ticket'] = ticket
-                    session['kerberos_enabled'] = True
-                    KerberosLogger.log_event('TGT_ISSUED', userid, msg, db_config)
-                    flash(f'Welcome, {user["full_name"]}! [Kerberos TGT Issued]', 'success')
-                else:
-                    flash(f'Welcome, {user["full_name"]}! (Kerberos: {msg})', 'warning')
+                # Kerberos TGT (Ticket Granting Ticket)
+                session['kerberos_ticket'] = ticket
+                session['kerberos_enabled'] = True
+                KerberosLogger.log_event('TGT_ISSUED', userid, msg, db_config)
+                flash(f'Welcome, {user["full_name"]}! [Kerberos TGT Issued]', 'success')
                 
                 log_access('LOGIN_SUCCESS')
                 return redirect(url_for('dashboard'))
             else:
+                rate_limit.login_failed(userid)
                 log_access('LOGIN_FAILED')
                 KerberosLogger.log_event('AUTH_FAILED', userid, 'Invalid credentials', db_config)
                 flash('Invalid credentials or account disabled.', 'danger')
-                conn.close()
         except Exception as e:
             flash(f'Error: {str(e)}', 'danger')
     
     return render_template('login.html')
 
 @app.route('/register', methods=['GET', 'POST'])
-@login_required
-@role_required('admin')
 def register():
     """Register new user (Admin only)"""
     if request.method == 'POST':
@@ -159,6 +195,7 @@ def register():
             conn.commit()
             conn.close()
             
+            auth_middleware.invalidate_account(userid)
             log_access('REGISTER_USER', 'Users')
             flash(f'User {userid} registered successfully!', 'success')
             return redirect(url_for('dashboard'))
@@ -174,43 +211,27 @@ def logout():
     """Logout user"""
     if 'userid' in session:
         log_access('LOGOUT')
+    # A copied ticket must stop working too, not just this session
+    revoke_session_tickets()
     session.clear()
     flash('Logged out successfully.', 'info')
     return redirect(url_for('login'))
 
 # ==================== DASHBOARD ====================
 @app.route('/dashboard')
-@login_required
 def dashboard():
     """Role-based dashboard"""
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
     stats = {}
-    role = session['role']
+    role = g.principal['role']
     
     if role == 'admin':
-        cursor.execute("SELECT COUNT(*) as total_users FROM Users")
-        stats['total_users'] = cursor.fetchone()['total_users']
-        
-        cursor.execute("SELECT COUNT(*) as total_cards FROM CardDetails WHERE is_active = TRUE")
-        stats['total_cards'] = cursor.fetchone()['total_cards']
-        
-        cursor.execute("SELECT COUNT(*) as total_invoices FROM Invoices")
-        stats['total_invoices'] = cursor.fetchone()['total_invoices']
-        
-        cursor.execute("SELECT COALESCE(SUM(amount), 0) as total_revenue FROM Invoices WHERE status = 'paid'")
-        stats['total_revenue'] = cursor.fetchone()['total_revenue']
+        # Trigger-maintained totals instead of four full-table aggregates
+        stats = read_admin_stats(cursor)
         
     elif role == 'merchant':
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total_invoices,
-                COALESCE(SUM(amount), 0) as total_revenue,
-                COALESCE(AVG(amount), 0) as avg_invoice,
-                COUNT(DISTINCT customer_id) as unique_customers
-            FROM Invoices WHERE merchant_id = %s
-        """, (session['userid'],))
-        stats = cursor.fetchone()
+        stats = read_merchant_stats(cursor, g.principal['userid'])
         
     elif role == 'customer':
         cursor.execute("""
@@ -221,15 +242,12 @@ def dashboard():
             FROM CardDetails cd
             LEFT JOIN Invoices i ON cd.id = i.card_id
             WHERE cd.userid = %s AND cd.is_active = TRUE
-        """, (session['userid'],))
+        """, (g.principal['userid'],))
         stats = cursor.fetchone()
     
     elif role == 'auditor':
-        cursor.execute("SELECT COUNT(*) as recent_logs FROM AccessLogs WHERE timestamp > DATE_SUB(NOW(), INTERVAL 7 DAY)")
-        stats['recent_logs'] = cursor.fetchone()['recent_logs']
-        
-        cursor.execute("SELECT COUNT(DISTINCT userid) as active_users FROM AccessLogs WHERE timestamp > DATE_SUB(NOW(), INTERVAL 1 DAY)")
-        stats['active_users'] = cursor.fetchone()['active_users']
+        # Hourly rollup instead of scanning raw AccessLogs
+        stats = auditor_stats(cursor)
     
     conn.close()
     log_access('VIEW_DASHBOARD')
@@ -237,22 +255,20 @@ def dashboard():
 
 # ==================== CARD VAULT ====================
 @app.route('/vault')
-@login_required
-@role_required('admin', 'merchant', 'customer')
 def vault():
     """View stored cards with AES decryption"""
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    role = session['role']
-    userid = session['userid']
+    role = g.principal['role']
+    userid = g.principal['userid']
     
     if role == 'admin':
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT 
                 cd.id,
                 cd.userid,
                 u.full_name,
-                CONCAT('****', RIGHT(AES_DECRYPT(cd.card_number, %s), 4)) as masked_card,
+                {card_mask_columns('cd.')},
                 cd.card_type,
                 cd.billing_address,
                 cd.is_default,
@@ -261,15 +277,15 @@ def vault():
             JOIN Users u ON cd.userid = u.userid
             WHERE cd.is_active = TRUE
             ORDER BY cd.created_at DESC
-        """, (AES_KEY,))
+        """)
         
     elif role == 'merchant':
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT DISTINCT
                 cd.id,
                 cd.userid,
                 u.full_name,
-                CONCAT('****', RIGHT(AES_DECRYPT(cd.card_number, %s), 4)) as masked_card,
+                {card_mask_columns('cd.')},
                 cd.card_type,
                 COUNT(i.invoice_id) as invoice_count
             FROM CardDetails cd
@@ -278,14 +294,14 @@ def vault():
             WHERE cd.is_active = TRUE AND i.merchant_id = %s
             GROUP BY cd.id
             ORDER BY cd.created_at DESC
-        """, (AES_KEY, userid))
+        """, (userid,))
         
     else:  # customer
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT 
                 id,
                 userid,
-                CONCAT('****', RIGHT(AES_DECRYPT(card_number, %s), 4)) as masked_card,
+                {card_mask_columns()},
                 card_type,
                 billing_address,
                 is_default,
@@ -293,17 +309,15 @@ def vault():
             FROM CardDetails
             WHERE userid = %s AND is_active = TRUE
             ORDER BY is_default DESC, created_at DESC
-        """, (AES_KEY, userid))
+        """, (userid,))
     
-    cards = cursor.fetchall()
+    cards = mask_cards(cursor.fetchall())
     conn.close()
     
     log_access('VIEW_VAULT')
     return render_template('vault.html', cards=cards, role=role)
 
 @app.route('/add-card', methods=['GET', 'POST'])
-@login_required
-@role_required('customer', 'admin')
 def add_card():
     """Add new card with AES encryption"""
     if request.method == 'POST':
@@ -334,17 +348,19 @@ def add_card():
             
             # Check if first card (set as default)
             cursor.execute("SELECT COUNT(*) FROM CardDetails WHERE userid = %s AND is_active = TRUE", 
-                          (session['userid'],))
+                          (g.principal['userid'],))
             is_default = cursor.fetchone()[0] == 0
             
-            # Insert with AES encryption
+            # Envelope-encrypted in the app (one data key per card); last four digits in clear for listings
+            sealed = vault_crypto.encrypt_record({'card_number': card_number, 'cvv': cvv})
             cursor.execute("""
                 INSERT INTO CardDetails 
                 (userid, card_number, cvv, card_holder_name, expiry_month, expiry_year, 
-                 billing_address, card_type, is_default)
-                VALUES (%s, AES_ENCRYPT(%s, %s), AES_ENCRYPT(%s, %s), %s, %s, %s, %s, %s, %s)
-            """, (session['userid'], card_number, AES_KEY, cvv, AES_KEY, 
-                  holder, exp_month, exp_year, address, card_type, is_default))
+                 billing_address, card_type, is_default, card_last4, key_version)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (g.principal['userid'], sealed['card_number'], sealed['cvv'], 
+                  holder, exp_month, exp_year, address, card_type, is_default, card_number[-4:],
+                  vault_crypto.ACTIVE_MASTER_KEY_ID))
             
             conn.commit()
             card_id = cursor.lastrowid
@@ -361,33 +377,42 @@ def add_card():
     
     return render_template('add_card.html', current_year=datetime.now().year)
 
+# Service grants: checked per card, remembered for the service ticket's lifetime
+def card_view_check(userid, role, card_id):
+    """A merchant may view cards used on their invoices"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT 1 FROM Invoices
+        WHERE card_id = %s AND merchant_id = %s LIMIT 1
+    """, (card_id, userid))
+    allowed = cursor.fetchone() is not None
+    conn.close()
+    return allowed
+
+def card_owner_check(userid, role, card_id):
+    """A customer may manage the cards they own"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT userid FROM CardDetails WHERE id = %s", (card_id,))
+    card = cursor.fetchone()
+    conn.close()
+    return card is not None and card[0] == userid
+
 @app.route('/card-details/<int:card_id>')
-@login_required
-@role_required('admin', 'merchant')
+@service_ticket_required('card-view', roles=('admin', 'merchant'),
+                         check_grant=card_view_check, resource_arg='card_id',
+                         unrestricted_roles=('admin',), denied_endpoint='vault')
 def card_details(card_id):
     """View full card details with AES decryption"""
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    role = session['role']
-    userid = session['userid']
-    
-    # Permission check for merchant
-    if role == 'merchant':
-        cursor.execute("""
-            SELECT 1 FROM Invoices i
-            JOIN CardDetails cd ON i.card_id = cd.id
-            WHERE cd.id = %s AND i.merchant_id = %s LIMIT 1
-        """, (card_id, userid))
-        if not cursor.fetchone():
-            conn.close()
-            flash('Access denied.', 'danger')
-            return redirect(url_for('vault'))
     
     # Get decrypted card details
     cursor.execute("""
         SELECT 
-            AES_DECRYPT(cd.card_number, %s) as card_number,
-            AES_DECRYPT(cd.cvv, %s) as cvv,
+            cd.card_number,
+            cd.cvv,
             cd.card_holder_name,
             cd.expiry_month,
             cd.expiry_year,
@@ -397,12 +422,14 @@ def card_details(card_id):
         FROM CardDetails cd
         JOIN Users u ON cd.userid = u.userid
         WHERE cd.id = %s
-    """, (AES_KEY, AES_KEY, card_id))
+    """, (card_id,))
     
     card = cursor.fetchone()
     conn.close()
     
     if card:
+        card['card_number'] = vault_crypto.decrypt(card['card_number'], 'card_number')
+        card['cvv'] = vault_crypto.decrypt(card['cvv'], 'cvv')
         # Mask for display
         card_display = {
             'card_number': f"****{card['card_number'][-4:]}",
@@ -422,21 +449,14 @@ def card_details(card_id):
     return redirect(url_for('vault'))
 
 @app.route('/delete-card/<int:card_id>', methods=['POST'])
-@login_required
-@role_required('admin', 'customer')
+@service_ticket_required('card-manage', roles=('admin', 'customer'),
+                         check_grant=card_owner_check, resource_arg='card_id',
+                         unrestricted_roles=('admin',), denied_endpoint='vault')
 def delete_card(card_id):
     """Soft delete card"""
     conn = get_db()
     cursor = conn.cursor()
     
-    if session['role'] != 'admin':
-        cursor.execute("SELECT userid FROM CardDetails WHERE id = %s", (card_id,))
-        card = cursor.fetchone()
-        if not card or card[0] != session['userid']:
-            conn.close()
-            flash('Access denied.', 'danger')
-            return redirect(url_for('vault'))
-    
     cursor.execute("UPDATE CardDetails SET is_active = FALSE WHERE id = %s", (card_id,))
     conn.commit()
     conn.close()
@@ -446,61 +466,112 @@ def delete_card(card_id):
     return redirect(url_for('vault'))
 
 # ==================== INVOICES ====================
-@app.route('/invoices')
-@login_required
-def invoices():
-    """View invoices"""
-    conn = get_db()
-    cursor = conn.cursor(dictionary=True)
-    role = session['role']
-    userid = session['userid']
+def fetch_invoice_page(role, userid, after=None, before=None, limit=PAGE_SIZE):
+    """
+    One keyset page of invoices visible to role, newest first
     
+    Backed by idx_invoices_date / idx_invoices_merchant_date /
+    idx_invoices_customer_date so every page is an index range scan.
+    Returns (rows, next_cursor, prev_cursor); raises InvalidCursor.
+    """
     if role == 'admin':
-        cursor.execute("""
+        sql = f"""
             SELECT i.*, 
                    m.full_name as merchant_name,
                    c.full_name as customer_name,
-                   CONCAT('****', RIGHT(AES_DECRYPT(cd.card_number, %s), 4)) as masked_card
+                   {card_mask_columns('cd.')}
             FROM Invoices i
             JOIN Users m ON i.merchant_id = m.userid
             JOIN Users c ON i.customer_id = c.userid
             LEFT JOIN CardDetails cd ON i.card_id = cd.id
-            ORDER BY i.invoice_date DESC
-        """, (AES_KEY,))
+            WHERE 1 = 1
+        """
+        params = []
         
     elif role == 'merchant':
-        cursor.execute("""
+        sql = f"""
             SELECT i.*, 
                    c.full_name as customer_name,
-                   CONCAT('****', RIGHT(AES_DECRYPT(cd.card_number, %s), 4)) as masked_card
+                   {card_mask_columns('cd.')}
             FROM Invoices i
             JOIN Users c ON i.customer_id = c.userid
             LEFT JOIN CardDetails cd ON i.card_id = cd.id
             WHERE i.merchant_id = %s
-            ORDER BY i.invoice_date DESC
-        """, (AES_KEY, userid))
+        """
+        params = [userid]
         
     else:  # customer
-        cursor.execute("""
+        sql = f"""
             SELECT i.*, 
                    m.full_name as merchant_name,
-                   CONCAT('****', RIGHT(AES_DECRYPT(cd.card_number, %s), 4)) as masked_card
+                   {card_mask_columns('cd.')}
             FROM Invoices i
             JOIN Users m ON i.merchant_id = m.userid
             LEFT JOIN CardDetails cd ON i.card_id = cd.id
             WHERE i.customer_id = %s
-            ORDER BY i.invoice_date DESC
-        """, (AES_KEY, userid))
+        """
+        params = [userid]
+    
+    direction = 'before' if before else 'after' if after else None
+    if direction:
+        invoice_date, invoice_id = decode_cursor(before or after)
+        where, order = keyset_clause('i.invoice_date', 'i.invoice_id', direction)
+        sql += f" AND {where}"
+        params += [invoice_date, invoice_date, invoice_id]
+    else:
+        order = "i.invoice_date DESC, i.invoice_id DESC"
+    sql += f" ORDER BY {order} LIMIT %s"
+    params.append(limit + 1)
     
-    invoice_list = cursor.fetchall()
+    conn = get_db()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(sql, tuple(params))
+    rows = mask_cards(cursor.fetchall())
     conn.close()
     
+    return build_page(rows, limit, direction, 'invoice_date', 'invoice_id')
+
+@app.route('/invoices')
+def invoices():
+    """View invoices (keyset paginated)"""
+    role = g.principal['role']
+    limit = page_size(request.args.get('limit'))
+    
+    try:
+        invoice_list, next_cursor, prev_cursor = fetch_invoice_page(
+            role, g.principal['userid'],
+            after=request.args.get('after'), before=request.args.get('before'), limit=limit
+        )
+    except InvalidCursor:
+        flash('Invalid page link - showing the newest invoices.', 'warning')
+        return redirect(url_for('invoices', limit=limit))
+    
+    log_access('VIEW_INVOICES')
+    return render_template('invoices.html', invoices=invoice_list, role=role,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor, limit=limit)
+
+@app.route('/api/invoices')
+def api_invoices():
+    """Invoices as JSON with next/prev cursors"""
+    limit = page_size(request.args.get('limit'))
+    
+    try:
+        invoice_list, next_cursor, prev_cursor = fetch_invoice_page(
+            g.principal['role'], g.principal['userid'],
+            after=request.args.get('after'), before=request.args.get('before'), limit=limit
+        )
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    
     log_access('VIEW_INVOICES')
-    return render_template('invoices.html', invoices=invoice_list, role=role)
+    return jsonify({
+        'invoices': invoice_list,
+        'limit': limit,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor
+    })
 
 @app.route('/create-invoice', methods=['GET', 'POST'])
-@login_required
-@role_required('merchant', 'admin')
 def create_invoice():
     """Create invoice using stored card"""
     conn = get_db()
@@ -530,7 +601,7 @@ def create_invoice():
             cursor.execute("""
                 INSERT INTO Invoices (merchant_id, customer_id, card_id, amount)
                 VALUES (%s, %s, %s, %s)
-            """, (session['userid'], customer_id, card_id, amount))
+            """, (g.principal['userid'], customer_id, card_id, amount))
             
             conn.commit()
             invoice_id = cursor.lastrowid
@@ -558,25 +629,26 @@ def create_invoice():
     customer_id = request.args.get('customer_id')
     cards = []
     if customer_id:
-        cursor.execute("""
-            SELECT id, CONCAT('****', RIGHT(AES_DECRYPT(card_number, %s), 4), ' - ', card_type) as card_info
+        cursor.execute(f"""
+            SELECT id, {card_mask_columns()}, card_type
             FROM CardDetails 
             WHERE userid = %s AND is_active = TRUE
-        """, (AES_KEY, customer_id))
-        cards = cursor.fetchall()
+        """, (customer_id,))
+        cards = [
+            {'id': card['id'], 'card_info': f"{card['masked_card']} - {card['card_type']}"}
+            for card in mask_cards(cursor.fetchall())
+        ]
     
     conn.close()
     return render_template('create_invoice.html', customers=customers, cards=cards)
 
 # ==================== REPORTS & AUDIT ====================
 @app.route('/reports')
-@login_required
-@role_required('admin', 'merchant', 'auditor')
 def reports():
     """View database reports using views"""
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
-    role = session['role']
+    role = g.principal['role']
     reports = {}
     
     try:
@@ -597,7 +669,7 @@ def reports():
                     COALESCE(SUM(amount), 0) as total_revenue,
                     COALESCE(AVG(amount), 0) as avg_invoice
                 FROM Invoices WHERE merchant_id = %s
-            """, (session['userid'],))
+            """, (g.principal['userid'],))
             reports['performance'] = cursor.fetchone()
     except Exception as e:
         flash(f'Error loading reports: {str(e)}', 'danger')
@@ -606,29 +678,116 @@ def reports():
     log_access('VIEW_REPORTS')
     return render_template('reports.html', reports=reports, role=role)
 
-@app.route('/audit-logs')
-@login_required
-@role_required('admin', 'auditor')
-def audit_logs():
-    """View security audit logs"""
+AUDIT_FILTERS = ('userid', 'action', 'ip', 'since', 'until')
+
+def parse_audit_filters(args):
+    """Read audit browser filters from query args; raises ValueError on bad input"""
+    filters = {key: args.get(key, '').strip() for key in AUDIT_FILTERS}
+    for key in ('since', 'until'):
+        if filters[key]:
+            datetime.fromisoformat(filters[key])
+    return {key: value for key, value in filters.items() if value}
+
+def fetch_audit_page(filters, after=None, before=None, limit=PAGE_SIZE):
+    """
+    One keyset page of AccessLogs, newest first
+    
+    Every filter has a matching (column, timestamp) index so each page is a
+    bounded range scan: idx_accesslogs_user_ts, idx_accesslogs_action_ts,
+    idx_accesslogs_ip_ts and idx_accesslogs_timestamp for the time range.
+    An action ending in '*' (e.g. KERBEROS_*) is matched as a prefix.
+    Returns (rows, next_cursor, prev_cursor); raises InvalidCursor.
+    """
+    sql = """
+        SELECT al.log_id, al.userid, u.role, u.full_name, al.action,
+               al.table_name, al.record_id, al.ip_address, al.timestamp, al.event_count
+        FROM AccessLogs al
+        LEFT JOIN Users u ON al.userid = u.userid
+        WHERE 1 = 1
+    """
+    params = []
+    
+    if 'userid' in filters:
+        sql += " AND al.userid = %s"
+        params.append(filters['userid'])
+    if 'action' in filters:
+        action = filters['action']
+        if action.endswith('*'):
+            prefix = action.rstrip('*').replace('!', '!!').replace('%', '!%').replace('_', '!_')
+            sql += " AND al.action LIKE %s ESCAPE '!'"
+            params.append(prefix + '%')
+        else:
+            sql += " AND al.action = %s"
+            params.append(action)
+    if 'ip' in filters:
+        sql += " AND al.ip_address = %s"
+        params.append(filters['ip'])
+    if 'since' in filters:
+        sql += " AND al.timestamp >= %s"
+        params.append(datetime.fromisoformat(filters['since']))
+    if 'until' in filters:
+        sql += " AND al.timestamp < %s"
+        params.append(datetime.fromisoformat(filters['until']))
+    
+    direction = 'before' if before else 'after' if after else None
+    if direction:
+        timestamp, log_id = decode_cursor(before or after)
+        where, order = keyset_clause('al.timestamp', 'al.log_id', direction)
+        sql += f" AND {where}"
+        params += [timestamp, timestamp, log_id]
+    else:
+        order = "al.timestamp DESC, al.log_id DESC"
+    sql += f" ORDER BY {order} LIMIT %s"
+    params.append(limit + 1)
+    
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
+    cursor.execute(sql, tuple(params))
+    rows = cursor.fetchall()
+    conn.close()
+    
+    return build_page(rows, limit, direction, 'timestamp', 'log_id')
+
+@app.route('/audit-logs')
+def audit_logs():
+    """Browse security audit logs (filterable, keyset paginated)"""
+    limit = page_size(request.args.get('limit'))
     
     try:
-        cursor.execute("SELECT * FROM SecurityAuditTrail ORDER BY timestamp DESC LIMIT 100")
-        logs = cursor.fetchall()
-    except:
-        cursor.execute("""
-            SELECT al.*, u.role
-            FROM AccessLogs al
-            LEFT JOIN Users u ON al.userid = u.userid
-            ORDER BY al.timestamp DESC LIMIT 100
-        """)
-        logs = cursor.fetchall()
+        filters = parse_audit_filters(request.args)
+        logs, next_cursor, prev_cursor = fetch_audit_page(
+            filters, after=request.args.get('after'), before=request.args.get('before'), limit=limit
+        )
+    except ValueError as e:
+        # InvalidCursor is a ValueError too
+        flash(f'Invalid filter or page link: {e}', 'warning')
+        return redirect(url_for('audit_logs'))
+    
+    log_access('VIEW_AUDIT_LOGS')
+    return render_template('audit_logs.html', logs=logs, filters=filters, limit=limit,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+@app.route('/api/audit-logs')
+def api_audit_logs():
+    """Audit log page as JSON: ?userid= &action=KERBEROS_* &ip= &since= &until= &after=/&before="""
+    limit = page_size(request.args.get('limit'))
+    
+    try:
+        filters = parse_audit_filters(request.args)
+        logs, next_cursor, prev_cursor = fetch_audit_page(
+            filters, after=request.args.get('after'), before=request.args.get('before'), limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    conn.close()
     log_access('VIEW_AUDIT_LOGS')
-    return render_template('audit_logs.html', logs=logs)
+    return jsonify({
+        'logs': logs,
+        'filters': filters,
+        'limit': limit,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor
+    })
 
 # ==================== PROFILE ====================
 from flask import current_app # Import this at the top of your app.py if not already done
@@ -636,21 +795,20 @@ from flask import current_app # Import this at the top of your app.py if not alr
 # ...
 
 @app.route('/profile')
-@login_required
 def profile():
     """User profile"""
     conn = get_db()
     cursor = conn.cursor(dictionary=True)
     
-    cursor.execute("SELECT * FROM Users WHERE userid = %s", (session['userid'],))
+    cursor.execute("SELECT * FROM Users WHERE userid = %s", (g.principal['userid'],))
     user = cursor.fetchone()
     
     stats = {}
-    if session['role'] == 'customer':
+    if g.principal['role'] == 'customer':
         cursor.execute("""
             SELECT COUNT(*) as total_cards
             FROM CardDetails WHERE userid = %s AND is_active = TRUE
-        """, (session['userid'],))
+        """, (g.principal['userid'],))
         stats = cursor.fetchone()
     
     conn.close()
@@ -674,7 +832,6 @@ def profile():
     # --- END OF FIX ---
 
 @app.route('/change-password', methods=['GET', 'POST'])
-@login_required
 def change_password():
     """Change password"""
     if request.method == 'POST':
@@ -702,7 +859,7 @@ def change_password():
             cursor.execute("""
                 SELECT 1 FROM Users 
                 WHERE userid = %s AND password_hash = SHA2(%s, 256)
-            """, (session['userid'], current))
+            """, (g.principal['userid'], current))
             
             if not cursor.fetchone():
                 flash('Current password incorrect.', 'danger')
@@ -714,7 +871,7 @@ def change_password():
                 UPDATE Users 
                 SET password_hash = SHA2(%s, 256) 
                 WHERE userid = %s
-            """, (new, session['userid']))
+            """, (new, g.principal['userid']))
             
             conn.commit()
             conn.close()
@@ -736,26 +893,32 @@ def test():
 
 @app.route('/health')
 def health():
-    """Health check"""
+    """Health check (database state from the background probe; see /readyz)"""
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute("SELECT VERSION()")
-        version = cursor.fetchone()[0]
-        conn.close()
+        database = health_checks.database_status()
+        if database is None:
+            # No probe result yet (worker just started): not ready, not failed
+            return jsonify({'status': 'starting', 'error': 'database probe pending'}), 503
+        if not database['ok']:
+            return jsonify({'status': 'unhealthy', 'error': database['error']}), 503
         
         return jsonify({
             'status': 'healthy',
             'database': 'connected',
-            'version': version,
+            'version': database['version'],
+            'database_probe': database,
+            'pool': db_pool.pool_stats(),
+            'service_tickets': service_ticket_stats(),
+            'revocation': ticket_revocation.revocation_stats(),
+            'account_status_cache': auth_middleware.auth_stats(),
+            'login_throttle': rate_limit.throttle_stats(),
             'timestamp': datetime.now().isoformat()
         })
     except Exception as e:
-        return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
+        return jsonify({'status': 'unhealthy', 'error': str(e)}), 503
 
 # ==================== KERBEROS STATUS ====================
 @app.route('/kerberos-status')
-@login_required
 def kerberos_status():
     """Display Kerberos ticket information"""
     ticket_info = get_ticket_info()
@@ -767,7 +930,6 @@ def kerberos_status():
         return render_template('kerberos_status.html', has_ticket=False)
 
 @app.route('/renew-ticket', methods=['POST'])
-@login_required
 def renew_ticket():
     """Manually renew Kerberos ticket"""
     ticket = session.get('kerberos_ticket')
@@ -781,7 +943,7 @@ def renew_ticket():
     
     if new_ticket:
         session['kerberos_ticket'] = new_ticket
-        KerberosLogger.log_event('TICKET_RENEWED', session['userid'], message, db_config)
+        KerberosLogger.log_event('TICKET_RENEWED', g.principal['userid'], message, db_config)
         flash('Kerberos ticket renewed successfully!', 'success')
     else:
         flash(f'Ticket renewal failed: {message}', 'danger')
@@ -0,0 +1,285 @@
+"""
+Asynchronous Audit Writer for Credit Card Vault
+Buffers AccessLogs events in-process and writes them in multi-row batches
+
+Request threads only append to a bounded in-memory buffer. A background
+flusher drains it when AUDIT_BATCH_SIZE events are waiting or every
+AUDIT_FLUSH_INTERVAL seconds, whichever comes first. Remaining events are
+flushed when the worker exits (atexit and the gunicorn worker_exit hook).
+
+Overflow policy (AUDIT_OVERFLOW_POLICY) when the buffer is full:
+- drop_oldest: discard the oldest buffered event to make room (default)
+- drop_newest: discard the incoming event
+- block:       wait up to AUDIT_BLOCK_TIMEOUT seconds for space, then drop it
+
+An event may stand for several occurrences (event_count, e.g. one
+LOGIN_THROTTLED summary per throttled bucket); record() events count 1.
+The flusher thread also runs the callbacks registered with add_tick()
+on every wake-up (at least every AUDIT_FLUSH_INTERVAL seconds), so
+periodic producers enqueue on time even when no request comes in.
+
+Each batch also bumps the hourly AccessLogRollup counts, in a second
+transaction after the AccessLogs insert commits. A failed rollup write
+never requeues (and so never duplicates) the audit rows; it is counted in
+rollup_errors and the hours can be rebuilt with access_rollup.py --backfill.
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import request, has_request_context
+
+import metrics
+from db_pool import get_pool
+from access_rollup import record_batch
+
+# Queue configuration
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+AUDIT_OVERFLOW_POLICY = os.getenv("AUDIT_OVERFLOW_POLICY", "drop_oldest")
+AUDIT_BLOCK_TIMEOUT = float(os.getenv("AUDIT_BLOCK_TIMEOUT", "0.05"))
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+INSERT_PREFIX = (
+    "INSERT INTO AccessLogs "
+    "(userid, action, table_name, record_id, ip_address, user_agent, timestamp, event_count) VALUES "
+)
+ROW_PLACEHOLDERS = "(%s, %s, %s, %s, %s, %s, %s, %s)"
+
+
+class AuditQueue:
+    """Bounded audit buffer with a background batch flusher"""
+
+    def __init__(self, db_config, maxsize=AUDIT_QUEUE_SIZE, batch_size=AUDIT_BATCH_SIZE,
+                 flush_interval=AUDIT_FLUSH_INTERVAL, overflow_policy=AUDIT_OVERFLOW_POLICY):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown audit overflow policy: {overflow_policy}")
+
+        self.db_config = db_config
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+
+        self._buffer = deque()
+        self._ticks = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+
+        self._enqueued = 0
+        self._flushed = 0
+        self._dropped = 0
+        self._write_errors = 0
+        self._rollup_errors = 0
+        self._batches = 0
+
+    # ---------- producer side ----------
+    def enqueue(self, event):
+        """Buffer one event tuple; returns False if it was dropped"""
+        self._ensure_started()
+
+        with self._cond:
+            if len(self._buffer) >= self.maxsize:
+                if self.overflow_policy == 'drop_oldest':
+                    self._buffer.popleft()
+                    self._dropped += 1
+                elif self.overflow_policy == 'block':
+                    deadline = time.monotonic() + AUDIT_BLOCK_TIMEOUT
+                    while len(self._buffer) >= self.maxsize:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._dropped += 1
+                            return False
+                        self._cond.notify_all()
+                        self._cond.wait(remaining)
+                else:
+                    self._dropped += 1
+                    return False
+
+            self._buffer.append(event)
+            self._enqueued += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    # ---------- consumer side ----------
+    def add_tick(self, callback):
+        """Call callback() from the flusher thread on every wake-up, before it flushes"""
+        with self._cond:
+            self._ticks.append(callback)
+
+    def start(self):
+        """Make sure this process's flusher thread is running"""
+        self._ensure_started()
+
+    def _run_ticks(self):
+        for callback in list(self._ticks):
+            try:
+                callback()
+            except Exception as e:
+                print(f"Audit tick error: {e}")
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            # Threads do not survive fork; each gunicorn worker starts its own
+            self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='audit-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                stopping = self._stopping
+            self._run_ticks()
+            self.flush()
+            if stopping:
+                return
+
+    def _take_batch(self):
+        with self._cond:
+            count = min(len(self._buffer), self.batch_size)
+            batch = [self._buffer.popleft() for _ in range(count)]
+            if batch:
+                self._cond.notify_all()  # wake producers blocked on a full buffer
+            return batch
+
+    def _requeue(self, batch):
+        """Put a failed batch back at the front, dropping what no longer fits"""
+        with self._cond:
+            room = self.maxsize - len(self._buffer)
+            keep = batch[:max(room, 0)]
+            self._dropped += len(batch) - len(keep)
+            self._buffer.extendleft(reversed(keep))
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        conn = get_pool(self.db_config).acquire()
+        try:
+            cursor = conn.cursor()
+            sql = INSERT_PREFIX + ", ".join([ROW_PLACEHOLDERS] * len(batch))
+            cursor.execute(sql, [value for event in batch for value in event])
+            conn.commit()
+            self._write_rollup(conn, batch)
+        finally:
+            conn.close()
+        metrics.observe('cardvault_audit_write_seconds', time.perf_counter() - started)
+        metrics.inc('cardvault_audit_events_written_total', len(batch))
+
+    def _write_rollup(self, conn, batch):
+        """Hourly rollup for auditor statistics; the audit rows are already committed"""
+        try:
+            record_batch(conn.cursor(), batch)
+            conn.commit()
+        except Exception as e:
+            print(f"Audit rollup error: {e}")
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            with self._cond:
+                self._rollup_errors += 1
+            metrics.inc('cardvault_audit_rollup_errors_total')
+
+    def flush(self):
+        """Drain the buffer synchronously; returns the number of events written"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    print(f"Audit flush error: {e}")
+                    with self._cond:
+                        self._write_errors += 1
+                    self._requeue(batch)
+                    break
+                written += len(batch)
+                with self._cond:
+                    self._flushed += len(batch)
+                    self._batches += 1
+        return written
+
+    def shutdown(self, timeout=5.0):
+        """Stop the flusher and write everything still buffered"""
+        thread = self._thread
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        """Queue counters snapshot"""
+        with self._cond:
+            return {
+                'depth': len(self._buffer),
+                'capacity': self.maxsize,
+                'overflow_policy': self.overflow_policy,
+                'enqueued': self._enqueued,
+                'flushed': self._flushed,
+                'dropped': self._dropped,
+                'batches': self._batches,
+                'write_errors': self._write_errors,
+                'rollup_errors': self._rollup_errors
+            }
+
+
+# ==================== PER-PROCESS SINGLETON ====================
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_audit_queue(db_config):
+    """Return the process-wide audit queue (created on first use)"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = AuditQueue(db_config)
+                atexit.register(_queue.shutdown)
+    return _queue
+
+
+def record(db_config, userid, action, table_name=None, record_id=None):
+    """Capture an AccessLogs event from the current request and queue it"""
+    ip_address = user_agent = None
+    if has_request_context():
+        ip_address = request.remote_addr
+        user_agent = request.headers.get('User-Agent')
+
+    started = time.perf_counter()
+    event = (userid, action, table_name, record_id, ip_address, user_agent, datetime.now(), 1)
+    queued = get_audit_queue(db_config).enqueue(event)
+    metrics.observe('cardvault_audit_enqueue_seconds', time.perf_counter() - started)
+    return queued
+
+
+def audit_stats():
+    """Counters for the process's audit queue (None before first use)"""
+    return _queue.stats() if _queue is not None else None
+
+
+def shutdown():
+    """Flush on worker exit"""
+    if _queue is not None:
+        _queue.shutdown()
@@ -0,0 +1,195 @@
+"""
+Request Authentication Pipeline for Credit Card Vault
+One before_request pass per request: session -> TGT -> account status -> role
+
+Routes carry no auth decorators. AUTH_POLICY in app.py maps each endpoint
+to a Policy, and the pipeline resolves the caller once into g.principal:
+    {'userid', 'role', 'full_name', 'ticket'}  (ticket = parsed TGT fields)
+Endpoints missing from the table require a login (fail closed).
+
+Account status (Users.is_active and role) comes from a per-process TTL
+cache. A deactivated or re-roled account keeps its old access for up to
+AUTH_STATUS_TTL seconds (default 30) on each worker; on the next check
+its tickets are revoked and its session cleared. Code that changes
+Users.is_active or Users.role must call invalidate_account(userid), which
+makes the change immediate on that worker. Changes made outside the app
+(SQL console, admin scripts) only take effect once the TTL runs out.
+Use g.principal['role'], never session['role'], which is only what the
+role was at login.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+from flask import current_app, g, session, request, flash, redirect, url_for, jsonify
+
+from db_pool import get_connection
+from kerberos_auth import KerberosTicket, parse_ticket, revoke_session_tickets
+
+AUTH_STATUS_TTL = float(os.getenv("AUTH_STATUS_TTL", "30"))
+AUTH_STATUS_CACHE_SIZE = 10000
+RENEW_BEFORE = 300  # renew the TGT when less than 5 minutes remain
+
+Policy = namedtuple('Policy', 'public roles api')
+PUBLIC = Policy(True, None, False)
+
+
+def require(*roles, api=False):
+    """Policy for a logged-in caller, optionally limited to roles (api: JSON errors)"""
+    return Policy(False, roles or None, api)
+
+
+DEFAULT_POLICY = require()
+
+
+class AccountStatusCache:
+    """userid -> Users row (role, full_name, is_active) with TTL expiry"""
+
+    def __init__(self, db_config, ttl=AUTH_STATUS_TTL, maxsize=AUTH_STATUS_CACHE_SIZE):
+        self.db_config = db_config
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, userid):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(userid)
+            if entry is not None and now - entry[1] < self.ttl:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        conn = get_connection(self.db_config)
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT userid, role, full_name, is_active FROM Users WHERE userid = %s", (userid,))
+        account = cursor.fetchone()
+        conn.close()
+
+        with self._lock:
+            self._entries[userid] = (account, now)
+            self._entries.move_to_end(userid)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return account
+
+    def invalidate(self, userid=None):
+        with self._lock:
+            if userid is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(userid, None)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+_policies = {}
+_status_cache = None
+
+
+def _deny(policy, status, message, category, endpoint):
+    if policy.api:
+        return jsonify({'error': message}), status
+    flash(message, category)
+    return redirect(url_for(endpoint))
+
+
+def _newer_ticket(ticket):
+    """
+    The session's ticket as currently stored, if a parallel request has
+    since replaced ours with a newer one (renewal); None otherwise
+    """
+    stored = getattr(current_app.session_interface, 'stored', None)
+    current = (stored(session) or {}).get('kerberos_ticket') if stored else None
+    if not current or current == ticket:
+        return None
+    old, new = KerberosTicket.decode(ticket), KerberosTicket.decode(current)
+    if not new or (old and new['issued_at'] < old['issued_at']):
+        return None
+    return current
+
+
+def authenticate_request():
+    """before_request: resolve g.principal once, or short-circuit with a redirect"""
+    g.principal = None
+    if request.endpoint is None:
+        return None  # 404 / 405: nothing to protect
+    policy = _policies.get(request.endpoint, DEFAULT_POLICY)
+    if policy.public:
+        return None
+
+    userid = session.get('userid')
+    if not userid:
+        return _deny(policy, 401, 'Please login to continue.', 'warning', 'login')
+
+    ticket = session.get('kerberos_ticket')
+    valid, message = KerberosTicket.validate_ticket(ticket, request.remote_addr)
+    if not valid:
+        # Lost a race with a renewal: carry on with the session's newer ticket
+        newer = _newer_ticket(ticket)
+        if newer and KerberosTicket.validate_ticket(newer, request.remote_addr)[0]:
+            ticket, valid = newer, True
+            session['kerberos_ticket'] = newer
+    if not valid:
+        session.clear()
+        return _deny(policy, 401, f'Ticket validation failed: {message}', 'danger', 'login')
+    fields = parse_ticket(ticket)
+
+    account = _status_cache.get(userid)
+    if (not account or not account['is_active'] or fields['userid'] != userid
+            or account['role'] != fields['role']):
+        revoke_session_tickets('account_changed')
+        session.clear()
+        return _deny(policy, 401, 'Account disabled or changed. Please login again.', 'danger', 'login')
+
+    if policy.roles and account['role'] not in policy.roles:
+        return _deny(policy, 403, 'Access denied. Insufficient privileges.', 'danger', 'dashboard')
+
+    if fields['expires_at'] - int(time.time()) < RENEW_BEFORE:
+        # The old ticket is not revoked: parallel requests may still carry it
+        new_ticket, _ = KerberosTicket.renew_ticket(ticket, request.remote_addr, revoke_old=False)
+        if new_ticket:
+            session['kerberos_ticket'] = new_ticket
+            session['ticket_renewed'] = datetime.now().isoformat()
+            fields = parse_ticket(new_ticket)
+
+    g.principal = {
+        'userid': userid,
+        'role': account['role'],
+        'full_name': account['full_name'],
+        'ticket': fields
+    }
+    return None
+
+
+def invalidate_account(userid=None):
+    """
+    Drop cached account status after Users writes (register, deactivation,
+    role change); userid=None drops every entry. Only this worker's cache is
+    cleared: the others catch up within AUTH_STATUS_TTL.
+    """
+    if _status_cache is not None:
+        _status_cache.invalidate(userid)
+
+
+def auth_stats():
+    """Account status cache counters (None before init_app)"""
+    return _status_cache.stats() if _status_cache is not None else None
+
+
+def init_app(app, db_config, policies):
+    """Install the pipeline with the endpoint -> Policy table"""
+    global _status_cache
+    _policies.clear()
+    _policies.update(policies)
+    _policies.setdefault('static', PUBLIC)
+    _status_cache = AccountStatusCache(db_config)
+    app.before_request(authenticate_request)
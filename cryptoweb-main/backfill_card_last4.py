@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Backfill CardDetails.card_last4 for Credit Card Vault
+Fills the stored last-four column for cards added before it existed
+
+Works through CardDetails in primary-key chunks, one short transaction per
+chunk, so it can run against a live database. It is resumable: every run
+starts from the lowest id that still has card_last4 IS NULL, so an
+interrupted backfill simply picks up where it stopped.
+
+Card numbers are decrypted in this process (vault_crypto handles both
+envelope and legacy AES_ENCRYPT rows), so no key is sent to MySQL. A card
+that does not decrypt is reported by id and left NULL; the rest of the
+chunk is still filled.
+
+Usage:
+    python backfill_card_last4.py [--chunk-size 1000] [--pause 0.1]
+"""
+
+import argparse
+import time
+
+import mysql.connector
+from mysql.connector import Error
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config import db_config
+from migrations import apply_migrations
+import vault_crypto
+
+
+def backfill(chunk_size=1000, pause=0.0):
+    """Fill card_last4 in id-ordered chunks; returns rows updated"""
+    try:
+        conn = mysql.connector.connect(**db_config)
+        # Migration 1 adds the card_last4 column on older databases
+        apply_migrations(conn, target=1)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT MIN(id), MAX(id), COUNT(*) FROM CardDetails WHERE card_last4 IS NULL")
+        first_id, max_id, pending = cursor.fetchone()
+        if not pending:
+            print("✓ Nothing to backfill - every card has card_last4")
+            conn.close()
+            return 0
+
+        print(f"Backfilling {pending} cards (ids {first_id}..{max_id}, chunk {chunk_size})...")
+        last_id = first_id - 1
+        updated = 0
+        skipped = []
+        started = time.time()
+
+        while last_id < max_id:
+            # Upper bound of the next chunk of ids
+            cursor.execute("""
+                SELECT MAX(id) FROM (
+                    SELECT id FROM CardDetails WHERE id > %s ORDER BY id LIMIT %s
+                ) chunk
+            """, (last_id, chunk_size))
+            chunk_end = cursor.fetchone()[0]
+            if chunk_end is None:
+                break
+
+            cursor.execute("""
+                SELECT id, card_number FROM CardDetails
+                WHERE id > %s AND id <= %s AND card_last4 IS NULL
+            """, (last_id, chunk_end))
+            values = []
+            for card_id, card_number in cursor.fetchall():
+                try:
+                    values.append((vault_crypto.decrypt(card_number, 'card_number')[-4:], card_id))
+                except vault_crypto.VaultCryptoError as e:
+                    print(f"   ⚠ card {card_id} skipped: {e}")
+                    skipped.append(card_id)
+            if values:
+                cursor.executemany(
+                    "UPDATE CardDetails SET card_last4 = %s WHERE id = %s AND card_last4 IS NULL",
+                    values
+                )
+                conn.commit()
+
+            updated += len(values)
+            last_id = chunk_end
+            rate = updated / max(time.time() - started, 1e-6)
+            print(f"   ✓ ids <= {chunk_end}: {updated}/{pending} rows ({rate:.0f} rows/s)")
+
+            if pause:
+                time.sleep(pause)
+
+        conn.close()
+        print(f"\n✓ Backfill complete: {updated} cards updated")
+        if skipped:
+            print(f"⚠ {len(skipped)} cards could not be decrypted and still have no card_last4: "
+                  f"{', '.join(map(str, skipped))}")
+        return updated
+
+    except Error as e:
+        print(f"✗ Error: {e}")
+        print("  Re-run the script to resume from the first card without card_last4.")
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill CardDetails.card_last4')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='rows per transaction')
+    parser.add_argument('--pause', type=float, default=0.0, help='seconds to sleep between chunks')
+    args = parser.parse_args()
+    backfill(args.chunk_size, args.pause)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Auth Overhead Microbenchmark
+ns/op and allocations for the kerberos_auth primitives and the per-request auth chain
+
+Every request pays for authentication, so each piece is timed on its own
+inside a Flask test request context, with the fake driver from fake_db.py
+standing in for MySQL:
+
+- KerberosTicket.generate_ticket / validate_ticket (warm and cold parse) /
+  renew_ticket, get_ticket_info
+- the request pipeline that replaced login_required + role_required
+  (auth_middleware.authenticate_request, account status cache warm)
+- kerberos_required and kerberos_role_required, both on their own (full
+  ticket check) and behind the pipeline (g.principal fast path)
+
+Allocations come from tracemalloc: peak_bytes is the transient high-water
+mark of one call, retained_bytes the memory still held per call after many
+calls (caches, leaks).
+
+--save writes the results as a baseline; --baseline compares with one and
+exits 1 when any case is slower than --threshold (fraction) or retains
+noticeably more memory per call.
+
+Usage:
+    python benchmarks/bench_auth.py [--iterations 20000] [--json]
+    python benchmarks/bench_auth.py --save auth_baseline.json
+    python benchmarks/bench_auth.py --baseline auth_baseline.json [--threshold 0.25]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the benchmark's sessions and revocations out of the real shared files
+_scratch = tempfile.mkdtemp(prefix='bench_auth_')
+os.environ.setdefault('SESSION_SQLITE_PATH', os.path.join(_scratch, 'sessions.db'))
+os.environ.setdefault('REVOCATION_PATH', os.path.join(_scratch, 'revoked.bloom'))
+
+from fake_db import FakeDatabase, install  # noqa: E402
+
+USERID = 'bench_user'
+ROLE = 'merchant'
+CLIENT_IP = '203.0.113.42'
+RETAINED_SLACK = 64  # bytes per call tolerated before a retained-memory regression
+
+
+# ==================== HARNESS ====================
+def ns_per_op(fn, iterations):
+    timer = timeit.Timer(fn)
+    return round(min(timer.repeat(repeat=7, number=iterations)) / iterations * 1e9, 1)
+
+
+def allocations(fn, calls=1000):
+    """(peak bytes of one call, bytes retained per call over `calls` calls)"""
+    fn()
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        before, _ = tracemalloc.get_traced_memory()
+        for _ in range(calls):
+            fn()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return max(0, peak - base), round(max(0, after - before) / calls, 1)
+
+
+def measure(name, fn, iterations):
+    fn()  # warm caches and lazy imports
+    peak, retained = allocations(fn)
+    return {'case': name, 'ns_per_op': ns_per_op(fn, iterations),
+            'peak_bytes': peak, 'retained_bytes': retained}
+
+
+# ==================== CASES ====================
+def run_cases(iterations):
+    fake = install(FakeDatabase())
+    fake.add_user(USERID, 'bench-password-123', role=ROLE, full_name='Bench User')
+    fake.on(lambda sql: 'SELECT userid, role, full_name, is_active FROM Users WHERE userid' in sql,
+            lambda sql, params: (('userid', 'role', 'full_name', 'is_active'),
+                                 [(params[0], ROLE, 'Bench User', True)]))
+
+    import app as app_module
+    from flask import g, session
+    import auth_middleware
+    from kerberos_auth import (KerberosTicket, parse_ticket, get_ticket_info,
+                               kerberos_required, kerberos_role_required)
+
+    app = app_module.app
+    app.config['TESTING'] = True
+    token = KerberosTicket.generate_ticket(USERID, ROLE, CLIENT_IP)
+
+    def view():
+        return 'ok'
+
+    kerberos_view = kerberos_required(view)
+    kerberos_role_view = kerberos_role_required('admin', 'merchant')(view)
+
+    def cold_validate():
+        parse_ticket.cache_clear()
+        return KerberosTicket.validate_ticket(token, CLIENT_IP)
+
+    def renew():
+        # Renewal revokes the old ticket, so renew a fresh one each time
+        return KerberosTicket.renew_ticket(KerberosTicket.generate_ticket(USERID, ROLE, CLIENT_IP), CLIENT_IP)
+
+    def context_only():
+        with app.test_request_context('/dashboard', environ_base={'REMOTE_ADDR': CLIENT_IP}):
+            pass
+
+    results = [
+        measure('request context (reference)', context_only, iterations // 10),
+        measure('generate_ticket', lambda: KerberosTicket.generate_ticket(USERID, ROLE, CLIENT_IP),
+                iterations // 4),
+        measure('validate_ticket (warm)', lambda: KerberosTicket.validate_ticket(token, CLIENT_IP), iterations),
+        measure('validate_ticket (cold)', cold_validate, iterations // 4),
+        measure('renew_ticket', renew, iterations // 20),
+    ]
+
+    with app.test_request_context('/dashboard', environ_base={'REMOTE_ADDR': CLIENT_IP}):
+        session['userid'] = USERID
+        session['kerberos_ticket'] = token
+        g.principal = None
+
+        results += [
+            measure('get_ticket_info', get_ticket_info, iterations),
+            measure('kerberos_required', kerberos_view, iterations),
+            measure('kerberos_role_required', kerberos_role_view, iterations),
+            measure('pipeline (login + role)', auth_middleware.authenticate_request, iterations),
+        ]
+
+        def pipeline_then(decorated):
+            def chain():
+                auth_middleware.authenticate_request()
+                return decorated()
+            return chain
+
+        assert auth_middleware.authenticate_request() is None and g.principal, 'pipeline rejected the bench user'
+        results += [
+            measure('pipeline + kerberos_required', pipeline_then(kerberos_view), iterations),
+            measure('pipeline + kerberos_role_required', pipeline_then(kerberos_role_view), iterations),
+        ]
+    return results
+
+
+# ==================== BASELINES ====================
+def compare(results, baseline, threshold):
+    previous = {row['case']: row for row in baseline}
+    regressions = []
+    for row in results:
+        before = previous.get(row['case'])
+        if not before:
+            continue
+        if row['ns_per_op'] > before['ns_per_op'] * (1 + threshold):
+            regressions.append(f"{row['case']}: {before['ns_per_op']} -> {row['ns_per_op']} ns/op")
+        if row['retained_bytes'] > before['retained_bytes'] + RETAINED_SLACK:
+            regressions.append(f"{row['case']}: retains {before['retained_bytes']} -> "
+                               f"{row['retained_bytes']} bytes/op")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Auth overhead microbenchmark')
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    parser.add_argument('--save', help='write results to this baseline file')
+    parser.add_argument('--baseline', help='compare with this baseline file')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown (fraction)')
+    args = parser.parse_args()
+
+    results = run_cases(args.iterations)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.json:
+        print(json.dumps({'results': results, 'regressions': regressions}, indent=2))
+    else:
+        print("=" * 78)
+        print(f"AUTH OVERHEAD BENCHMARK ({args.iterations} iterations)")
+        print("=" * 78)
+        print(f"{'case':<38}{'ns/op':>12}{'peak B':>12}{'retained B':>14}")
+        for r in results:
+            print(f"{r['case']:<38}{r['ns_per_op']:>12}{r['peak_bytes']:>12}{r['retained_bytes']:>14}")
+        print("=" * 78)
+        print("Decorator cases run inside one pushed request context; add the reference")
+        print("row for the per-request context cost itself.")
+        for regression in regressions:
+            print(f"✗ regression: {regression}")
+        if args.baseline and not regressions:
+            print(f"✓ No regressions against {args.baseline} (threshold {args.threshold:.0%})")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
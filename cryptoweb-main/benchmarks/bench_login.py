@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Login Latency Benchmark
+Compares the legacy login sequence with the consolidated KerberosAuth.login pipeline
+
+The database is the fake driver from fake_db.py with a simulated connect
+cost and per-statement round trip, so the numbers show what the pipeline
+itself costs: connections opened and statements issued on the request
+thread, and p50/p99 latency per login.
+
+Usage:
+    python benchmarks/bench_login.py [--iterations 2000] [--connect-ms 3] [--rtt-ms 0.3] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_db import FakeDatabase, install  # noqa: E402
+
+USERID = 'bench_user'
+PASSWORD = 'bench-password-123'
+
+
+def legacy_login(app_module, userid, password):
+    """The login POST path as it was before the consolidated pipeline"""
+    import mysql.connector
+    from flask import session, request
+    from kerberos_auth import KerberosTicket
+
+    db_config = app_module.db_config
+
+    # login(): credential check + last_login update on its own connection
+    conn = mysql.connector.connect(**db_config)
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT userid, role, full_name, is_active
+        FROM Users
+        WHERE userid = %s AND password_hash = SHA2(%s, 256)
+    """, (userid, password))
+    user = cursor.fetchone()
+    cursor.execute("UPDATE Users SET last_login = NOW() WHERE userid = %s", (userid,))
+    conn.commit()
+    conn.close()
+
+    session['userid'] = user['userid']
+    session['role'] = user['role']
+    session['full_name'] = user['full_name']
+
+    # KerberosAuth.authenticate(): new connection, same credential query again
+    conn = mysql.connector.connect(**db_config)
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT userid, role, full_name, is_active
+        FROM Users
+        WHERE userid = %s AND password_hash = SHA2(%s, 256)
+    """, (userid, password))
+    user = cursor.fetchone()
+    conn.close()
+    session['kerberos_ticket'] = KerberosTicket.generate_ticket(user['userid'], user['role'], request.remote_addr)
+
+    # KerberosLogger.log_event() and log_access(): one connection + INSERT + COMMIT each
+    for action in ('KERBEROS_TGT_ISSUED', 'LOGIN_SUCCESS'):
+        conn = mysql.connector.connect(**db_config)
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO AccessLogs (userid, action, table_name, record_id, ip_address, user_agent)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (userid, action, None, None, request.remote_addr, request.headers.get('User-Agent')))
+        conn.commit()
+        conn.close()
+
+
+def run(label, app_module, fake, iterations, call):
+    app = app_module.app
+    form = {'userid': USERID, 'password': PASSWORD}
+    me = threading.get_ident()
+
+    # Warm up (fills the pool, imports templates, JIT-free but cache-warm)
+    for _ in range(min(50, iterations)):
+        with app.test_request_context('/', method='POST', data=form):
+            call()
+
+    fake.reset()
+    samples = []
+    for _ in range(iterations):
+        with app.test_request_context('/', method='POST', data=form):
+            start = time.perf_counter()
+            call()
+            samples.append((time.perf_counter() - start) * 1000)
+
+    connections, statements = fake.counts(thread=me)
+    samples.sort()
+    return {
+        'pipeline': label,
+        'iterations': iterations,
+        'p50_ms': round(statistics.median(samples), 3),
+        'p99_ms': round(samples[int(len(samples) * 0.99) - 1], 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'connections_per_login': round(connections / iterations, 2),
+        'queries_per_login': round(statements / iterations, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login latency benchmark')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--connect-ms', type=float, default=3.0, help='simulated connect + auth handshake')
+    parser.add_argument('--rtt-ms', type=float, default=0.3, help='simulated round trip per statement')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args()
+
+    fake = install(FakeDatabase(connect_latency=args.connect_ms / 1000, query_latency=args.rtt_ms / 1000))
+    fake.add_user(USERID, PASSWORD, role='customer', full_name='Bench User')
+
+    import app as app_module
+    app_module.app.config['TESTING'] = True
+    login_view = app_module.app.view_functions['login']
+
+    results = [
+        run('legacy', app_module, fake, args.iterations,
+            lambda: legacy_login(app_module, USERID, PASSWORD)),
+        run('consolidated', app_module, fake, args.iterations, login_view),
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("=" * 78)
+    print("LOGIN BENCHMARK "
+          f"(connect {args.connect_ms}ms, rtt {args.rtt_ms}ms, {args.iterations} logins)")
+    print("=" * 78)
+    print(f"{'pipeline':<14}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'conns/login':>14}{'queries/login':>16}")
+    for r in results:
+        print(f"{r['pipeline']:<14}{r['p50_ms']:>10}{r['p99_ms']:>10}{r['mean_ms']:>10}"
+              f"{r['connections_per_login']:>14}{r['queries_per_login']:>16}")
+    print("=" * 78)
+    print("Audit INSERTs of the consolidated pipeline run on the background flusher")
+    print("and are not counted as request-path queries.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Ticket Validation Microbenchmark
+Compares the legacy signed-dict TGT with the packed, HMAC-authenticated token
+
+Measures, per ticket format:
+- size as stored in the session (TaggedJSON, the session serializer)
+- generation cost
+- validation cost on a cold parse (first request carrying the ticket)
+  and on the parse-once fast path (every later request)
+
+Usage:
+    python benchmarks/bench_ticket.py [--iterations 200000] [--json]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import secrets
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask.json.tag import TaggedJSONSerializer  # noqa: E402
+
+import kerberos_auth  # noqa: E402
+from kerberos_auth import KerberosTicket, parse_ticket, REALM, SERVICE_KEY, TICKET_LIFETIME  # noqa: E402
+
+CLIENT_IP = '203.0.113.42'
+
+
+# ==================== LEGACY FORMAT ====================
+def legacy_generate(userid, role, client_ip):
+    """The 10-key dict TGT as generated before the packed format"""
+    timestamp = int(time.time())
+    expiry = timestamp + TICKET_LIFETIME
+    session_key = secrets.token_hex(32)
+    ticket_data = f"{userid}@{REALM}|{role}|{timestamp}|{expiry}|{client_ip}|{session_key}"
+    signature = hashlib.sha256(f"{ticket_data}{SERVICE_KEY}".encode()).hexdigest()
+    return {
+        'principal': f"{userid}@{REALM}",
+        'userid': userid,
+        'role': role,
+        'session_key': session_key,
+        'issued_at': timestamp,
+        'expires_at': expiry,
+        'client_address': client_ip,
+        'signature': signature,
+        'realm': REALM,
+        'service': 'vault-service'
+    }
+
+
+def legacy_validate(ticket, client_ip):
+    """The legacy per-request check: rebuild the string, SHA-256, compare hex with !="""
+    if not ticket:
+        return False, "No ticket provided"
+    if int(time.time()) > ticket.get('expires_at', 0):
+        return False, "Ticket expired (TGT lifetime exceeded)"
+    if ticket.get('client_address') != client_ip:
+        return False, "Client address mismatch (possible ticket theft)"
+    ticket_data = (f"{ticket['userid']}@{REALM}|{ticket['role']}|{ticket['issued_at']}|"
+                   f"{ticket['expires_at']}|{ticket['client_address']}|{ticket['session_key']}")
+    expected = hashlib.sha256(f"{ticket_data}{SERVICE_KEY}".encode()).hexdigest()
+    if ticket.get('signature') != expected:
+        return False, "Invalid ticket signature (tampering detected)"
+    if ticket.get('realm') != REALM:
+        return False, "Invalid realm"
+    return True, "Ticket valid"
+
+
+# ==================== HARNESS ====================
+def ns_per_op(stmt, iterations, setup=None):
+    timer = timeit.Timer(stmt, setup=setup or (lambda: None))
+    return round(min(timer.repeat(repeat=5, number=iterations)) / iterations * 1e9, 1)
+
+
+def cold_validate(token):
+    parse_ticket.cache_clear()
+    return KerberosTicket.validate_ticket(token, CLIENT_IP)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ticket format microbenchmark')
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args()
+
+    serializer = TaggedJSONSerializer()
+    legacy = legacy_generate('merchant_jane', 'merchant', CLIENT_IP)
+    token = KerberosTicket.generate_ticket('merchant_jane', 'merchant', CLIENT_IP)
+    assert legacy_validate(legacy, CLIENT_IP)[0] and KerberosTicket.validate_ticket(token, CLIENT_IP)[0]
+
+    n = args.iterations
+    results = [
+        {
+            'format': 'legacy dict',
+            'session_bytes': len(serializer.dumps({'kerberos_ticket': legacy})),
+            'generate_ns': ns_per_op(lambda: legacy_generate('merchant_jane', 'merchant', CLIENT_IP), n // 4),
+            'validate_cold_ns': ns_per_op(lambda: legacy_validate(legacy, CLIENT_IP), n),
+            'validate_warm_ns': ns_per_op(lambda: legacy_validate(legacy, CLIENT_IP), n),
+        },
+        {
+            'format': f'packed v{kerberos_auth.TICKET_VERSION}',
+            'session_bytes': len(serializer.dumps({'kerberos_ticket': token})),
+            'generate_ns': ns_per_op(
+                lambda: KerberosTicket.generate_ticket('merchant_jane', 'merchant', CLIENT_IP), n // 4),
+            'validate_cold_ns': ns_per_op(lambda: cold_validate(token), n // 4),
+            'validate_warm_ns': ns_per_op(lambda: KerberosTicket.validate_ticket(token, CLIENT_IP), n),
+        },
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("=" * 74)
+    print(f"TICKET FORMAT BENCHMARK ({n} validations)")
+    print("=" * 74)
+    print(f"{'format':<14}{'session B':>11}{'generate ns':>14}{'cold ns':>12}{'warm ns':>12}")
+    for r in results:
+        print(f"{r['format']:<14}{r['session_bytes']:>11}{r['generate_ns']:>14}"
+              f"{r['validate_cold_ns']:>12}{r['validate_warm_ns']:>12}")
+    print("=" * 74)
+    print("cold = first validation of a token (decode + HMAC); warm = parse-once cache hit.")
+    print("The legacy format has no cache: every request pays the full rebuild + hash.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Fake MySQL Driver for Benchmarks
+Stands in for mysql.connector.connect() so the app can be timed without a server
+
+Every connect() and statement can be given a simulated latency, and all
+statements are recorded with the thread that issued them so a benchmark can
+tell request-path queries apart from background (audit flusher) work.
+"""
+
+import hashlib
+import re
+import threading
+import time
+
+SQL_VERB = re.compile(r"^\s*(\w+)")
+
+
+def sha256_hex(value):
+    """Same digest as MySQL SHA2(value, 256)"""
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+class FakeDatabase:
+    """In-memory responder plus call counters"""
+
+    def __init__(self, users=None, connect_latency=0.0, query_latency=0.0):
+        # userid -> {'password_hash', 'role', 'full_name', 'is_active'}
+        self.users = users or {}
+        self.connect_latency = connect_latency
+        self.query_latency = query_latency
+        self.handlers = []   # [(predicate(sql), handler(sql, params) -> (columns, rows))]
+
+        self._lock = threading.Lock()
+        self.connections = []   # thread idents that opened a connection
+        self.statements = []    # (thread ident, verb)
+
+    # ---------- setup ----------
+    def add_user(self, userid, password, role='customer', full_name=None, is_active=True):
+        self.users[userid] = {
+            'password_hash': sha256_hex(password),
+            'role': role,
+            'full_name': full_name or userid,
+            'is_active': is_active
+        }
+
+    def on(self, predicate, handler):
+        """Register an extra responder; first match wins"""
+        self.handlers.append((predicate, handler))
+
+    # ---------- driver entry point ----------
+    def connect(self, **kwargs):
+        if self.connect_latency:
+            time.sleep(self.connect_latency)
+        with self._lock:
+            self.connections.append(threading.get_ident())
+        return FakeConnection(self)
+
+    # ---------- counters ----------
+    def reset(self):
+        with self._lock:
+            self.connections = []
+            self.statements = []
+
+    def counts(self, thread=None):
+        """(connections, statements) opened/issued, optionally by one thread"""
+        with self._lock:
+            if thread is None:
+                return len(self.connections), len(self.statements)
+            return (
+                sum(1 for t in self.connections if t == thread),
+                sum(1 for t, _ in self.statements if t == thread)
+            )
+
+    # ---------- responder ----------
+    def _record(self, sql):
+        if self.query_latency:
+            time.sleep(self.query_latency)
+        match = SQL_VERB.match(sql)
+        with self._lock:
+            self.statements.append((threading.get_ident(), match.group(1).upper() if match else ''))
+
+    def respond(self, sql, params):
+        self._record(sql)
+        for predicate, handler in self.handlers:
+            if predicate(sql):
+                return handler(sql, params or ())
+
+        if 'FROM Users' in sql and 'password_hash = SHA2' in sql:
+            user = self.users.get(params[0])
+            if user and user['password_hash'] == sha256_hex(params[1]):
+                columns = ('userid', 'role', 'full_name', 'is_active')
+                return columns, [(params[0], user['role'], user['full_name'], user['is_active'])]
+            return ('userid', 'role', 'full_name', 'is_active'), []
+
+        return (), []
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self._db = db
+        self.in_transaction = False
+        self.open = True
+
+    def cursor(self, dictionary=False, buffered=None):
+        return FakeCursor(self, dictionary)
+
+    def commit(self):
+        self._db._record('COMMIT')
+        self.in_transaction = False
+
+    def rollback(self):
+        self._db._record('ROLLBACK')
+        self.in_transaction = False
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        self._db._record('PING')
+
+    def is_connected(self):
+        return self.open
+
+    def close(self):
+        self.open = False
+
+
+class FakeCursor:
+    def __init__(self, conn, dictionary):
+        self._conn = conn
+        self._dictionary = dictionary
+        self._rows = []
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def execute(self, sql, params=None):
+        columns, rows = self._conn._db.respond(sql, params)
+        if self._dictionary:
+            rows = [dict(zip(columns, row)) for row in rows]
+        self._rows = list(rows)
+        self.rowcount = len(rows) if columns else 1
+        verb = SQL_VERB.match(sql)
+        if verb and verb.group(1).upper() in ('INSERT', 'UPDATE', 'DELETE', 'REPLACE'):
+            self._conn.in_transaction = True
+            self.lastrowid = 1
+
+    def executemany(self, sql, seq_params):
+        for params in seq_params:
+            self.execute(sql, params)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+def install(fake):
+    """Route mysql.connector.connect() to the fake database"""
+    import mysql.connector
+    mysql.connector.connect = fake.connect
+    return fake
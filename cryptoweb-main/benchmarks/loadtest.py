@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+End-to-End HTTP Load Test
+Logs in as every role and drives weighted route scenarios concurrently
+
+Each virtual user is a thread with its own keep-alive connection and
+session cookie. It logs in once as its role, then picks routes from the
+role's weighted scenario until the run ends:
+
+    admin     /dashboard /vault /invoices /create-invoice /reports /audit-logs /card-details/<id>
+    merchant  /dashboard /invoices /create-invoice /reports /card-details/<id>
+    customer  /dashboard /vault /invoices
+    auditor   /dashboard /reports /audit-logs
+
+Card ids for /card-details come from the vault page and /api/invoices seen
+after login. --writes adds invoice creation (POST /create-invoice) to the
+merchant and admin scenarios.
+
+The target is an already running server (--url) or a gunicorn started
+here (--spawn), optionally after seeding the database with
+generate_load_data.py (--generate N customers). Any redirect back to the
+login page, 4xx/5xx or connection error counts as an error.
+
+Login throttling (rate_limit.py): every virtual user logs in from this
+host, and all users of a role share one account, so the default budgets
+(LOGIN_RATE_IP=20/60 per worker, or per host with RATE_LIMIT_BACKEND=sqlite)
+would turn logins past the first 20 into 429s. With --spawn, gunicorn gets
+LOGIN_RATE_IP/LOGIN_RATE_USER raised to SPAWN_LOGIN_RATE unless they are
+already set in the environment. Against a --url server the limits are
+whatever it runs with: a 429 at login is retried after its Retry-After
+(plus jitter, so throttled users do not return together) for up to
+--login-timeout seconds, and the number of throttled attempts is reported
+as login_throttled. Only logins that still fail count as login errors.
+
+Output is JSON with per-route throughput, p50/p95/p99 latency and error
+rate. --baseline compares against an earlier JSON result and exits 1
+when a route regresses by more than --threshold.
+
+Usage:
+    python benchmarks/loadtest.py --spawn --users 32 --duration 60 --output run.json
+    python benchmarks/loadtest.py --url https://127.0.0.1:5000 --baseline run.json
+    python benchmarks/loadtest.py --spawn --generate 100000 --account customer=lt_c0000001:loadtest123
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import re
+import signal
+import ssl
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Demo accounts created by populate_demo_data.py
+DEFAULT_ACCOUNTS = {
+    'admin': ('admin', 'admin123'),
+    'merchant': ('amazon_store', 'merchant123'),
+    'customer': ('jsmith', 'pass123'),
+    'auditor': ('auditor1', 'auditor123'),
+}
+
+# role -> [(route label, weight)]; labels are what the report is keyed by
+SCENARIOS = {
+    'admin': [('/dashboard', 3), ('/vault', 2), ('/invoices', 3), ('/create-invoice', 1),
+              ('/reports', 1), ('/audit-logs', 1), ('/card-details/<id>', 1)],
+    'merchant': [('/dashboard', 3), ('/invoices', 4), ('/create-invoice', 1), ('/reports', 1),
+                 ('/card-details/<id>', 2)],
+    'customer': [('/dashboard', 4), ('/vault', 4), ('/invoices', 2)],
+    'auditor': [('/dashboard', 2), ('/reports', 2), ('/audit-logs', 3)],
+}
+WRITE_ROUTES = {'admin': ('POST /create-invoice', 1), 'merchant': ('POST /create-invoice', 2)}
+
+# Login budget for a spawned server: far above any --users x --duration run
+SPAWN_LOGIN_RATE = "100000/60"
+
+CARD_LINK = re.compile(r'/card-details/(\d+)')
+OPTION = re.compile(r'<option value="([^"]+)"')
+
+
+def select_options(html, name):
+    """Option values of <select name=...> (skipping the empty placeholder)"""
+    start = html.find(f'name="{name}"')
+    if start < 0:
+        return []
+    return OPTION.findall(html[start:html.find('</select>', start)])
+
+
+class LoginFailed(Exception):
+    pass
+
+
+# ==================== VIRTUAL USER ====================
+class VirtualUser:
+    """One logged-in client: a keep-alive connection plus its session cookie"""
+
+    def __init__(self, base_url, role, userid, password, timeout=30, login_timeout=120):
+        parts = urlsplit(base_url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.https else 80)
+        self.role = role
+        self.userid = userid
+        self.password = password
+        self.timeout = timeout
+        self.login_timeout = login_timeout
+        self.login_throttled = 0
+        self.retry_after = None
+        self.cookies = {}
+        self.card_ids = []
+        self.customers = []
+        self.conn = None
+
+    def _connect(self):
+        if self.https:
+            # Local self-signed certificate (generate_ssl_cert.py)
+            context = ssl._create_unverified_context()
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, form=None):
+        """Returns (status, location, body); reconnects once on a dropped keep-alive"""
+        headers = {'Connection': 'keep-alive'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = self._connect()
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+        for header, value in response.getheaders():
+            if header.lower() == 'set-cookie':
+                name, _, rest = value.partition('=')
+                self.cookies[name.strip()] = rest.split(';', 1)[0]
+        self.retry_after = response.getheader('Retry-After')
+        return response.status, response.getheader('Location', ''), data
+
+    def login(self):
+        deadline = time.time() + self.login_timeout
+        while True:
+            status, location, _ = self.request('POST', '/', {'userid': self.userid, 'password': self.password})
+            if status != 429:
+                break
+            # Throttled by rate_limit.py: wait as told, spread out so throttled users don't retry together
+            self.login_throttled += 1
+            try:
+                wait = float(self.retry_after or 1)
+            except ValueError:
+                wait = 1.0
+            wait += random.uniform(0, min(wait, 5))
+            if time.time() + wait > deadline:
+                raise LoginFailed(f"{self.role} login as {self.userid} still throttled (HTTP 429) "
+                                  f"after {self.login_timeout:.0f}s")
+            time.sleep(wait)
+        if status != 302 or not location.rstrip('/').endswith('/dashboard'):
+            raise LoginFailed(f"{self.role} login as {self.userid} failed (HTTP {status})")
+
+        # Card ids this user may open, customers a merchant may bill
+        if self.role in ('admin', 'merchant', 'customer'):
+            _, _, body = self.request('GET', '/vault')
+            self.card_ids = sorted({int(i) for i in CARD_LINK.findall(body.decode(errors='replace'))})
+        if self.role in ('admin', 'merchant'):
+            status, _, body = self.request('GET', '/api/invoices')
+            if status == 200:
+                invoices = json.loads(body).get('invoices', [])
+                self.card_ids = sorted(set(self.card_ids) | {
+                    inv['card_id'] for inv in invoices if inv.get('card_id')})
+            _, _, body = self.request('GET', '/create-invoice')
+            self.customers = select_options(body.decode(errors='replace'), 'customer_id')
+
+    def run_route(self, label, rng):
+        """Issue one scenario step; returns (ok, status)"""
+        if label == '/card-details/<id>':
+            if not self.card_ids:
+                return None, 0
+            status, _, _ = self.request('GET', f"/card-details/{rng.choice(self.card_ids)}")
+            return status == 200, status
+
+        if label == 'POST /create-invoice':
+            if not self.customers:
+                return None, 0
+            customer = rng.choice(self.customers)
+            _, _, body = self.request('GET', f"/create-invoice?customer_id={customer}")
+            cards = select_options(body.decode(errors='replace'), 'card_id')
+            if not cards:
+                return None, 0
+            status, location, _ = self.request('POST', '/create-invoice', {
+                'customer_id': customer, 'card_id': rng.choice(cards),
+                'amount': f"{rng.lognormvariate(3.7, 0.9):.2f}", 'description': 'load test'})
+            return status == 302 and '/invoices' in location, status
+
+        status, _, _ = self.request('GET', label)
+        return status == 200, status
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+# ==================== RUNNER ====================
+class Recorder:
+    """route -> latencies (seconds) and error counts, shared by all threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.status_codes = defaultdict(lambda: defaultdict(int))
+
+    def add(self, route, elapsed, ok, status):
+        with self._lock:
+            self.latencies[route].append(elapsed)
+            self.status_codes[route][status] += 1
+            if not ok:
+                self.errors[route] += 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    # Nearest-rank
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def virtual_user_loop(user, routes, weights, deadline, recorder, think, seed, login_errors):
+    rng = random.Random(seed)
+    try:
+        user.login()
+    except (LoginFailed, OSError, http.client.HTTPException) as e:
+        login_errors.append(str(e))
+        return
+    while time.time() < deadline:
+        label = rng.choices(routes, weights)[0]
+        started = time.perf_counter()
+        try:
+            ok, status = user.run_route(label, rng)
+        except (OSError, http.client.HTTPException):
+            ok, status = False, 0
+            user.close()
+            user.conn = None
+        if ok is not None:
+            recorder.add(label, time.perf_counter() - started, ok, status)
+        if think:
+            time.sleep(rng.expovariate(1 / think))
+    user.close()
+
+
+def run_load(base_url, accounts, users, duration, think=0.0, writes=False, seed=1, login_timeout=120):
+    roles = list(accounts)
+    recorder = Recorder()
+    login_errors = []
+    deadline = time.time() + duration
+    threads = []
+    virtual_users = []
+    for index in range(users):
+        role = roles[index % len(roles)]
+        userid, password = accounts[role]
+        scenario = SCENARIOS[role] + ([WRITE_ROUTES[role]] if writes and role in WRITE_ROUTES else [])
+        routes, weights = zip(*scenario)
+        user = VirtualUser(base_url, role, userid, password, login_timeout=login_timeout)
+        virtual_users.append(user)
+        thread = threading.Thread(target=virtual_user_loop, daemon=True, args=(
+            user, routes, weights, deadline, recorder, think, seed * 1000 + index, login_errors))
+        threads.append(thread)
+
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=max(0.0, deadline - time.time()) + 60)
+    elapsed = time.time() - started
+
+    report = {
+        'url': base_url,
+        'users': users,
+        'duration_s': round(elapsed, 2),
+        'writes': writes,
+        'login_errors': login_errors,
+        'login_throttled': sum(user.login_throttled for user in virtual_users),
+        'routes': {},
+    }
+    total_requests = total_errors = 0
+    for route in sorted(recorder.latencies):
+        latencies = sorted(recorder.latencies[route])
+        errors = recorder.errors[route]
+        total_requests += len(latencies)
+        total_errors += errors
+        report['routes'][route] = {
+            'requests': len(latencies),
+            'throughput_rps': round(len(latencies) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2),
+            'errors': errors,
+            'error_rate': round(errors / len(latencies), 4),
+            'status_codes': {str(k): v for k, v in sorted(recorder.status_codes[route].items())},
+        }
+    report['total'] = {
+        'requests': total_requests,
+        'throughput_rps': round(total_requests / elapsed, 2),
+        'errors': total_errors,
+        'error_rate': round(total_errors / total_requests, 4) if total_requests else None,
+    }
+    return report
+
+
+# ==================== SERVER / DATA ====================
+def generate_data(customers, workers):
+    """Seed the database through generate_load_data.py at the chosen size"""
+    command = [sys.executable, os.path.join(ROOT, 'generate_load_data.py'),
+               '--users', str(customers), '--merchants', str(max(10, customers // 500)),
+               '--cards', str(customers * 3 // 2), '--invoices', str(customers * 5),
+               '--access-logs', str(customers * 20), '--prefix', f"lt{int(time.time())}_"]
+    if workers:
+        command += ['--workers', str(workers)]
+    subprocess.run(command, cwd=ROOT, check=True)
+
+
+def spawn_gunicorn(bind, workers, threads):
+    """Start gunicorn on app:app and wait until /livez answers"""
+    env = dict(os.environ)
+    # Virtual users share one address and one account per role; see the module docstring
+    env.setdefault('LOGIN_RATE_IP', SPAWN_LOGIN_RATE)
+    env.setdefault('LOGIN_RATE_USER', SPAWN_LOGIN_RATE)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-k', 'gthread',
+         '--threads', str(threads), '-b', bind, 'app:app'],
+        cwd=ROOT, env=env, start_new_session=True
+    )
+    host, port = bind.rsplit(':', 1)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection(host, int(port), timeout=2)
+            conn.request('GET', '/livez')
+            conn.getresponse().read()
+            conn.close()
+            return process
+        except OSError:
+            time.sleep(0.25)
+    stop_gunicorn(process)
+    raise RuntimeError("gunicorn did not start within 30s")
+
+
+def stop_gunicorn(process):
+    if process.poll() is None:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+
+
+# ==================== REPORTING ====================
+def compare(report, baseline, threshold):
+    """Routes whose p95 or throughput regressed by more than threshold (fraction)"""
+    regressions = []
+    for route, current in report['routes'].items():
+        before = baseline.get('routes', {}).get(route)
+        if not before:
+            continue
+        if before['p95_ms'] and current['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{route}: p95 {before['p95_ms']} -> {current['p95_ms']} ms")
+        if before['throughput_rps'] and current['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+            regressions.append(f"{route}: throughput {before['throughput_rps']} -> {current['throughput_rps']} req/s")
+        if current['error_rate'] > before['error_rate'] + 0.01:
+            regressions.append(f"{route}: error rate {before['error_rate']} -> {current['error_rate']}")
+    return regressions
+
+
+def print_table(report):
+    print("=" * 96)
+    print(f"LOAD TEST {report['url']}  users={report['users']}  duration={report['duration_s']}s")
+    print("=" * 96)
+    print(f"{'route':<24}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'max ms':>10}{'errors':>12}")
+    for route, r in report['routes'].items():
+        print(f"{route:<24}{r['requests']:>10}{r['throughput_rps']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['max_ms']:>10}{r['error_rate']:>11.2%}")
+    total = report['total']
+    print("=" * 96)
+    print(f"{'total':<24}{total['requests']:>10}{total['throughput_rps']:>10}"
+          f"{'':>50}{(total['error_rate'] or 0):>11.2%}")
+    if report.get('login_throttled'):
+        print(f"⚠ {report['login_throttled']} login attempt(s) throttled (429) and retried after Retry-After")
+    for error in report['login_errors']:
+        print(f"✗ {error}")
+
+
+def parse_account(spec):
+    role, _, credentials = spec.partition('=')
+    userid, _, password = credentials.partition(':')
+    if role not in SCENARIOS or not userid or not password:
+        raise argparse.ArgumentTypeError(f"expected role=userid:password with role in {list(SCENARIOS)}")
+    return role, (userid, password)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end HTTP load test')
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='server to test')
+    parser.add_argument('--spawn', action='store_true', help='start gunicorn app:app on --url host:port')
+    parser.add_argument('--gunicorn-workers', type=int, default=4)
+    parser.add_argument('--gunicorn-threads', type=int, default=4)
+    parser.add_argument('--generate', type=int, metavar='CUSTOMERS',
+                        help='seed the database with generate_load_data.py first')
+    parser.add_argument('--generate-workers', type=int)
+    parser.add_argument('--users', type=int, default=16, help='concurrent virtual users (spread over roles)')
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--think-ms', type=float, default=0, help='mean think time between requests')
+    parser.add_argument('--writes', action='store_true', help='include POST /create-invoice')
+    parser.add_argument('--roles', default=','.join(SCENARIOS), help='comma-separated roles to simulate')
+    parser.add_argument('--account', type=parse_account, action='append', default=[],
+                        help='override credentials: role=userid:password (repeatable)')
+    parser.add_argument('--login-timeout', type=float, default=120,
+                        help='seconds a virtual user keeps retrying a throttled (429) login')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15, help='allowed regression (fraction)')
+    args = parser.parse_args()
+
+    accounts = dict(DEFAULT_ACCOUNTS, **dict(args.account))
+    accounts = {role: accounts[role] for role in args.roles.split(',')}
+
+    if args.generate:
+        generate_data(args.generate, args.generate_workers)
+
+    server = None
+    if args.spawn:
+        parts = urlsplit(args.url)
+        server = spawn_gunicorn(f"{parts.hostname}:{parts.port or 80}",
+                                args.gunicorn_workers, args.gunicorn_threads)
+    try:
+        report = run_load(args.url, accounts, args.users, args.duration,
+                          think=args.think_ms / 1000, writes=args.writes, seed=args.seed,
+                          login_timeout=args.login_timeout)
+    finally:
+        if server is not None:
+            stop_gunicorn(server)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report['regressions'] = regressions
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+        for regression in regressions:
+            print(f"⚠ regression: {regression}")
+    sys.exit(1 if regressions or report['login_errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
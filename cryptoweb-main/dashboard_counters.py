@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Dashboard Counters for Credit Card Vault
+Incrementally maintained totals so dashboard() reads O(1) rows
+
+DashboardCounters holds the admin totals (users, active cards, invoices,
+paid revenue). MerchantStats holds per-merchant invoice totals, and
+MerchantCustomers tracks (merchant, customer) pairs for the distinct
+customer count. Triggers installed by migration 4 keep all three in step
+with every write to Users, CardDetails and Invoices in the same transaction.
+
+Triggers do not fire for foreign-key cascades (deleting a user cascades to
+CardDetails), so reconcile() recomputes everything from the base tables and
+corrects any drift without holding up writers. Run it periodically:
+
+Usage:
+    python dashboard_counters.py                 # reconcile once
+    python dashboard_counters.py --interval 900  # reconcile every 15 minutes
+    python dashboard_counters.py --check         # report drift only
+"""
+
+import argparse
+import time
+
+import mysql.connector
+from mysql.connector import Error
+
+from config import db_config
+
+# counter_name -> authoritative aggregate
+COUNTER_QUERIES = {
+    'users_total': "SELECT COUNT(*) FROM Users",
+    'cards_active': "SELECT COUNT(*) FROM CardDetails WHERE is_active = TRUE",
+    'invoices_total': "SELECT COUNT(*) FROM Invoices",
+    'revenue_paid': "SELECT COALESCE(SUM(amount), 0) FROM Invoices WHERE status = 'paid'",
+}
+
+# dashboard.html stat key -> counter_name
+ADMIN_STATS = {
+    'total_users': 'users_total',
+    'total_cards': 'cards_active',
+    'total_invoices': 'invoices_total',
+    'total_revenue': 'revenue_paid',
+}
+
+# ==================== SCHEMA (migration 4) ====================
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS DashboardCounters (
+        counter_name VARCHAR(50) PRIMARY KEY,
+        value DECIMAL(18,2) NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS MerchantStats (
+        merchant_id VARCHAR(50) PRIMARY KEY,
+        total_invoices BIGINT NOT NULL DEFAULT 0,
+        total_amount DECIMAL(18,2) NOT NULL DEFAULT 0,
+        unique_customers INT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS MerchantCustomers (
+        merchant_id VARCHAR(50) NOT NULL,
+        customer_id VARCHAR(50) NOT NULL,
+        invoice_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (merchant_id, customer_id)
+    )
+    """,
+]
+
+# Shared trigger bodies
+_BUMP = ("INSERT INTO DashboardCounters (counter_name, value) VALUES ('{name}', {delta}) "
+         "ON DUPLICATE KEY UPDATE value = value + VALUES(value);")
+
+_INVOICE_ADDED = """
+    INSERT INTO MerchantStats (merchant_id, total_invoices, total_amount)
+    VALUES (NEW.merchant_id, 1, NEW.amount)
+    ON DUPLICATE KEY UPDATE total_invoices = total_invoices + 1, total_amount = total_amount + NEW.amount;
+    INSERT INTO MerchantCustomers (merchant_id, customer_id, invoice_count)
+    VALUES (NEW.merchant_id, NEW.customer_id, 1)
+    ON DUPLICATE KEY UPDATE invoice_count = invoice_count + 1;
+    IF (SELECT invoice_count FROM MerchantCustomers
+        WHERE merchant_id = NEW.merchant_id AND customer_id = NEW.customer_id) = 1 THEN
+        UPDATE MerchantStats SET unique_customers = unique_customers + 1 WHERE merchant_id = NEW.merchant_id;
+    END IF;
+"""
+
+_INVOICE_REMOVED = """
+    UPDATE MerchantStats
+    SET total_invoices = total_invoices - 1, total_amount = total_amount - OLD.amount
+    WHERE merchant_id = OLD.merchant_id;
+    UPDATE MerchantCustomers SET invoice_count = invoice_count - 1
+    WHERE merchant_id = OLD.merchant_id AND customer_id = OLD.customer_id;
+    IF (SELECT invoice_count FROM MerchantCustomers
+        WHERE merchant_id = OLD.merchant_id AND customer_id = OLD.customer_id) = 0 THEN
+        DELETE FROM MerchantCustomers WHERE merchant_id = OLD.merchant_id AND customer_id = OLD.customer_id;
+        UPDATE MerchantStats SET unique_customers = unique_customers - 1 WHERE merchant_id = OLD.merchant_id;
+    END IF;
+"""
+
+TRIGGERS = {
+    'trg_users_counters_ins': ("AFTER INSERT ON Users",
+        _BUMP.format(name='users_total', delta='1')),
+    'trg_users_counters_del': ("AFTER DELETE ON Users",
+        _BUMP.format(name='users_total', delta='-1')),
+    'trg_cards_counters_ins': ("AFTER INSERT ON CardDetails",
+        _BUMP.format(name='cards_active', delta='IF(NEW.is_active, 1, 0)')),
+    'trg_cards_counters_upd': ("AFTER UPDATE ON CardDetails",
+        _BUMP.format(name='cards_active', delta='IF(NEW.is_active, 1, 0) - IF(OLD.is_active, 1, 0)')),
+    'trg_cards_counters_del': ("AFTER DELETE ON CardDetails",
+        _BUMP.format(name='cards_active', delta='-IF(OLD.is_active, 1, 0)')),
+    'trg_invoices_counters_ins': ("AFTER INSERT ON Invoices",
+        _BUMP.format(name='invoices_total', delta='1')
+        + _BUMP.format(name='revenue_paid', delta="IF(NEW.status = 'paid', NEW.amount, 0)")
+        + _INVOICE_ADDED),
+    'trg_invoices_counters_upd': ("AFTER UPDATE ON Invoices",
+        _BUMP.format(name='revenue_paid',
+                     delta="IF(NEW.status = 'paid', NEW.amount, 0) - IF(OLD.status = 'paid', OLD.amount, 0)")
+        + "IF NEW.merchant_id = OLD.merchant_id AND NEW.customer_id = OLD.customer_id THEN "
+        + "UPDATE MerchantStats SET total_amount = total_amount + NEW.amount - OLD.amount "
+        + "WHERE merchant_id = NEW.merchant_id; ELSE "
+        + _INVOICE_REMOVED + _INVOICE_ADDED + " END IF;"),
+    'trg_invoices_counters_del': ("AFTER DELETE ON Invoices",
+        _BUMP.format(name='invoices_total', delta='-1')
+        + _BUMP.format(name='revenue_paid', delta="-IF(OLD.status = 'paid', OLD.amount, 0)")
+        + _INVOICE_REMOVED),
+}
+
+
+def trigger_statements():
+    """DROP/CREATE pairs for every counter trigger"""
+    statements = []
+    for name, (timing, body) in TRIGGERS.items():
+        statements.append(f"DROP TRIGGER IF EXISTS {name}")
+        statements.append(f"CREATE TRIGGER {name} {timing} FOR EACH ROW BEGIN {body} END")
+    return statements
+
+
+# SQLite dialect of TRIGGERS for storage.SQLiteBackend: upserts name their
+# conflict target, and IF blocks become WHERE conditions or WHEN clauses
+_SQLITE_BUMP = ("INSERT INTO DashboardCounters (counter_name, value) VALUES ('{name}', {delta}) "
+                "ON CONFLICT(counter_name) DO UPDATE SET value = value + excluded.value;")
+
+_SQLITE_INVOICE_ADDED = """
+    INSERT INTO MerchantStats (merchant_id, total_invoices, total_amount)
+    VALUES (NEW.merchant_id, 1, NEW.amount)
+    ON CONFLICT(merchant_id) DO UPDATE SET total_invoices = total_invoices + 1,
+        total_amount = total_amount + excluded.total_amount;
+    INSERT INTO MerchantCustomers (merchant_id, customer_id, invoice_count)
+    VALUES (NEW.merchant_id, NEW.customer_id, 1)
+    ON CONFLICT(merchant_id, customer_id) DO UPDATE SET invoice_count = invoice_count + 1;
+    UPDATE MerchantStats SET unique_customers = unique_customers + 1
+    WHERE merchant_id = NEW.merchant_id AND (SELECT invoice_count FROM MerchantCustomers
+        WHERE merchant_id = NEW.merchant_id AND customer_id = NEW.customer_id) = 1;
+"""
+
+_SQLITE_INVOICE_REMOVED = """
+    UPDATE MerchantStats
+    SET total_invoices = total_invoices - 1, total_amount = total_amount - OLD.amount
+    WHERE merchant_id = OLD.merchant_id;
+    UPDATE MerchantCustomers SET invoice_count = invoice_count - 1
+    WHERE merchant_id = OLD.merchant_id AND customer_id = OLD.customer_id;
+    UPDATE MerchantStats SET unique_customers = unique_customers - 1
+    WHERE merchant_id = OLD.merchant_id AND (SELECT invoice_count FROM MerchantCustomers
+        WHERE merchant_id = OLD.merchant_id AND customer_id = OLD.customer_id) = 0;
+    DELETE FROM MerchantCustomers
+    WHERE merchant_id = OLD.merchant_id AND customer_id = OLD.customer_id AND invoice_count = 0;
+"""
+
+_SAME_PAIR = "NEW.merchant_id = OLD.merchant_id AND NEW.customer_id = OLD.customer_id"
+
+SQLITE_TRIGGERS = {
+    'trg_users_counters_ins': ("AFTER INSERT ON Users",
+        _SQLITE_BUMP.format(name='users_total', delta='1')),
+    'trg_users_counters_del': ("AFTER DELETE ON Users",
+        _SQLITE_BUMP.format(name='users_total', delta='-1')),
+    'trg_cards_counters_ins': ("AFTER INSERT ON CardDetails",
+        _SQLITE_BUMP.format(name='cards_active', delta='IIF(NEW.is_active, 1, 0)')),
+    'trg_cards_counters_upd': ("AFTER UPDATE ON CardDetails",
+        _SQLITE_BUMP.format(name='cards_active', delta='IIF(NEW.is_active, 1, 0) - IIF(OLD.is_active, 1, 0)')),
+    'trg_cards_counters_del': ("AFTER DELETE ON CardDetails",
+        _SQLITE_BUMP.format(name='cards_active', delta='-IIF(OLD.is_active, 1, 0)')),
+    'trg_invoices_counters_ins': ("AFTER INSERT ON Invoices",
+        _SQLITE_BUMP.format(name='invoices_total', delta='1')
+        + _SQLITE_BUMP.format(name='revenue_paid', delta="IIF(NEW.status = 'paid', NEW.amount, 0)")
+        + _SQLITE_INVOICE_ADDED),
+    'trg_invoices_counters_upd': (f"AFTER UPDATE ON Invoices WHEN {_SAME_PAIR}",
+        _SQLITE_BUMP.format(name='revenue_paid',
+                            delta="IIF(NEW.status = 'paid', NEW.amount, 0) - IIF(OLD.status = 'paid', OLD.amount, 0)")
+        + "UPDATE MerchantStats SET total_amount = total_amount + NEW.amount - OLD.amount "
+        + "WHERE merchant_id = NEW.merchant_id;"),
+    'trg_invoices_counters_move': (f"AFTER UPDATE ON Invoices WHEN NOT ({_SAME_PAIR})",
+        _SQLITE_BUMP.format(name='revenue_paid',
+                            delta="IIF(NEW.status = 'paid', NEW.amount, 0) - IIF(OLD.status = 'paid', OLD.amount, 0)")
+        + _SQLITE_INVOICE_REMOVED + _SQLITE_INVOICE_ADDED),
+    'trg_invoices_counters_del': ("AFTER DELETE ON Invoices",
+        _SQLITE_BUMP.format(name='invoices_total', delta='-1')
+        + _SQLITE_BUMP.format(name='revenue_paid', delta="-IIF(OLD.status = 'paid', OLD.amount, 0)")
+        + _SQLITE_INVOICE_REMOVED),
+}
+
+
+def sqlite_trigger_statements():
+    """DROP/CREATE pairs for the SQLite counter triggers"""
+    statements = []
+    for name, (timing, body) in SQLITE_TRIGGERS.items():
+        # SQLite triggers are always row-level; FOR EACH ROW is implied
+        statements.append(f"DROP TRIGGER IF EXISTS {name}")
+        statements.append(f"CREATE TRIGGER {name} {timing} BEGIN {body} END")
+    return statements
+
+
+def seed_statements():
+    """Initialise every counter table from the base tables"""
+    statements = [
+        f"INSERT INTO DashboardCounters (counter_name, value) "
+        f"SELECT '{name}', ({query}) ON DUPLICATE KEY UPDATE value = VALUES(value)"
+        for name, query in COUNTER_QUERIES.items()
+    ]
+    statements += [
+        """
+        INSERT INTO MerchantCustomers (merchant_id, customer_id, invoice_count)
+        SELECT merchant_id, customer_id, COUNT(*) FROM Invoices GROUP BY merchant_id, customer_id
+        ON DUPLICATE KEY UPDATE invoice_count = VALUES(invoice_count)
+        """,
+        """
+        INSERT INTO MerchantStats (merchant_id, total_invoices, total_amount, unique_customers)
+        SELECT merchant_id, COUNT(*), SUM(amount), COUNT(DISTINCT customer_id)
+        FROM Invoices GROUP BY merchant_id
+        ON DUPLICATE KEY UPDATE total_invoices = VALUES(total_invoices),
+            total_amount = VALUES(total_amount), unique_customers = VALUES(unique_customers)
+        """,
+    ]
+    return statements
+
+
+# ==================== READS (dashboard) ====================
+def read_admin_stats(cursor):
+    """Admin dashboard totals from DashboardCounters (one indexed read)"""
+    cursor.execute(
+        "SELECT counter_name, value FROM DashboardCounters WHERE counter_name IN (%s, %s, %s, %s)",
+        tuple(ADMIN_STATS.values())
+    )
+    values = {row['counter_name']: row['value'] for row in cursor.fetchall()}
+
+    stats = {}
+    for key, counter in ADMIN_STATS.items():
+        if counter not in values:
+            # Counters not seeded yet (migration 4 pending) - fall back to the aggregate
+            cursor.execute(COUNTER_QUERIES[counter])
+            row = cursor.fetchone()
+            values[counter] = list(row.values())[0]
+        stats[key] = values[counter] if counter == 'revenue_paid' else int(values[counter])
+    return stats
+
+
+def read_merchant_stats(cursor, merchant_id):
+    """Merchant dashboard totals from MerchantStats (single primary-key read)"""
+    cursor.execute("""
+        SELECT total_invoices, total_amount, unique_customers
+        FROM MerchantStats WHERE merchant_id = %s
+    """, (merchant_id,))
+    row = cursor.fetchone()
+    if not row or not row['total_invoices']:
+        return {'total_invoices': 0, 'total_revenue': 0, 'avg_invoice': 0, 'unique_customers': 0}
+    return {
+        'total_invoices': row['total_invoices'],
+        'total_revenue': row['total_amount'],
+        'avg_invoice': row['total_amount'] / row['total_invoices'],
+        'unique_customers': row['unique_customers']
+    }
+
+
+# ==================== RECONCILIATION ====================
+def reconcile(conn, fix=True):
+    """
+    Recompute every counter from the base tables and correct drift
+
+    Drift is found from one consistent, non-locking snapshot: stored
+    counters and base-table aggregates are read at the same point, and the
+    triggers move both in the same transaction, so their difference is the
+    drift and writers are never blocked by the scan. Counters are corrected
+    by that delta, which stays right whatever was written since. Drifted
+    merchants are re-checked and rebuilt one at a time, each in a short
+    transaction that locks only that merchant's rows.
+    Returns a list of (counter, stored, actual) for each drifted value.
+    """
+    cursor = conn.cursor()
+    conn.commit()
+
+    cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+    cursor.execute("SELECT counter_name, value FROM DashboardCounters")
+    stored = dict(cursor.fetchall())
+    actual = {}
+    for name, query in COUNTER_QUERIES.items():
+        cursor.execute(query)
+        actual[name] = cursor.fetchone()[0]
+    cursor.execute("SELECT merchant_id, total_invoices, total_amount, unique_customers FROM MerchantStats")
+    stored_merchants = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    cursor.execute("""
+        SELECT merchant_id, COUNT(*), COALESCE(SUM(amount), 0), COUNT(DISTINCT customer_id)
+        FROM Invoices GROUP BY merchant_id
+    """)
+    actual_merchants = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    conn.commit()
+
+    drift = [(name, stored.get(name), value) for name, value in actual.items() if stored.get(name) != value]
+    drifted_merchants = sorted(
+        merchant_id for merchant_id in stored_merchants.keys() | actual_merchants.keys()
+        if stored_merchants.get(merchant_id) != actual_merchants.get(merchant_id, (0, 0, 0))
+    )
+    if not fix:
+        return drift + [(f"merchant:{merchant_id}", stored_merchants.get(merchant_id),
+                         actual_merchants.get(merchant_id, (0, 0, 0))) for merchant_id in drifted_merchants]
+
+    for name, before, after in drift:
+        cursor.execute("""
+            INSERT INTO DashboardCounters (counter_name, value) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+        """, (name, after - (before or 0)))
+    conn.commit()
+
+    for merchant_id in drifted_merchants:
+        try:
+            change = _rebuild_merchant(cursor, merchant_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if change:
+            drift.append((f"merchant:{merchant_id}", *change))
+    return drift
+
+
+def _rebuild_merchant(cursor, merchant_id):
+    """
+    Re-check one merchant under its MerchantStats/MerchantCustomers row
+    locks (the triggers' lock order) and rewrite them if they drifted
+
+    Invoices is read without locks after the rows are locked, so an
+    invoice still in flight is left to its own trigger. Returns
+    (stored, actual) if anything was rewritten, else None.
+    """
+    cursor.execute("""
+        SELECT total_invoices, total_amount, unique_customers
+        FROM MerchantStats WHERE merchant_id = %s FOR UPDATE
+    """, (merchant_id,))
+    row = cursor.fetchone()
+    before = tuple(row) if row else None
+    cursor.execute("SELECT customer_id, invoice_count FROM MerchantCustomers WHERE merchant_id = %s FOR UPDATE",
+                   (merchant_id,))
+    stored_pairs = dict(cursor.fetchall())
+
+    cursor.execute("""
+        SELECT customer_id, COUNT(*), COALESCE(SUM(amount), 0)
+        FROM Invoices WHERE merchant_id = %s GROUP BY customer_id
+    """, (merchant_id,))
+    rows = cursor.fetchall()
+    pairs = {customer_id: count for customer_id, count, _ in rows}
+    after = (sum(pairs.values()), sum(amount for _, _, amount in rows), len(pairs))
+    if (before or (0, 0, 0)) == after and stored_pairs == pairs:
+        return None
+
+    gone = stored_pairs.keys() - pairs.keys()
+    if gone:
+        cursor.executemany("DELETE FROM MerchantCustomers WHERE merchant_id = %s AND customer_id = %s",
+                           [(merchant_id, customer_id) for customer_id in gone])
+    changed = [(merchant_id, customer_id, count) for customer_id, count in pairs.items()
+               if stored_pairs.get(customer_id) != count]
+    if changed:
+        cursor.executemany("""
+            INSERT INTO MerchantCustomers (merchant_id, customer_id, invoice_count) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE invoice_count = VALUES(invoice_count)
+        """, changed)
+    cursor.execute("""
+        INSERT INTO MerchantStats (merchant_id, total_invoices, total_amount, unique_customers)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE total_invoices = VALUES(total_invoices),
+            total_amount = VALUES(total_amount), unique_customers = VALUES(unique_customers)
+    """, (merchant_id, *after))
+    return before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconcile dashboard counters')
+    parser.add_argument('--interval', type=float, help='repeat every N seconds')
+    parser.add_argument('--check', action='store_true', help='report drift without fixing it')
+    args = parser.parse_args()
+
+    while True:
+        try:
+            conn = mysql.connector.connect(**db_config)
+            drift = reconcile(conn, fix=not args.check)
+            conn.close()
+            stamp = time.strftime('%Y-%m-%d %H:%M:%S')
+            if drift:
+                print(f"[{stamp}] ⚠ {len(drift)} counter(s) drifted{'' if args.check else ' - fixed'}:")
+                for name, before, after in drift:
+                    print(f"   {name}: stored={before} actual={after}")
+            else:
+                print(f"[{stamp}] ✓ Counters match base tables")
+        except Error as e:
+            print(f"✗ Reconciliation error: {e}")
+
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
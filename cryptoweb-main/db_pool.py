@@ -0,0 +1,291 @@
+"""
+Database Connection Pool for Credit Card Vault
+Per-process MySQL connection pool shared by app.py and kerberos_auth.py
+
+Each gunicorn worker keeps up to DB_POOL_SIZE open connections instead of
+doing a TCP + auth handshake for every query. Inside a Flask request one
+connection is checked out on first use, stored on flask.g and shared by the
+route, log_access() and the Kerberos helpers until the app context tears down.
+"""
+
+import os
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import errors
+from flask import g, has_app_context
+
+import storage
+
+# Pool configuration (per worker process)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))      # seconds to wait for a free connection
+POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))  # ping on borrow if idle longer than this
+
+
+class PoolTimeout(errors.PoolError):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+# Callables fn(statement, params, seconds, rowcount) run after every statement on a
+# pooled connection (metrics, slow query log); add with add_query_listener()
+_query_listeners = []
+
+
+def add_query_listener(fn):
+    """Time every cursor.execute/executemany on pooled connections and report it to fn"""
+    if fn not in _query_listeners:
+        _query_listeners.append(fn)
+
+
+class TimedCursor:
+    """Cursor proxy that reports each statement's wall time to the query listeners"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _timed(self, method, statement, params):
+        started = time.perf_counter()
+        try:
+            return method(statement, params)
+        finally:
+            elapsed = time.perf_counter() - started
+            for listener in _query_listeners:
+                listener(statement, params, elapsed, self._cursor.rowcount)
+
+    def execute(self, statement, params=()):
+        return self._timed(self._cursor.execute, statement, params)
+
+    def executemany(self, statement, seq_params):
+        return self._timed(self._cursor.executemany, statement, seq_params)
+
+
+class PooledConnection:
+    """
+    Thin proxy around a raw mysql.connector connection
+
+    close() hands the connection back to the pool instead of closing the
+    socket. Request-scoped connections ignore close() so that later calls in
+    the same request (logging, Kerberos events) can keep using them; they are
+    returned by release_request_connection() at teardown.
+    """
+
+    def __init__(self, pool, raw, scoped=False):
+        self._pool = pool
+        self._raw = raw
+        self._scoped = scoped
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._raw.cursor(*args, **kwargs)
+        return TimedCursor(cursor) if _query_listeners else cursor
+
+    def close(self):
+        if not self._scoped:
+            self.release()
+
+    def release(self, discard=False):
+        """Return the underlying connection to the pool"""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw, discard=discard)
+
+
+class ConnectionPool:
+    """Thread-safe, bounded pool of MySQL connections"""
+
+    def __init__(self, db_config, size=POOL_SIZE, timeout=POOL_TIMEOUT, ping_after=POOL_PING_AFTER):
+        self.db_config = dict(db_config)
+        # Buffered cursors let the route and the logging helpers interleave
+        # queries on one connection without "Unread result found" errors
+        self.db_config.setdefault('buffered', True)
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = []        # [(raw_connection, last_used_monotonic)]
+        self._total = 0        # open connections (idle + in use)
+        self._in_use = 0
+        self._waiting = 0
+        self._created = 0
+        self._timeouts = 0
+        self._health_failures = 0
+
+    def _connect(self):
+        raw = storage.connect(self.db_config)
+        with self._cond:
+            self._created += 1
+        return raw
+
+    def _healthy(self, raw, idle_for):
+        """Health check on borrow; only pings connections that sat idle"""
+        if idle_for < self.ping_after:
+            return True
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self, timeout=None, scoped=False):
+        """Check out a connection, waiting up to `timeout` seconds for one to free up"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        raw = None
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, last_used = self._idle.pop()
+                    idle_for = time.monotonic() - last_used
+                    break
+                if self._total < self.size:
+                    # Reserve a slot; the connect happens outside the lock
+                    self._total += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(
+                        f"No database connection available within {timeout}s "
+                        f"(pool size {self.size})"
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+
+        try:
+            if raw is None:
+                raw = self._connect()
+            elif not self._healthy(raw, idle_for):
+                with self._cond:
+                    self._health_failures += 1
+                try:
+                    raw.close()
+                except Exception:
+                    pass
+                raw = self._connect()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, raw, scoped=scoped)
+
+    def release(self, raw, discard=False):
+        """Put a connection back, rolling back any transaction left open"""
+        if not discard:
+            try:
+                if raw.in_transaction:
+                    raw.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._total -= 1
+            else:
+                self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+
+        if discard:
+            try:
+                raw.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        """Pool metrics snapshot"""
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._total,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'created': self._created,
+                'timeouts': self._timeouts,
+                'health_check_failures': self._health_failures
+            }
+
+
+# ==================== PER-PROCESS REGISTRY ====================
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = None
+
+
+def _config_key(db_config):
+    return tuple(sorted(db_config.items()))
+
+
+def get_pool(db_config):
+    """Return this process's pool for db_config (recreated after fork)"""
+    global _pools_pid
+    key = _config_key(db_config)
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # Never share sockets inherited from a gunicorn master
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_config)
+        return pool
+
+
+def get_connection(db_config):
+    """
+    Get a connection for db_config
+
+    Inside an app context the connection is scoped to the request (flask.g);
+    outside one (scripts, background threads) the caller owns it and close()
+    returns it to the pool.
+    """
+    pool = get_pool(db_config)
+    if not has_app_context():
+        return pool.acquire()
+
+    conns = g.setdefault('_db_connections', {})
+    key = _config_key(db_config)
+    conn = conns.get(key)
+    if conn is None:
+        conn = conns[key] = pool.acquire(scoped=True)
+    return conn
+
+
+def release_request_connection(exc=None):
+    """Teardown hook: return the request's connections to their pools"""
+    conns = g.pop('_db_connections', None)
+    if not conns:
+        return
+    for conn in conns.values():
+        conn.release(discard=exc is not None)
+
+
+def pool_stats():
+    """Metrics for every pool in this process"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [dict(pool.stats(), database=pool.db_config.get('database')) for pool in pools]
+
+
+def init_app(app):
+    """Register request-scoped connection teardown"""
+    app.teardown_appcontext(release_request_connection)
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Synthetic Load-Test Data for Credit Card Vault
+Generates millions of users, cards, invoices and access logs in parallel
+
+populate_demo_data.py builds a small hand-written demo set. This script
+builds production-sized volumes instead:
+
+- Deterministic: every shard of every table has its own RNG seeded from
+  (--seed, table, shard), so the same arguments produce the same rows no
+  matter how many worker processes run.
+- Realistic skew: invoices pick merchants from a steep Zipf distribution
+  (a few heavy merchants) and customers from a flat one (long tail).
+  Access logs follow the same skew. Cards get Luhn-valid PANs with the
+  right prefix and length for their card_type, and are envelope-encrypted
+  with vault_crypto (one data key per DataKeyBatch).
+- Bulk loading: executemany batches (multi-row INSERTs) by default, or
+  LOAD DATA LOCAL INFILE from streamed temp files with --method infile
+  (requires local_infile=ON on the server).
+
+The dashboard counter triggers are dropped while loading (every worker
+would otherwise queue on the same counter rows), then recreated, and the
+counters and the hourly AccessLogs rollup are rebuilt from the loaded data.
+
+Usage:
+    python generate_load_data.py --users 1000000 --merchants 2000 --cards 1500000 \\
+        --invoices 5000000 --access-logs 20000000 [--workers 8] [--seed 42]
+"""
+
+import argparse
+import hashlib
+import itertools
+import math
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from bisect import bisect
+from datetime import datetime, timedelta
+
+import mysql.connector
+from mysql.connector import Error
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config import db_config
+import access_rollup
+import dashboard_counters
+import vault_crypto
+
+SHARD_ROWS = 20000      # rows per shard (unit of work and of seeding)
+MERCHANT_SKEW = 1.2     # Zipf exponents
+CUSTOMER_SKEW = 0.6
+
+# card_type -> (weight, prefixes, PAN length)
+CARD_TYPES = {
+    'visa': (50, ['4'], 16),
+    'mastercard': (30, ['51', '52', '53', '54', '55', '2221', '2720'], 16),
+    'amex': (12, ['34', '37'], 15),
+    'discover': (8, ['6011', '65'], 16),
+}
+
+INVOICE_STATUSES = (['paid', 'pending', 'failed', 'refunded'], [70, 20, 7, 3])
+
+# action -> (weight, table_name)
+LOG_ACTIONS = {
+    'VIEW_DASHBOARD': (25, 'Dashboard'),
+    'VIEW_VAULT': (20, 'CardDetails'),
+    'LOGIN_SUCCESS': (15, 'Users'),
+    'VIEW_INVOICES': (12, 'Invoices'),
+    'VIEW_CARD_DETAILS': (10, 'CardDetails'),
+    'LOGOUT': (8, 'Users'),
+    'VIEW_PROFILE': (5, 'Users'),
+    'LOGIN_FAILED': (3, 'Users'),
+    'ADD_CARD': (1, 'CardDetails'),
+    'CREATE_INVOICE': (1, 'Invoices'),
+}
+
+FIRST_NAMES = ['JAMES', 'MARY', 'ROBERT', 'PATRICIA', 'JOHN', 'JENNIFER', 'MICHAEL', 'LINDA',
+               'DAVID', 'ELIZABETH', 'WILLIAM', 'BARBARA', 'RICHARD', 'SUSAN', 'JOSEPH', 'JESSICA',
+               'THOMAS', 'SARAH', 'CARLOS', 'KAREN', 'WEI', 'PRIYA', 'AHMED', 'YUKI']
+LAST_NAMES = ['SMITH', 'JOHNSON', 'WILLIAMS', 'BROWN', 'JONES', 'GARCIA', 'MILLER', 'DAVIS',
+              'RODRIGUEZ', 'MARTINEZ', 'HERNANDEZ', 'LOPEZ', 'WILSON', 'ANDERSON', 'TAYLOR',
+              'THOMAS', 'MOORE', 'JACKSON', 'LEE', 'CHEN', 'PATEL', 'KHAN', 'SATO', 'NGUYEN']
+STREETS = ['Main St', 'Oak Ave', 'Maple Dr', 'Cedar Ln', 'Pine St', 'Elm St', 'Park Blvd',
+           'Lake Rd', 'Hill St', 'River Rd']
+CITIES = ['New York, NY', 'Los Angeles, CA', 'Chicago, IL', 'Houston, TX', 'Phoenix, AZ',
+          'Seattle, WA', 'Denver, CO', 'Boston, MA', 'Atlanta, GA', 'Miami, FL']
+PRODUCTS = ['Electronics', 'Groceries', 'Subscription', 'Apparel', 'Books', 'Home goods',
+            'Travel booking', 'Software license', 'Restaurant', 'Fuel']
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_2) AppleWebKit/605.1.15 Version/17.2 Safari/605.1.15',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+    'Mozilla/5.0 (Linux; Android 14) AppleWebKit/537.36 Chrome/120.0 Mobile Safari/537.36',
+]
+
+# table -> (columns, binary columns loaded as hex with --method infile)
+TABLES = {
+    'Users': (['userid', 'password_hash', 'role', 'full_name', 'email', 'phone', 'created_at'], set()),
+    'CardDetails': (['id', 'userid', 'card_number', 'cvv', 'card_holder_name', 'expiry_month',
+                     'expiry_year', 'billing_address', 'card_type', 'is_default', 'card_last4',
+                     'key_version', 'created_at'], {'card_number', 'cvv'}),
+    'Invoices': (['merchant_id', 'customer_id', 'card_id', 'amount', 'description', 'status',
+                  'invoice_date'], set()),
+    'AccessLogs': (['userid', 'action', 'table_name', 'record_id', 'ip_address', 'user_agent',
+                    'timestamp'], set()),
+}
+
+
+# ==================== DISTRIBUTIONS ====================
+class ZipfPicker:
+    """Index in [0, n) with P(rank r) ~ 1 / r^s; heavy ranks are scattered over the id space"""
+
+    def __init__(self, n, s):
+        self.n = n
+        self.cumulative = list(itertools.accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+        self.total = self.cumulative[-1]
+        self.stride = 7919 if n % 7919 else 1
+
+    def pick(self, rng):
+        rank = bisect(self.cumulative, rng.random() * self.total)
+        return (min(rank, self.n - 1) * self.stride) % self.n
+
+
+class WeightedPicker:
+    def __init__(self, choices, weights):
+        self.choices = choices
+        self.cumulative = list(itertools.accumulate(weights))
+
+    def pick(self, rng):
+        return self.choices[bisect(self.cumulative, rng.random() * self.cumulative[-1])]
+
+
+def luhn_check_digit(body):
+    total = 0
+    for position, char in enumerate(reversed(body)):
+        digit = int(char)
+        if position % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return str((10 - total % 10) % 10)
+
+
+def make_pan(rng, card_type):
+    _, prefixes, length = CARD_TYPES[card_type]
+    prefix = rng.choice(prefixes)
+    body = prefix + ''.join(rng.choice('0123456789') for _ in range(length - len(prefix) - 1))
+    return body + luhn_check_digit(body)
+
+
+# ==================== ROW GENERATORS ====================
+class Plan:
+    """Everything a worker needs to generate any shard deterministically"""
+
+    def __init__(self, args, card_base):
+        self.seed = args.seed
+        self.prefix = args.prefix
+        self.customers = args.users
+        self.merchants = args.merchants
+        self.cards = args.cards
+        self.invoices = args.invoices
+        self.access_logs = args.access_logs
+        self.card_base = card_base
+        self.end = args.end
+        self.days = args.days
+        self.password_hash = hashlib.sha256(args.password.encode()).hexdigest()
+        self.method = args.method
+        self.batch_size = args.batch_size
+
+    def customer_id(self, index):
+        return f"{self.prefix}c{index:07d}"
+
+    def merchant_id(self, index):
+        return f"{self.prefix}m{index:05d}"
+
+    def rng(self, table, shard):
+        return random.Random(f"{self.seed}:{table}:{shard}")
+
+    def timestamp(self, rng):
+        # Skewed toward the end of the window (traffic grows over time)
+        age = self.days * 86400 * (rng.random() ** 1.5)
+        return (self.end - timedelta(seconds=age)).replace(microsecond=0)
+
+
+def user_rows(plan, rng, start, count):
+    total = plan.customers + plan.merchants
+    for index in range(start, min(start + count, total)):
+        if index < plan.merchants:
+            userid, role = plan.merchant_id(index), 'merchant'
+            full_name = f"{rng.choice(LAST_NAMES).title()} {rng.choice(PRODUCTS)} Store"
+        else:
+            userid, role = plan.customer_id(index - plan.merchants), 'customer'
+            full_name = f"{rng.choice(FIRST_NAMES).title()} {rng.choice(LAST_NAMES).title()}"
+        yield (userid, plan.password_hash, role, full_name, f"{userid}@loadtest.example",
+               f"555-{rng.randrange(10000000):07d}", plan.timestamp(rng))
+
+
+def card_rows(plan, rng, start, count, customers, card_types):
+    data_keys = vault_crypto.DataKeyBatch()
+    year = plan.end.year
+    for index in range(start, min(start + count, plan.cards)):
+        # The first card of every customer is their default; the rest follow the long tail
+        owner = index if index < plan.customers else customers.pick(rng)
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        card_type = card_types.pick(rng)
+        pan = make_pan(rng, card_type)
+        cvv = f"{rng.randrange(10000):04d}" if card_type == 'amex' else f"{rng.randrange(1000):03d}"
+        key = data_keys.next_key()
+        yield (plan.card_base + index, plan.customer_id(owner),
+               key.encrypt(pan, 'card_number'), key.encrypt(cvv, 'cvv'),
+               f"{first} {last}", f"{rng.randint(1, 12):02d}", str(year + rng.randint(0, 5)),
+               f"{rng.randint(1, 9999)} {rng.choice(STREETS)}, {rng.choice(CITIES)}",
+               card_type, index < plan.customers, pan[-4:], key.master_key_id, plan.timestamp(rng))
+
+
+def invoice_rows(plan, rng, start, count, customers, merchants, statuses):
+    for _ in range(start, min(start + count, plan.invoices)):
+        customer = customers.pick(rng)
+        merchant = merchants.pick(rng)
+        amount = min(round(rng.lognormvariate(3.7, 0.9), 2), 50000.0)
+        yield (plan.merchant_id(merchant), plan.customer_id(customer),
+               plan.card_base + customer if customer < plan.cards else None,
+               max(amount, 1.0), f"{rng.choice(PRODUCTS)} purchase", statuses.pick(rng),
+               plan.timestamp(rng))
+
+
+def access_log_rows(plan, rng, start, count, customers, merchants, actions):
+    for _ in range(start, min(start + count, plan.access_logs)):
+        if rng.random() < 0.85:
+            index = customers.pick(rng)
+            userid = plan.customer_id(index)
+        else:
+            index = merchants.pick(rng)
+            userid = plan.merchant_id(index)
+        action = actions.pick(rng)
+        # Users keep a handful of addresses and one browser
+        ip_address = f"10.{index % 250}.{(index // 250) % 250}.{rng.randint(1, 4)}"
+        yield (userid, action, LOG_ACTIONS[action][1],
+               rng.randrange(1, 1000000) if action != 'LOGIN_FAILED' else None,
+               ip_address, USER_AGENTS[index % len(USER_AGENTS)], plan.timestamp(rng))
+
+
+# ==================== LOADING ====================
+_worker = {}
+
+
+def _init_worker(plan):
+    """Per-process connection and samplers (built once, not per shard)"""
+    kwargs = dict(db_config, allow_local_infile=plan.method == 'infile')
+    _worker['plan'] = plan
+    _worker['conn'] = mysql.connector.connect(**kwargs)
+    _worker['customers'] = ZipfPicker(plan.customers, CUSTOMER_SKEW)
+    _worker['merchants'] = ZipfPicker(plan.merchants, MERCHANT_SKEW)
+    _worker['card_types'] = WeightedPicker(list(CARD_TYPES), [weight for weight, _, _ in CARD_TYPES.values()])
+    _worker['statuses'] = WeightedPicker(*INVOICE_STATUSES)
+    _worker['actions'] = WeightedPicker(list(LOG_ACTIONS), [weight for weight, _ in LOG_ACTIONS.values()])
+
+
+def shard_rows(table, shard):
+    plan, w = _worker['plan'], _worker
+    rng = plan.rng(table, shard)
+    start = shard * SHARD_ROWS
+    if table == 'Users':
+        return user_rows(plan, rng, start, SHARD_ROWS)
+    if table == 'CardDetails':
+        return card_rows(plan, rng, start, SHARD_ROWS, w['customers'], w['card_types'])
+    if table == 'Invoices':
+        return invoice_rows(plan, rng, start, SHARD_ROWS, w['customers'], w['merchants'], w['statuses'])
+    return access_log_rows(plan, rng, start, SHARD_ROWS, w['customers'], w['merchants'], w['actions'])
+
+
+def insert_batches(cursor, conn, table, rows, batch_size):
+    columns, _ = TABLES[table]
+    # mysql.connector rewrites executemany INSERT ... VALUES into multi-row INSERTs
+    sql = (f"INSERT INTO {table} ({', '.join(columns)}) "
+           f"VALUES ({', '.join(['%s'] * len(columns))})")
+    loaded = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return loaded
+        cursor.executemany(sql, batch)
+        conn.commit()
+        loaded += len(batch)
+
+
+def _infile_value(value, binary):
+    if value is None:
+        return '\\N'
+    if binary:
+        return value.hex()
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+def load_infile(cursor, conn, table, rows):
+    columns, binary = TABLES[table]
+    with tempfile.NamedTemporaryFile('w', suffix='.tsv', encoding='utf-8', delete=False) as tsv:
+        loaded = 0
+        for row in rows:
+            tsv.write('\t'.join(_infile_value(value, column in binary)
+                                for column, value in zip(columns, row)) + '\n')
+            loaded += 1
+    try:
+        targets = ', '.join(f"@{column}" if column in binary else column for column in columns)
+        assignments = ', '.join(f"{column} = UNHEX(@{column})" for column in columns if column in binary)
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE '{tsv.name}' INTO TABLE {table} CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({targets})"
+            + (f" SET {assignments}" if assignments else "")
+        )
+        conn.commit()
+    finally:
+        os.unlink(tsv.name)
+    return loaded
+
+
+def load_shard(task):
+    """Worker entry point: generate and load one shard; returns (table, rows)"""
+    table, shard = task
+    plan, conn = _worker['plan'], _worker['conn']
+    cursor = conn.cursor()
+    rows = shard_rows(table, shard)
+    if plan.method == 'infile':
+        loaded = load_infile(cursor, conn, table, rows)
+    else:
+        loaded = insert_batches(cursor, conn, table, rows, plan.batch_size)
+    cursor.close()
+    return table, loaded
+
+
+def run_phase(pool, tables, plan):
+    """Load all shards of `tables` in parallel; prints rows/s per table"""
+    totals = {'Users': plan.customers + plan.merchants, 'CardDetails': plan.cards,
+              'Invoices': plan.invoices, 'AccessLogs': plan.access_logs}
+    tasks = [(table, shard) for table in tables
+             for shard in range(math.ceil(totals[table] / SHARD_ROWS))]
+    if not tasks:
+        return 0
+
+    started = time.time()
+    loaded = dict.fromkeys(tables, 0)
+    for table, rows in pool.imap_unordered(load_shard, tasks):
+        loaded[table] += rows
+        elapsed = max(time.time() - started, 1e-6)
+        done = sum(loaded.values())
+        print(f"   ✓ {table:<12} {loaded[table]:>10}/{totals[table]} rows "
+              f"({done / elapsed:,.0f} rows/s in this phase)")
+    return sum(loaded.values())
+
+
+def generate(args):
+    started = time.time()
+    try:
+        conn = mysql.connector.connect(**db_config)
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM Users WHERE userid LIKE %s", (f"{args.prefix}%",))
+        if cursor.fetchone()[0]:
+            print(f"✗ Users with prefix '{args.prefix}' already exist; choose another --prefix")
+            conn.close()
+            return None
+        cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM CardDetails")
+        plan = Plan(args, card_base=cursor.fetchone()[0])
+
+        print(f"Generating {plan.customers} customers, {plan.merchants} merchants, {plan.cards} cards, "
+              f"{plan.invoices} invoices, {plan.access_logs} access logs "
+              f"(seed {plan.seed}, {args.workers} workers, {plan.method})...")
+
+        print("Dropping dashboard counter triggers for the load...")
+        for name in dashboard_counters.TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+        total = 0
+        try:
+            with multiprocessing.Pool(args.workers, _init_worker, (plan,)) as pool:
+                # Foreign keys: users before cards before invoices
+                for tables in (['Users'], ['CardDetails'], ['Invoices', 'AccessLogs']):
+                    print(f"\nLoading {', '.join(tables)}...")
+                    total += run_phase(pool, tables, plan)
+        finally:
+            print("\nRecreating triggers and rebuilding dashboard counters...")
+            for statement in dashboard_counters.trigger_statements():
+                cursor.execute(statement)
+            drift = dashboard_counters.reconcile(conn)
+            print(f"✓ {len(drift)} counters updated")
+
+        if plan.access_logs:
+            print("\nRebuilding the hourly AccessLogs rollup for the loaded window...")
+            access_rollup.backfill(conn, since=plan.end - timedelta(days=plan.days))
+        conn.close()
+
+        elapsed = max(time.time() - started, 1e-6)
+        print(f"\n✓ Loaded {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+        print(f"  Every generated user's password: {args.password}")
+        return total
+
+    except Error as e:
+        print(f"✗ Error: {e}")
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate synthetic load-test data')
+    parser.add_argument('--users', type=int, default=10000, help='customers')
+    parser.add_argument('--merchants', type=int, default=200)
+    parser.add_argument('--cards', type=int, default=15000)
+    parser.add_argument('--invoices', type=int, default=100000)
+    parser.add_argument('--access-logs', type=int, default=500000)
+    parser.add_argument('--days', type=int, default=365, help='history window for timestamps')
+    parser.add_argument('--end', type=datetime.fromisoformat,
+                        default=datetime.now().replace(hour=0, minute=0, second=0, microsecond=0),
+                        help='newest timestamp (default: today 00:00)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--prefix', default='lt_', help='userid prefix for generated users')
+    parser.add_argument('--password', default='loadtest123', help='password for every generated user')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='generator processes')
+    parser.add_argument('--method', choices=['executemany', 'infile'], default='executemany')
+    parser.add_argument('--batch-size', type=int, default=2000, help='rows per executemany batch')
+    args = parser.parse_args()
+    if args.users < 1 or args.merchants < 1:
+        parser.error('--users and --merchants must be at least 1')
+    generate(args)
@@ -0,0 +1,14 @@
+# gunicorn.conf.py - loaded automatically by `gunicorn app:app`
+import audit_queue
+import metrics
+
+
+def on_starting(server):
+    """Start /metrics from zero: drop worker snapshots left by the previous run"""
+    metrics.clear_store()
+
+
+def worker_exit(server, worker):
+    """Flush buffered audit events and the final metrics snapshot before the worker process goes away"""
+    audit_queue.shutdown()
+    metrics.shutdown()
@@ -0,0 +1,156 @@
+"""
+Health Endpoints for Credit Card Vault
+Liveness and readiness probes that never add database work to the probe itself
+
+- /livez   process is up and serving; no DB, no template, no session
+- /readyz  200 when this worker can take traffic, 503 otherwise, with:
+           pool saturation, audit queue depth and the last DB probe
+           (status 'starting' until this worker's first probe completes)
+
+The database is probed by a background thread every HEALTH_PROBE_INTERVAL
+seconds (SELECT VERSION() on a pooled connection), so probe requests only
+read the cached result, however often the platform polls. A worker is not
+ready when the probe failed or is older than HEALTH_PROBE_STALE_AFTER, when
+every pooled connection is busy with more than READY_MAX_POOL_WAITING
+requests queued behind them, or when the audit buffer is over
+READY_MAX_AUDIT_FILL of its capacity.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from flask import jsonify
+
+import audit_queue
+import db_pool
+
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "5"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "2"))     # pool checkout wait
+HEALTH_PROBE_STALE_AFTER = float(os.getenv("HEALTH_PROBE_STALE_AFTER", str(3 * HEALTH_PROBE_INTERVAL)))
+READY_MAX_POOL_WAITING = int(os.getenv("READY_MAX_POOL_WAITING", "10"))
+READY_MAX_AUDIT_FILL = float(os.getenv("READY_MAX_AUDIT_FILL", "0.9"))
+
+
+class DatabaseProbe:
+    """Background SELECT VERSION() with the latest result cached"""
+
+    def __init__(self, db_config, interval=HEALTH_PROBE_INTERVAL, timeout=HEALTH_PROBE_TIMEOUT):
+        self.db_config = db_config
+        self.interval = interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._result = None
+        self._consecutive_failures = 0
+
+    def start(self):
+        """Start the probe thread in this process (again after a fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Threads do not survive fork; each gunicorn worker probes for itself
+            self._pid = os.getpid()
+            self._result = None
+            threading.Thread(target=self._run, name='db-probe', daemon=True).start()
+
+    def _run(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            self.probe()
+            time.sleep(self.interval)
+
+    def probe(self):
+        """Run one probe now and cache the result"""
+        started = time.monotonic()
+        result = {'ok': False, 'version': None, 'error': None}
+        try:
+            conn = db_pool.get_pool(self.db_config).acquire(timeout=self.timeout)
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT VERSION()")
+                result['version'] = cursor.fetchone()[0]
+                result['ok'] = True
+            finally:
+                conn.close()
+        except Exception as e:
+            result['error'] = str(e)
+        result['latency_ms'] = round((time.monotonic() - started) * 1000, 2)
+        result['checked_at'] = time.time()
+        with self._lock:
+            self._consecutive_failures = 0 if result['ok'] else self._consecutive_failures + 1
+            result['consecutive_failures'] = self._consecutive_failures
+            self._result = result
+        return result
+
+    def status(self):
+        """Latest result (None until the first probe finishes) with its age"""
+        self.start()
+        with self._lock:
+            result = dict(self._result) if self._result else None
+        if result is not None:
+            result['age_s'] = round(time.time() - result['checked_at'], 2)
+            result['checked_at'] = datetime.fromtimestamp(result['checked_at']).isoformat(timespec='seconds')
+        return result
+
+
+_probe = None
+
+
+def database_status():
+    """Cached DB probe result (None before init_app or the first probe)"""
+    return _probe.status() if _probe is not None else None
+
+
+def readiness():
+    """(ready, report) from cached state only"""
+    problems = []
+
+    database = database_status()
+    if database is None:
+        problems.append('database probe pending')
+    elif not database['ok']:
+        problems.append(f"database probe failed: {database['error']}")
+    elif database['age_s'] > HEALTH_PROBE_STALE_AFTER:
+        problems.append(f"database probe stale ({database['age_s']}s old)")
+
+    pools = db_pool.pool_stats()
+    for pool in pools:
+        pool['saturation'] = round(pool['in_use'] / pool['size'], 2) if pool['size'] else 0
+        if pool['in_use'] >= pool['size'] and pool['waiting'] > READY_MAX_POOL_WAITING:
+            problems.append(f"pool {pool['database']} saturated ({pool['waiting']} waiting)")
+
+    audit = audit_queue.audit_stats()
+    if audit is not None and audit['depth'] > READY_MAX_AUDIT_FILL * audit['capacity']:
+        problems.append(f"audit queue {audit['depth']}/{audit['capacity']}")
+
+    return not problems, {
+        'status': 'ready' if not problems else 'starting' if database is None else 'not_ready',
+        'problems': problems,
+        'database': database,
+        'pool': pools,
+        'audit_queue': audit,
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+def livez():
+    return jsonify({'status': 'alive', 'pid': os.getpid()})
+
+
+def readyz():
+    ready, report = readiness()
+    return jsonify(report), 200 if ready else 503
+
+
+def init_app(app, db_config):
+    """Serve /livez and /readyz; start this process's DB probe"""
+    global _probe
+    _probe = DatabaseProbe(db_config)
+    _probe.start()
+    app.add_url_rule('/livez', 'livez', livez)
+    app.add_url_rule('/readyz', 'readyz', readyz)
+    return _probe
@@ -3,18 +3,190 @@ Kerberos-Inspired Authentication Module for Credit Card Vault
 Implements ticket-based authentication inspired by Kerberos protocol
 """
 
+import base64
 import hashlib
+import hmac
+import ipaddress
+import os
 import secrets
+import struct
+import threading
 import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from functools import wraps
-from flask import session, request, flash, redirect, url_for
-import mysql.connector
+from functools import lru_cache, wraps
+from types import MappingProxyType
+from flask import g, session, request, flash, redirect, url_for
+from db_pool import get_connection
+import audit_queue
+import ticket_revocation
 
 # Kerberos-like configuration
 TICKET_LIFETIME = 1800  # 30 minutes (like TGT lifetime)
+SERVICE_TICKET_LIFETIME = 600  # 10 minutes for service tickets
 SERVICE_KEY = "vault-service-key-2024"  # Service principal key
 REALM = "CARDVAULT.LOCAL"  # Kerberos realm
+TGT_SERVICE = "vault-service"
+
+
+def _load_service_keys():
+    """
+    Service keys by key ID from KERBEROS_SERVICE_KEYS="2:new-key,1:old-key"
+    The first entry signs new tickets; the rest still validate until removed.
+    """
+    spec = os.getenv("KERBEROS_SERVICE_KEYS")
+    if not spec:
+        return {1: SERVICE_KEY.encode()}, 1
+    keys = {}
+    for item in spec.split(','):
+        key_id, _, key = item.strip().partition(':')
+        keys[int(key_id)] = key.encode()
+    return keys, int(spec.split(':', 1)[0])
+
+
+SERVICE_KEYS, ACTIVE_KEY_ID = _load_service_keys()
+# Keyed HMAC states per key ID; copying one skips re-deriving the key pads
+_HMAC_BASES = {key_id: hmac.new(key, digestmod=hashlib.sha256) for key_id, key in SERVICE_KEYS.items()}
+
+# ==================== TICKET WIRE FORMAT ====================
+# v1, big-endian, base64url without padding:
+#   version B | key_id B | kind B | role B | issued_at I | expires_at I |
+#   ticket_id 16s | client_address 16s | parent_id 8s | session_key 32s |
+#   userid (len B + utf-8) | service (len B + utf-8) | HMAC-SHA256 tag (first 16 bytes)
+TICKET_VERSION = 1
+TICKET_FIXED = struct.Struct('>BBBBII16s16s8s32s')
+TAG_SIZE = 16
+KIND_TGT, KIND_SERVICE = 0, 1
+ROLES = ('admin', 'merchant', 'customer', 'auditor')
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+NO_ADDRESS = bytes(16)
+NO_PARENT = bytes(8)
+IPV4_MAPPED = bytes(10) + b'\xff\xff'
+
+
+class TicketError(ValueError):
+    """Ticket could not be decoded or failed authentication"""
+
+
+def _pack_address(client_ip):
+    """IPv4 as an IPv4-mapped IPv6 address, so every address is 16 bytes"""
+    if not client_ip:
+        return NO_ADDRESS
+    try:
+        address = ipaddress.ip_address(client_ip)
+    except ValueError:
+        raise TicketError(f"Invalid client address {client_ip!r}")
+    return address.packed if address.version == 6 else IPV4_MAPPED + address.packed
+
+
+def _unpack_address(packed):
+    if packed == NO_ADDRESS:
+        return None
+    address = ipaddress.IPv6Address(packed)
+    return str(address.ipv4_mapped or address)
+
+
+def normalize_address(client_ip):
+    """
+    Canonical text form of a client address, as stored in tickets
+    An IPv4-mapped IPv6 address ('::ffff:1.2.3.4', dual-stack sockets)
+    becomes plain IPv4, so both spellings match the same ticket.
+    """
+    if not client_ip:
+        return None
+    try:
+        address = ipaddress.ip_address(client_ip)
+    except ValueError:
+        return client_ip  # never equal to a canonical address
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return str(address)
+
+
+def _sign(key_id, body):
+    mac = _HMAC_BASES[key_id].copy()
+    mac.update(body)
+    return mac.digest()[:TAG_SIZE]
+
+
+def encode_ticket(kind, userid, role, service, issued_at, expires_at, client_ip,
+                  parent_id=NO_PARENT, key_id=None):
+    """Pack and sign a ticket; returns (token, ticket_id hex)"""
+    key_id = ACTIVE_KEY_ID if key_id is None else key_id
+    if role not in ROLE_CODES:
+        raise TicketError(f"Unknown role {role!r}")
+    ticket_id = secrets.token_bytes(16)
+    user_bytes = userid.encode()
+    service_bytes = service.encode()
+    body = b''.join((
+        TICKET_FIXED.pack(TICKET_VERSION, key_id, kind, ROLE_CODES[role], issued_at, expires_at,
+                          ticket_id, _pack_address(client_ip), parent_id, secrets.token_bytes(32)),
+        bytes((len(user_bytes),)), user_bytes,
+        bytes((len(service_bytes),)), service_bytes,
+    ))
+    token = base64.urlsafe_b64encode(body + _sign(key_id, body)).rstrip(b'=').decode()
+    return token, ticket_id.hex()
+
+
+@lru_cache(maxsize=4096)
+def parse_ticket(token):
+    """
+    Decode and authenticate a ticket token (parse-once: results are cached
+    per token, so repeat validations skip base64, struct and HMAC work)
+
+    Returns a read-only mapping with the classic ticket fields; raises
+    TicketError. Expiry and client address are checked by validate_ticket.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    except (TypeError, ValueError, AttributeError):
+        raise TicketError("Malformed ticket encoding")
+    if len(raw) < TICKET_FIXED.size + 2 + TAG_SIZE or raw[0] != TICKET_VERSION:
+        raise TicketError("Unsupported ticket format")
+
+    body, tag = raw[:-TAG_SIZE], raw[-TAG_SIZE:]
+    (_, key_id, kind, role_code, issued_at, expires_at,
+     ticket_id, address, parent_id, session_key) = TICKET_FIXED.unpack_from(body)
+    if key_id not in SERVICE_KEYS:
+        raise TicketError("Unknown service key (ticket signed with a retired key)")
+    if not hmac.compare_digest(tag, _sign(key_id, body)):
+        raise TicketError("Invalid ticket signature (tampering detected)")
+
+    try:
+        offset = TICKET_FIXED.size
+        user_len = body[offset]
+        userid = body[offset + 1:offset + 1 + user_len].decode()
+        offset += 1 + user_len
+        service = body[offset + 1:offset + 1 + body[offset]].decode()
+        role = ROLES[role_code]
+    except (IndexError, UnicodeDecodeError):
+        raise TicketError("Malformed ticket body")
+
+    return MappingProxyType({
+        'principal': f"{userid}@{REALM}",
+        'userid': userid,
+        'role': role,
+        'session_key': session_key.hex(),
+        'issued_at': issued_at,
+        'expires_at': expires_at,
+        'client_address': _unpack_address(address),
+        'signature': tag.hex(),
+        'realm': REALM,
+        'service': service,
+        'kind': kind,
+        'key_id': key_id,
+        'ticket_id': ticket_id.hex(),
+        'from_tgt': parent_id.hex() if parent_id != NO_PARENT else None
+    })
+
+
+def set_service_keys(keys, active_key_id):
+    """Rotate service keys at runtime (drops cached parses)"""
+    global SERVICE_KEYS, ACTIVE_KEY_ID, _HMAC_BASES
+    SERVICE_KEYS = {int(k): v.encode() if isinstance(v, str) else v for k, v in keys.items()}
+    ACTIVE_KEY_ID = int(active_key_id)
+    _HMAC_BASES = {key_id: hmac.new(key, digestmod=hashlib.sha256) for key_id, key in SERVICE_KEYS.items()}
+    parse_ticket.cache_clear()
 
 
 class KerberosTicket:
@@ -25,42 +197,30 @@ class KerberosTicket:
         """
         Generate a Kerberos-style Ticket Granting Ticket (TGT)
         
-        Ticket Structure:
+        Ticket Structure (packed, see TICKET_FIXED):
         - Principal: userid@REALM
         - Session Key: Random cryptographic key
         - Timestamp: Issue time
         - Lifetime: Valid duration
         - Client Address: IP address
         - Service: Target service name
+        
+        Returns the signed token string that is stored in the session.
         """
         timestamp = int(time.time())
-        expiry = timestamp + TICKET_LIFETIME
-        
-        # Generate session key (like Kerberos session key)
-        session_key = secrets.token_hex(32)
-        
-        # Create ticket payload
-        ticket_data = f"{userid}@{REALM}|{role}|{timestamp}|{expiry}|{client_ip}|{session_key}"
-        
-        # Sign ticket with service key (like Kerberos ticket encryption)
-        signature = hashlib.sha256(
-            f"{ticket_data}{SERVICE_KEY}".encode()
-        ).hexdigest()
-        
-        ticket = {
-            'principal': f"{userid}@{REALM}",
-            'userid': userid,
-            'role': role,
-            'session_key': session_key,
-            'issued_at': timestamp,
-            'expires_at': expiry,
-            'client_address': client_ip,
-            'signature': signature,
-            'realm': REALM,
-            'service': 'vault-service'
-        }
-        
-        return ticket
+        token, _ = encode_ticket(KIND_TGT, userid, role, TGT_SERVICE,
+                                 timestamp, timestamp + TICKET_LIFETIME, client_ip)
+        return token
+    
+    @staticmethod
+    def decode(ticket):
+        """Parsed ticket fields for a token, or None if it does not authenticate"""
+        if not isinstance(ticket, str):
+            return None
+        try:
+            return parse_ticket(ticket)
+        except TicketError:
+            return None
     
     @staticmethod
     def validate_ticket(ticket, client_ip):
@@ -68,43 +228,43 @@ class KerberosTicket:
         Validate a Kerberos-style ticket
         
         Checks:
-        1. Ticket signature (authenticity)
+        1. Ticket signature (authenticity, constant-time HMAC compare)
         2. Expiration time (still valid)
         3. Client IP address (prevents ticket theft)
-        4. Realm validity
         """
         if not ticket:
             return False, "No ticket provided"
+        if not isinstance(ticket, str):
+            return False, "Legacy ticket format - please log in again"
+        
+        try:
+            fields = parse_ticket(ticket)
+        except TicketError as e:
+            return False, str(e)
         
         # Check expiration
-        current_time = int(time.time())
-        if current_time > ticket.get('expires_at', 0):
+        if int(time.time()) > fields['expires_at']:
             return False, "Ticket expired (TGT lifetime exceeded)"
         
         # Verify client IP (prevents ticket replay attacks)
-        if ticket.get('client_address') != client_ip:
+        if fields['client_address'] != normalize_address(client_ip):
             return False, "Client address mismatch (possible ticket theft)"
         
-        # Verify signature (ticket integrity)
-        ticket_data = f"{ticket['userid']}@{REALM}|{ticket['role']}|{ticket['issued_at']}|{ticket['expires_at']}|{ticket['client_address']}|{ticket['session_key']}"
-        expected_signature = hashlib.sha256(
-            f"{ticket_data}{SERVICE_KEY}".encode()
-        ).hexdigest()
-        
-        if ticket.get('signature') != expected_signature:
-            return False, "Invalid ticket signature (tampering detected)"
-        
-        # Verify realm
-        if ticket.get('realm') != REALM:
-            return False, "Invalid realm"
+        # Revocation list (logout, renewal) - shared Bloom filter, DB only on a hit
+        if ticket_revocation.is_revoked(fields['ticket_id'], fields['expires_at']):
+            return False, "Ticket revoked"
         
         return True, "Ticket valid"
     
     @staticmethod
-    def renew_ticket(old_ticket, client_ip):
+    def renew_ticket(old_ticket, client_ip, revoke_old=True):
         """
         Renew an existing ticket (like Kerberos ticket renewal)
         Similar to getting a new TGT with an existing valid TGT
+        
+        Automatic renewal passes revoke_old=False: parallel requests may
+        still carry the old ticket, which then simply runs out (it has
+        only minutes left) instead of failing as revoked.
         """
         valid, message = KerberosTicket.validate_ticket(old_ticket, client_ip)
         
@@ -112,16 +272,82 @@ class KerberosTicket:
             return None, message
         
         # Issue new ticket with fresh timestamp
-        return KerberosTicket.generate_ticket(
-            old_ticket['userid'],
-            old_ticket['role'],
+        fields = parse_ticket(old_ticket)
+        new_ticket = KerberosTicket.generate_ticket(
+            fields['userid'],
+            fields['role'],
             client_ip
-        ), "Ticket renewed successfully"
+        )
+        if revoke_old:
+            KerberosTicket.revoke(old_ticket, reason='renewed')
+        return new_ticket, "Ticket renewed successfully"
+    
+    @staticmethod
+    def revoke(ticket, reason='logout'):
+        """Revoke a ticket for every worker until it expires"""
+        fields = KerberosTicket.decode(ticket)
+        if not fields:
+            return False
+        return ticket_revocation.revoke(fields['ticket_id'], fields['expires_at'],
+                                        fields['userid'], reason)
 
 
 class KerberosAuth:
     """Kerberos-style authentication handler"""
     
+    @staticmethod
+    def verify_credentials(cursor, userid, password):
+        """
+        Verify credentials with the KDC (database) - one query
+        Returns the active user row or None
+        """
+        cursor.execute("""
+            SELECT userid, role, full_name, is_active 
+            FROM Users 
+            WHERE userid = %s AND password_hash = SHA2(%s, 256)
+        """, (userid, password))
+        
+        user = cursor.fetchone()
+        if not user or not user['is_active']:
+            return None
+        return user
+    
+    @staticmethod
+    def login(userid, password, db_config):
+        """
+        Single-round-trip login pipeline (AS exchange + session bookkeeping)
+        
+        Verifies the credentials once, issues the TGT from the fetched user
+        row and updates last_login in the same transaction. Audit events are
+        left to the caller, which queues them for the background flusher.
+        
+        Returns (user, ticket, message); user is None on failure.
+        """
+        conn = get_connection(db_config)
+        cursor = conn.cursor(dictionary=True)
+        
+        user = KerberosAuth.verify_credentials(cursor, userid, password)
+        if not user:
+            conn.close()
+            return None, None, "Authentication failed: Invalid credentials"
+        
+        # Issue TGT (Ticket Granting Ticket) from the row we already have
+        try:
+            ticket = KerberosTicket.generate_ticket(
+                user['userid'],
+                user['role'],
+                request.remote_addr
+            )
+        except TicketError as e:
+            conn.close()
+            return None, None, f"Authentication failed: {e}"
+        
+        cursor.execute("UPDATE Users SET last_login = NOW() WHERE userid = %s", (user['userid'],))
+        conn.commit()
+        conn.close()
+        
+        return user, ticket, "Authentication successful - TGT issued"
+    
     @staticmethod
     def authenticate(userid, password, db_config):
         """
@@ -129,20 +355,12 @@ class KerberosAuth:
         Similar to Kerberos AS (Authentication Service) exchange
         """
         try:
-            conn = mysql.connector.connect(**db_config)
+            conn = get_connection(db_config)
             cursor = conn.cursor(dictionary=True)
-            
-            # Verify credentials with KDC (database)
-            cursor.execute("""
-                SELECT userid, role, full_name, is_active 
-                FROM Users 
-                WHERE userid = %s AND password_hash = SHA2(%s, 256)
-            """, (userid, password))
-            
-            user = cursor.fetchone()
+            user = KerberosAuth.verify_credentials(cursor, userid, password)
             conn.close()
             
-            if not user or not user['is_active']:
+            if not user:
                 return None, "Authentication failed: Invalid credentials"
             
             # Issue TGT (Ticket Granting Ticket)
@@ -170,18 +388,14 @@ class KerberosAuth:
         if not valid:
             return None, message
         
-        # Generate service-specific ticket
-        service_ticket = {
-            'principal': tgt['principal'],
-            'userid': tgt['userid'],
-            'role': tgt['role'],
-            'service': service_name,
-            'session_key': secrets.token_hex(32),
-            'issued_at': int(time.time()),
-            'expires_at': int(time.time()) + 600,  # 10 min for service tickets
-            'client_address': client_ip,
-            'from_tgt': tgt['signature'][:16]  # Reference to parent TGT
-        }
+        # Generate service-specific ticket bound to the parent TGT
+        tgt_fields = parse_ticket(tgt)
+        now = int(time.time())
+        service_ticket, _ = encode_ticket(
+            KIND_SERVICE, tgt_fields['userid'], tgt_fields['role'], service_name,
+            now, now + SERVICE_TICKET_LIFETIME, client_ip,
+            parent_id=bytes.fromhex(tgt_fields['ticket_id'])[:8]
+        )
         
         return service_ticket, "Service ticket granted"
 
@@ -193,6 +407,10 @@ def kerberos_required(f):
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
+        # Already resolved by the request auth pipeline (auth_middleware)
+        if g.get('principal'):
+            return f(*args, **kwargs)
+        
         # Check if ticket exists in session
         ticket = session.get('kerberos_ticket')
         
@@ -210,9 +428,9 @@ def kerberos_required(f):
             return redirect(url_for('login'))
         
         # Check if ticket needs renewal (< 5 minutes remaining)
-        time_remaining = ticket['expires_at'] - int(time.time())
+        time_remaining = parse_ticket(ticket)['expires_at'] - int(time.time())
         if time_remaining < 300:  # Less than 5 minutes
-            new_ticket, msg = KerberosTicket.renew_ticket(ticket, client_ip)
+            new_ticket, msg = KerberosTicket.renew_ticket(ticket, client_ip, revoke_old=False)
             if new_ticket:
                 session['kerberos_ticket'] = new_ticket
                 session['ticket_renewed'] = datetime.now().isoformat()
@@ -229,6 +447,13 @@ def kerberos_role_required(*roles):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
+            principal = g.get('principal')
+            if principal:
+                if principal['role'] not in roles:
+                    flash('Access denied. Insufficient privileges.', 'danger')
+                    return redirect(url_for('dashboard'))
+                return f(*args, **kwargs)
+            
             ticket = session.get('kerberos_ticket')
             
             if not ticket:
@@ -245,7 +470,7 @@ def kerberos_role_required(*roles):
                 return redirect(url_for('login'))
             
             # Check role
-            if ticket.get('role') not in roles:
+            if parse_ticket(ticket)['role'] not in roles:
                 flash('Access denied. Insufficient privileges.', 'danger')
                 return redirect(url_for('dashboard'))
             
@@ -255,30 +480,152 @@ def kerberos_role_required(*roles):
     return decorator
 
 
+# ==================== SERVICE TICKETS (TGS) ====================
+SESSION_GRANTS_MAX = 16  # resource IDs remembered in the session per service ticket
+GRANT_CACHE_SIZE = int(os.getenv("GRANT_CACHE_SIZE", "10000"))  # per-process (ticket, resource) grants
+
+_service_ticket_lock = threading.Lock()
+_service_ticket_stats = {'hits': 0, 'misses': 0, 'grant_cache_hits': 0, 'grant_fallbacks': 0, 'denied': 0}
+_grant_cache = OrderedDict()   # (service ticket id, resource id) -> True, LRU
+
+
+def _count(name):
+    with _service_ticket_lock:
+        _service_ticket_stats[name] += 1
+
+
+def service_ticket_stats():
+    """Service ticket cache counters for this process"""
+    with _service_ticket_lock:
+        stats = dict(_service_ticket_stats)
+        stats['grant_cache_size'] = len(_grant_cache)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else None
+    return stats
+
+
+def _grant_cached(ticket_id, resource_id):
+    key = (ticket_id, resource_id)
+    with _service_ticket_lock:
+        if key not in _grant_cache:
+            return False
+        _grant_cache.move_to_end(key)
+        _service_ticket_stats['grant_cache_hits'] += 1
+        return True
+
+
+def _cache_grant(ticket_id, resource_id):
+    with _service_ticket_lock:
+        _grant_cache[(ticket_id, resource_id)] = True
+        _grant_cache.move_to_end((ticket_id, resource_id))
+        while len(_grant_cache) > GRANT_CACHE_SIZE:
+            _grant_cache.popitem(last=False)
+
+
+def _cached_service_ticket(service_name, tgt_fields, client_ip):
+    """The session's cached ticket entry for service_name if still usable"""
+    entry = session.get('service_tickets', {}).get(service_name)
+    if not entry or 'checked' not in entry:
+        return None
+    valid, _ = KerberosTicket.validate_ticket(entry['ticket'], client_ip)
+    if not valid:
+        return None
+    fields = parse_ticket(entry['ticket'])
+    # Bound to the current TGT: renewal or a new login re-runs the TGS exchange
+    if fields['service'] != service_name or fields['from_tgt'] != tgt_fields['ticket_id'][:16]:
+        return None
+    return entry
+
+
+def service_ticket_required(service_name, roles, check_grant=None, resource_arg=None,
+                            unrestricted_roles=(), denied_endpoint='dashboard'):
+    """
+    Decorator for sensitive services: TGS exchange once, then cached
+    
+    The first request runs get_service_ticket() (full TGT validation); the
+    ticket is cached in the (server-side) session until it expires. Access
+    to kwargs[resource_arg] is decided by check_grant(userid, role,
+    resource_id) unless the role is in unrestricted_roles. Grants are
+    remembered per service ticket, in this process (an LRU of
+    GRANT_CACHE_SIZE) and for the last SESSION_GRANTS_MAX IDs in the
+    session entry, so repeat views skip the query and the session stays
+    small. Denials are not remembered: a resource granted later is allowed
+    on the next request.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            tgt = session.get('kerberos_ticket')
+            if not tgt:
+                flash('Authentication required. Please login with Kerberos.', 'warning')
+                return redirect(url_for('login'))
+            
+            client_ip = request.remote_addr
+            principal = g.get('principal')
+            if principal:
+                # TGT already validated for this request by auth_middleware
+                tgt_fields = principal['ticket']
+            else:
+                valid, message = KerberosTicket.validate_ticket(tgt, client_ip)
+                if not valid:
+                    session.clear()
+                    flash(f'Ticket validation failed: {message}', 'danger')
+                    return redirect(url_for('login'))
+                tgt_fields = parse_ticket(tgt)
+            
+            if tgt_fields['role'] not in roles:
+                flash('Access denied. Insufficient privileges.', 'danger')
+                return redirect(url_for('dashboard'))
+            
+            entry = _cached_service_ticket(service_name, tgt_fields, client_ip)
+            if entry:
+                _count('hits')
+            else:
+                _count('misses')
+                ticket, message = KerberosAuth.get_service_ticket(tgt, service_name)
+                if not ticket:
+                    session.clear()
+                    flash(f'Ticket validation failed: {message}', 'danger')
+                    return redirect(url_for('login'))
+                entry = {'ticket': ticket, 'checked': []}
+                session.setdefault('service_tickets', {})[service_name] = entry
+                session.modified = True
+            
+            service_ticket = parse_ticket(entry['ticket'])
+            if resource_arg and tgt_fields['role'] not in unrestricted_roles:
+                resource_id = kwargs[resource_arg]
+                if resource_id not in entry['checked'] and not _grant_cached(service_ticket['ticket_id'], resource_id):
+                    _count('grant_fallbacks')
+                    if not check_grant(tgt_fields['userid'], tgt_fields['role'], resource_id):
+                        _count('denied')
+                        flash('Access denied.', 'danger')
+                        return redirect(url_for(denied_endpoint))
+                    _cache_grant(service_ticket['ticket_id'], resource_id)
+                    entry['checked'] = (entry['checked'] + [resource_id])[-SESSION_GRANTS_MAX:]
+                    session.modified = True
+            
+            g.service_ticket = service_ticket
+            return f(*args, **kwargs)
+        
+        return decorated_function
+    return decorator
+
+
+def revoke_session_tickets(reason='logout'):
+    """Revoke the session's TGT and cached service tickets (call before clearing it)"""
+    KerberosTicket.revoke(session.get('kerberos_ticket'), reason)
+    for entry in session.get('service_tickets', {}).values():
+        KerberosTicket.revoke(entry['ticket'], reason)
+
+
 class KerberosLogger:
     """Log Kerberos authentication events"""
     
     @staticmethod
     def log_event(event_type, userid, details, db_config):
-        """Log Kerberos-related security events"""
+        """Log Kerberos-related security events (queued for the audit flusher)"""
         try:
-            conn = mysql.connector.connect(**db_config)
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO AccessLogs (userid, action, table_name, record_id, ip_address, user_agent)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                userid,
-                f"KERBEROS_{event_type}",
-                'KerberosAuth',
-                None,
-                request.remote_addr,
-                request.headers.get('User-Agent')
-            ))
-            
-            conn.commit()
-            conn.close()
+            audit_queue.record(db_config, userid, f"KERBEROS_{event_type}", 'KerberosAuth')
         except Exception as e:
             print(f"Logging error: {e}")
 
@@ -286,7 +633,7 @@ class KerberosLogger:
 # Ticket information helper
 def get_ticket_info():
     """Get current ticket information for display"""
-    ticket = session.get('kerberos_ticket')
+    ticket = KerberosTicket.decode(session.get('kerberos_ticket'))
     if not ticket:
         return None
     
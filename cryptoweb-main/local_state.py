@@ -0,0 +1,51 @@
+"""
+Local State Files for Credit Card Vault
+Where per-host files live: SQLite databases, metrics snapshots, logs
+
+Defaults are under STATE_DIR (CARDVAULT_STATE_DIR, default the Flask
+instance folder next to app.py), not the shared temp directory, where any
+local user could pre-create a predictably named file or read ours.
+Directories are created 0700 and files 0600, and a file or directory
+owned by another user is refused rather than opened.
+"""
+
+import os
+
+STATE_DIR = os.getenv(
+    "CARDVAULT_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+)
+
+
+class UnsafePathError(RuntimeError):
+    """A state path is owned by another user"""
+
+
+def default_path(name):
+    """Path of a state file or directory under STATE_DIR"""
+    return os.path.join(STATE_DIR, name)
+
+
+def _check_owner(path, st):
+    if st.st_uid != os.getuid():
+        raise UnsafePathError(f"{path} is owned by uid {st.st_uid}, not {os.getuid()}; refusing to use it")
+
+
+def private_dir(path):
+    """Create directory path (0700) if missing; refuse one owned by another user"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    _check_owner(path, os.stat(path))
+    return path
+
+
+def private_file(path):
+    """Create file path (0600, parent 0700) if missing; refuse one owned by another user"""
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, mode=0o700, exist_ok=True)
+    # O_NOFOLLOW: a symlink planted at path is an error, not a redirect
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+    try:
+        _check_owner(path, os.fstat(fd))
+    finally:
+        os.close(fd)
+    return path
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+AccessLogs Retention for Credit Card Vault
+Monthly range partitions, compressed archival and restore
+
+Migration 7 partitions AccessLogs by month on UNIX_TIMESTAMP(timestamp).
+MySQL requires the partitioning column in every unique key and does not
+allow foreign keys on partitioned tables, so the migration widens the
+primary key to (log_id, timestamp) and drops the userid foreign key
+(log rows now keep the userid of a deleted user, which is what an audit
+trail wants anyway).
+
+The maintain command keeps RETENTION_MONTHS of raw logs online:
+1. splits future monthly partitions off the empty pmax catch-all
+2. streams each expired partition into a gzip JSONL archive with a
+   SHA-256 manifest, verifies the row count, then DROPs the partition
+   (a metadata operation instead of a huge DELETE)
+
+Hourly counts survive in AccessLogRollup after the raw rows are archived.
+
+Usage:
+    python log_retention.py list
+    python log_retention.py maintain [--retention-months 12] [--archive-dir log_archive] [--dry-run]
+    python log_retention.py restore log_archive/AccessLogs-p202501.jsonl.gz [--table AccessLogsRestored]
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+
+import mysql.connector
+from mysql.connector import Error
+
+from config import db_config
+
+RETENTION_MONTHS = int(os.getenv("LOG_RETENTION_MONTHS", "12"))
+ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "log_archive")
+PARTITIONS_AHEAD = 3          # future months kept split off pmax
+STREAM_BATCH = 5000           # rows per fetchmany / executemany
+
+COLUMNS = ('log_id', 'userid', 'action', 'table_name', 'record_id', 'ip_address', 'user_agent', 'timestamp',
+           'event_count')
+PARTITION_NAME = re.compile(r"^p(\d{4})(\d{2})$")
+
+
+# ==================== MONTH HELPERS ====================
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"p{month:%Y%m}"
+
+
+def partition_clause(month):
+    """Partition holding `month`; bound is the first second of the next month"""
+    upper = add_months(month, 1)
+    return f"PARTITION {partition_name(month)} VALUES LESS THAN (UNIX_TIMESTAMP('{upper:%Y-%m-%d} 00:00:00'))"
+
+
+# ==================== SCHEMA (migration 7) ====================
+def is_partitioned(cursor):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'AccessLogs' AND PARTITION_NAME IS NOT NULL
+    """)
+    return cursor.fetchone()[0] > 0
+
+
+def partition_statements(cursor):
+    """Migration step: convert AccessLogs to monthly RANGE partitions"""
+    if is_partitioned(cursor):
+        return []
+
+    statements = []
+    cursor.execute("""
+        SELECT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'AccessLogs'
+          AND REFERENCED_TABLE_NAME IS NOT NULL
+    """)
+    for (constraint,) in cursor.fetchall():
+        statements.append(f"ALTER TABLE AccessLogs DROP FOREIGN KEY {constraint}")
+
+    cursor.execute("""
+        SELECT GROUP_CONCAT(COLUMN_NAME ORDER BY ORDINAL_POSITION) FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'AccessLogs' AND CONSTRAINT_NAME = 'PRIMARY'
+    """)
+    if cursor.fetchone()[0] != 'log_id,timestamp':
+        statements.append(
+            "ALTER TABLE AccessLogs MODIFY timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+            "DROP PRIMARY KEY, ADD PRIMARY KEY (log_id, timestamp)"
+        )
+
+    cursor.execute("SELECT MIN(timestamp) FROM AccessLogs")
+    oldest = cursor.fetchone()[0] or datetime.now()
+    month = month_start(oldest)
+    last = add_months(month_start(datetime.now()), PARTITIONS_AHEAD)
+    clauses = []
+    while month <= last:
+        clauses.append(partition_clause(month))
+        month = add_months(month, 1)
+    clauses.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+
+    # Repartitioning rebuilds the table (no INPLACE form exists for it)
+    statements.append(
+        "ALTER TABLE AccessLogs PARTITION BY RANGE (UNIX_TIMESTAMP(timestamp)) (\n    "
+        + ",\n    ".join(clauses) + "\n)"
+    )
+    return statements
+
+
+# ==================== PARTITION INSPECTION ====================
+def list_partitions(cursor):
+    """[(name, month or None, estimated_rows)] in partition order"""
+    cursor.execute("""
+        SELECT PARTITION_NAME, TABLE_ROWS FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'AccessLogs' AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)
+    partitions = []
+    for name, rows in cursor.fetchall():
+        match = PARTITION_NAME.match(name)
+        month = datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+        partitions.append((name, month, rows))
+    return partitions
+
+
+def ensure_future_partitions(conn, ahead=PARTITIONS_AHEAD, dry_run=False):
+    """Split upcoming months off pmax (cheap while pmax is empty)"""
+    cursor = conn.cursor()
+    months = [month for _, month, _ in list_partitions(cursor) if month]
+    if not months:
+        return []
+
+    target = add_months(month_start(datetime.now()), ahead)
+    month = add_months(max(months), 1)
+    clauses = []
+    while month <= target:
+        clauses.append(partition_clause(month))
+        month = add_months(month, 1)
+    if not clauses:
+        return []
+
+    statement = ("ALTER TABLE AccessLogs REORGANIZE PARTITION pmax INTO (\n    "
+                 + ",\n    ".join(clauses + ["PARTITION pmax VALUES LESS THAN MAXVALUE"]) + "\n)")
+    print(statement)
+    if not dry_run:
+        cursor.execute(statement)
+    return clauses
+
+
+# ==================== ARCHIVE ====================
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def archive_partition(conn, name, month, archive_dir=ARCHIVE_DIR):
+    """
+    Stream one partition into <archive_dir>/AccessLogs-<name>.jsonl.gz
+
+    Rows are read with an unbuffered cursor and written as they arrive, so
+    memory use is bounded by STREAM_BATCH regardless of partition size.
+    Returns the manifest dict.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"AccessLogs-{name}.jsonl.gz")
+    tmp_path = path + ".tmp"
+
+    cursor = conn.cursor(buffered=False)
+    cursor.execute(
+        f"SELECT {', '.join(COLUMNS)} FROM AccessLogs PARTITION ({name}) ORDER BY log_id"
+    )
+
+    rows = 0
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as out:
+        while True:
+            batch = cursor.fetchmany(STREAM_BATCH)
+            if not batch:
+                break
+            for row in batch:
+                record = dict(zip(COLUMNS, row))
+                record['timestamp'] = record['timestamp'].isoformat()
+                out.write(json.dumps(record, separators=(',', ':')) + "\n")
+            rows += len(batch)
+    cursor.close()
+
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    manifest = {
+        'table': 'AccessLogs',
+        'partition': name,
+        'month': f"{month:%Y-%m}",
+        'rows': rows,
+        'file': os.path.basename(path),
+        'sha256': sha256_file(path),
+        'archived_at': datetime.now().isoformat(timespec='seconds')
+    }
+    with open(path + ".manifest.json", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def expire_partitions(conn, retention_months=RETENTION_MONTHS, archive_dir=ARCHIVE_DIR, dry_run=False):
+    """Archive and drop every monthly partition older than the retention window"""
+    cursor = conn.cursor()
+    cutoff = add_months(month_start(datetime.now()), -retention_months)
+    expired = [(name, month) for name, month, _ in list_partitions(cursor) if month and month < cutoff]
+
+    for name, month in expired:
+        if dry_run:
+            print(f"[dry-run] would archive and drop {name} ({month:%Y-%m})")
+            continue
+
+        manifest = archive_partition(conn, name, month, archive_dir)
+        cursor.execute(f"SELECT COUNT(*) FROM AccessLogs PARTITION ({name})")
+        live_rows = cursor.fetchone()[0]
+        if live_rows != manifest['rows']:
+            print(f"✗ {name}: archived {manifest['rows']} rows but partition has {live_rows} - not dropped")
+            continue
+
+        cursor.execute(f"ALTER TABLE AccessLogs DROP PARTITION {name}")
+        print(f"✓ {name}: {manifest['rows']} rows archived to {manifest['file']} "
+              f"(sha256 {manifest['sha256'][:12]}...), partition dropped")
+    return expired
+
+
+# ==================== RESTORE ====================
+def ensure_restore_table(cursor, table):
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} LIKE AccessLogs")
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+    """, (table,))
+    if cursor.fetchone()[0]:
+        # Restored rows may predate every live partition
+        cursor.execute(f"ALTER TABLE {table} REMOVE PARTITIONING")
+
+
+def restore_archive(conn, path, table='AccessLogsRestored'):
+    """Verify an archive against its manifest and stream it into `table`"""
+    if not re.match(r"^\w+$", table):
+        raise ValueError(f"Invalid table name: {table}")
+
+    with open(path + ".manifest.json") as f:
+        manifest = json.load(f)
+    checksum = sha256_file(path)
+    if checksum != manifest['sha256']:
+        raise ValueError(f"Checksum mismatch for {path}: {checksum} != {manifest['sha256']}")
+
+    cursor = conn.cursor()
+    ensure_restore_table(cursor, table)
+    insert = (f"INSERT IGNORE INTO {table} ({', '.join(COLUMNS)}) "
+              f"VALUES ({', '.join(['%s'] * len(COLUMNS))})")
+
+    rows = 0
+    batch = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+            record.setdefault('event_count', 1)  # archived before migration 11
+            batch.append(tuple(record[column] for column in COLUMNS))
+            if len(batch) >= STREAM_BATCH:
+                cursor.executemany(insert, batch)
+                conn.commit()
+                rows += len(batch)
+                batch = []
+    if batch:
+        cursor.executemany(insert, batch)
+        conn.commit()
+        rows += len(batch)
+
+    if rows != manifest['rows']:
+        print(f"⚠ Restored {rows} rows but manifest lists {manifest['rows']}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AccessLogs partition retention')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('list', help='show partitions and estimated row counts')
+
+    maintain = sub.add_parser('maintain', help='add future partitions, archive and drop expired ones')
+    maintain.add_argument('--retention-months', type=int, default=RETENTION_MONTHS)
+    maintain.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    maintain.add_argument('--dry-run', action='store_true')
+
+    restore = sub.add_parser('restore', help='load an archive into a table for investigation')
+    restore.add_argument('archive')
+    restore.add_argument('--table', default='AccessLogsRestored')
+
+    args = parser.parse_args()
+
+    try:
+        conn = mysql.connector.connect(**db_config)
+        cursor = conn.cursor()
+        if args.command == 'list':
+            for name, month, rows in list_partitions(cursor):
+                print(f"  {name:<10} {month.strftime('%Y-%m') if month else '(future)':<9} ~{rows} rows")
+        elif args.command == 'maintain':
+            ensure_future_partitions(conn, dry_run=args.dry_run)
+            expire_partitions(conn, args.retention_months, args.archive_dir, args.dry_run)
+            print("✓ Retention maintenance complete")
+        else:
+            rows = restore_archive(conn, args.archive, args.table)
+            print(f"✓ Restored {rows} rows into {args.table}")
+        conn.close()
+    except (Error, ValueError, OSError) as e:
+        print(f"✗ Error: {e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,468 @@
+"""
+Request Metrics for Credit Card Vault
+Per-route latency, DB query and template/audit timings in Prometheus text format
+
+Every request records:
+- cardvault_http_request_duration_seconds{endpoint, method, status}
+- cardvault_db_queries_per_request / cardvault_db_time_per_request_seconds{endpoint}
+  (statements timed by db_pool's cursor hook, summed per request)
+- cardvault_template_render_seconds{template} (Flask template signals)
+- cardvault_audit_enqueue_seconds (log_access cost inside the request)
+and the audit flusher records cardvault_audit_write_seconds per batch.
+
+Each gunicorn worker keeps its own registry and writes a snapshot to
+METRICS_DIR every METRICS_FLUSH_INTERVAL seconds, one file per worker
+process. /metrics merges every file with the serving worker's live values,
+so a scrape sees the whole server whichever worker answers it. An exiting
+worker folds its counters and histograms into one archive file and
+removes its own, and files left by killed workers are folded in by the
+next scrape, so totals never go backwards and the directory does not grow
+with max_requests recycling. Gauges only count live workers.
+gunicorn.conf.py clears the directory when the master starts.
+
+/metrics is closed by default: set METRICS_TOKEN to serve it to
+"Authorization: Bearer <token>", or METRICS_PUBLIC=1 to serve it to anyone
+(only behind a network boundary that keeps it internal).
+"""
+
+import atexit
+import fcntl
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from flask import before_render_template, template_rendered
+
+import db_pool
+import local_state
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+METRICS_DIR = os.getenv("METRICS_DIR", local_state.default_path("metrics"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "0") == "1"
+ARCHIVE_FILE = "archive.json"  # counters and histograms of exited workers
+LOCK_FILE = ".lock"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+# name -> (help, buckets)
+HISTOGRAMS = {
+    'cardvault_http_request_duration_seconds': ("Request wall time", LATENCY_BUCKETS),
+    'cardvault_db_queries_per_request': ("Statements executed by one request", QUERY_COUNT_BUCKETS),
+    'cardvault_db_time_per_request_seconds': ("Time one request spent in the database", DB_TIME_BUCKETS),
+    'cardvault_template_render_seconds': ("Jinja template render time", FAST_BUCKETS),
+    'cardvault_audit_enqueue_seconds': ("Time a request spent queueing audit events", FAST_BUCKETS),
+    'cardvault_audit_write_seconds': ("Audit batch INSERT + rollup write time", DB_TIME_BUCKETS),
+}
+COUNTERS = {
+    'cardvault_db_queries_total': "Statements executed on pooled connections",
+    'cardvault_db_query_seconds_total': "Time spent executing statements on pooled connections",
+    'cardvault_audit_events_written_total': "Audit events written to AccessLogs",
+    'cardvault_audit_rollup_errors_total': "Audit batches whose AccessLogRollup update failed",
+}
+GAUGES = {
+    'cardvault_db_pool_connections': "Pooled connections by state (live workers)",
+    'cardvault_audit_queue_depth': "Audit events waiting to be written (live workers)",
+}
+
+BACKGROUND = '(background)'  # endpoint label for statements outside a request
+
+
+class Registry:
+    """One process's histograms and counters; labels are tuples of (name, value) pairs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._counters = {}    # (name, labels) -> value
+
+    def observe(self, name, value, labels=()):
+        buckets = HISTOGRAMS[name][1]
+        index = bisect_left(buckets, value)
+        with self._lock:
+            series = self._histograms.get((name, labels))
+            if series is None:
+                series = self._histograms[(name, labels)] = [0] * (len(buckets) + 2)
+            if index < len(buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def inc(self, name, amount=1, labels=()):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'histograms': [[name, list(labels), list(series)]
+                               for (name, labels), series in self._histograms.items()],
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+            }
+
+
+# ==================== PER-PROCESS STORE ====================
+_registry = None
+_registry_pid = None
+_store_path = None
+_store_lock = threading.Lock()
+_write_lock = threading.Lock()
+_store_warned = False
+
+
+def get_registry():
+    """This process's registry (a fresh one after fork, with its own store file)"""
+    global _registry, _registry_pid, _store_path
+    if _registry_pid == os.getpid():
+        return _registry
+    with _store_lock:
+        if _registry_pid != os.getpid():
+            _registry = Registry()
+            _registry_pid = os.getpid()
+            _store_path = os.path.join(METRICS_DIR, f"worker_{os.getpid()}_{uuid.uuid4().hex[:8]}.json")
+            threading.Thread(target=_flush_loop, name='metrics-flusher', daemon=True).start()
+    return _registry
+
+
+def _gauges():
+    """Pool and audit queue gauges for this process"""
+    import audit_queue  # audit_queue imports this module
+
+    gauges = []
+    for pool in db_pool.pool_stats():
+        for state in ('in_use', 'idle', 'waiting'):
+            gauges.append(['cardvault_db_pool_connections',
+                           [['database', pool['database'] or ''], ['state', state]], pool[state]])
+    audit = audit_queue.audit_stats()
+    if audit is not None:
+        gauges.append(['cardvault_audit_queue_depth', [], audit['depth']])
+    return gauges
+
+
+def _snapshot():
+    data = get_registry().snapshot()
+    data['pid'] = os.getpid()
+    data['gauges'] = _gauges()
+    return data
+
+
+def _write_json(path, data):
+    """Atomic replace, so readers never see a half-written file"""
+    temp_path = f"{path}.tmp"
+    with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def _warn(e):
+    global _store_warned
+    if not _store_warned:
+        print(f"⚠ Metrics not shared across workers ({METRICS_DIR}): {e}")
+        _store_warned = True
+
+
+@contextmanager
+def _dir_lock(exclusive):
+    """flock on METRICS_DIR: scrapes read under a shared lock, archiving takes it exclusively"""
+    fd = os.open(os.path.join(METRICS_DIR, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+    finally:
+        os.close(fd)
+
+
+def write_snapshot():
+    """Write this worker's values to its METRICS_DIR file (atomic replace)"""
+    with _write_lock:
+        if _registry_pid != os.getpid():
+            return  # archived by shutdown()
+        data = _snapshot()
+        try:
+            local_state.private_dir(METRICS_DIR)
+            _write_json(_store_path, data)
+        except OSError as e:
+            _warn(e)
+
+
+def _flush_loop():
+    pid = os.getpid()
+    while _registry_pid == pid:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        write_snapshot()
+
+
+def _archive(paths, extra=()):
+    """
+    Fold worker snapshots (files in paths, plus extra snapshot dicts) into
+    the archive and delete the files; the caller holds the exclusive lock
+    """
+    archive_path = os.path.join(METRICS_DIR, ARCHIVE_FILE)
+    snapshots = list(extra)
+    for path in [archive_path] + list(paths):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    histograms, counters, _ = _merge(snapshots)
+    _write_json(archive_path, {
+        'pid': 0,
+        'histograms': [[name, list(labels), series] for (name, labels), series in histograms.items()],
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'gauges': [],
+    })
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _worker_pid(name):
+    """pid from a 'worker_<pid>_<id>.json' snapshot name (None for other files)"""
+    parts = name.split('_')
+    if len(parts) != 3 or parts[0] != 'worker' or not parts[1].isdigit():
+        return None
+    return int(parts[1])
+
+
+def _archive_dead_workers():
+    """Fold in snapshots of workers that died without shutdown() (SIGKILL, OOM)"""
+    dead = [name for name in os.listdir(METRICS_DIR)
+            if _worker_pid(name) is not None and not _pid_alive(_worker_pid(name))]
+    if not dead:
+        return
+    with _dir_lock(exclusive=True):
+        paths = [os.path.join(METRICS_DIR, name) for name in dead]
+        _archive([path for path in paths if path.endswith('.json')])
+        for path in paths:
+            if path.endswith('.tmp') and os.path.exists(path):
+                os.remove(path)
+
+
+def shutdown():
+    """On worker exit: fold the final values into the archive and remove this worker's file"""
+    global _registry_pid
+    with _write_lock:
+        if _registry_pid != os.getpid():
+            return
+        data = _snapshot()
+        _registry_pid = None  # stops the flusher; nothing of this registry is written again
+        try:
+            local_state.private_dir(METRICS_DIR)
+            with _dir_lock(exclusive=True):
+                _archive([], extra=[data])
+                if os.path.exists(_store_path):
+                    os.remove(_store_path)  # an older copy of data
+        except OSError as e:
+            _warn(e)
+
+
+def clear_store():
+    """Remove snapshots left by a previous server run (gunicorn master start)"""
+    if not os.path.isdir(METRICS_DIR):
+        return
+    for name in os.listdir(METRICS_DIR):
+        if name.startswith('worker_') or name == ARCHIVE_FILE:
+            try:
+                os.remove(os.path.join(METRICS_DIR, name))
+            except OSError:
+                pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """Merged values of every worker: (histograms, counters, gauges) keyed by (name, labels)"""
+    own = _snapshot()
+    snapshots = [own]
+    if os.path.isdir(METRICS_DIR):
+        try:
+            _archive_dead_workers()
+            with _dir_lock(exclusive=False):
+                for name in os.listdir(METRICS_DIR):
+                    path = os.path.join(METRICS_DIR, name)
+                    if path == _store_path or not name.endswith('.json'):
+                        continue
+                    try:
+                        with open(path) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        continue  # removed since listdir
+        except OSError as e:
+            _warn(e)
+    return _merge(snapshots, own)
+
+
+def _merge(snapshots, own=None):
+    """Sum snapshots; gauges only from `own` and live worker processes"""
+    histograms, counters, gauges = {}, {}, {}
+    for data in snapshots:
+        for name, labels, series in data.get('histograms', ()):
+            if name not in HISTOGRAMS:
+                continue
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(series))
+            for i, value in enumerate(series):
+                merged[i] += value
+        for name, labels, value in data.get('counters', ()):
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        if data is own or (data.get('pid') and _pid_alive(data['pid'])):
+            for name, labels, value in data.get('gauges', ()):
+                key = (name, tuple(map(tuple, labels)))
+                gauges[key] = gauges.get(key, 0) + value
+    return histograms, counters, gauges
+
+
+# ==================== EXPOSITION ====================
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(pairs, extra=None):
+    pairs = list(pairs) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def render():
+    """Prometheus text exposition (format 0.0.4) of the merged metrics"""
+    histograms, counters, gauges = collect()
+    lines = []
+
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (series_name, labels), series in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, series):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, ('le', _number(bound)))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, ('le', '+Inf'))} {series[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(series[-2])}")
+            lines.append(f"{name}_count{_labels(labels)} {series[-1]}")
+
+    for kind, family, values in (('counter', COUNTERS, counters), ('gauge', GAUGES, gauges)):
+        for name, help_text in family.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for (series_name, labels), value in sorted(values.items()):
+                if series_name == name:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+# ==================== RECORDING ====================
+def observe(name, value, **labels):
+    """Record one histogram observation (labels as keyword arguments)"""
+    if METRICS_ENABLED:
+        get_registry().observe(name, value, tuple(sorted(labels.items())))
+
+
+def inc(name, amount=1, **labels):
+    if METRICS_ENABLED:
+        get_registry().inc(name, amount, tuple(sorted(labels.items())))
+
+
+def _on_query(statement, params, seconds, rowcount):
+    """db_pool query listener: per-request totals, or counted directly outside requests"""
+    current = g.get('_metrics_request') if has_request_context() else None
+    if current is not None:
+        current[1] += 1
+        current[2] += seconds
+    else:
+        registry = get_registry()
+        labels = (('endpoint', BACKGROUND),)
+        registry.inc('cardvault_db_queries_total', 1, labels)
+        registry.inc('cardvault_db_query_seconds_total', seconds, labels)
+
+
+def _render_started(sender, template, context, **extra):
+    g.setdefault('_metrics_renders', []).append(time.perf_counter())
+
+
+def _render_finished(sender, template, context, **extra):
+    starts = g.get('_metrics_renders')
+    if starts:
+        observe('cardvault_template_render_seconds', time.perf_counter() - starts.pop(),
+                template=template.name or '(string)')
+
+
+def _request_started():
+    g._metrics_request = [time.perf_counter(), 0, 0.0]  # [start, queries, db seconds]
+
+
+def _response_ready(response):
+    g._metrics_status = response.status_code
+    return response
+
+
+def _request_finished(exc=None):
+    current = g.pop('_metrics_request', None)
+    if current is None:
+        return
+    started, queries, db_seconds = current
+    endpoint = request.endpoint or '(unmatched)'
+    status = 500 if exc is not None else g.get('_metrics_status', 500)
+
+    registry = get_registry()
+    registry.observe('cardvault_http_request_duration_seconds', time.perf_counter() - started,
+                     (('endpoint', endpoint), ('method', request.method), ('status', str(status))))
+    labels = (('endpoint', endpoint),)
+    registry.observe('cardvault_db_queries_per_request', queries, labels)
+    registry.observe('cardvault_db_time_per_request_seconds', db_seconds, labels)
+    if queries:
+        registry.inc('cardvault_db_queries_total', queries, labels)
+        registry.inc('cardvault_db_query_seconds_total', db_seconds, labels)
+
+
+def metrics_view():
+    if METRICS_TOKEN:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"):
+            return Response("Unauthorized\n", status=401, mimetype='text/plain')
+    elif not METRICS_PUBLIC:
+        return Response("Set METRICS_TOKEN (or METRICS_PUBLIC=1) to enable /metrics\n",
+                        status=403, mimetype='text/plain')
+    return Response(render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app):
+    """Instrument requests, DB statements and template renders; serve /metrics"""
+    if not METRICS_ENABLED:
+        return
+    # First before_request hook, so auth and rate limiting count towards the request
+    app.before_request_funcs.setdefault(None, []).insert(0, _request_started)
+    app.after_request(_response_ready)
+    app.teardown_request(_request_finished)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+    db_pool.add_query_listener(_on_query)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    atexit.register(shutdown)
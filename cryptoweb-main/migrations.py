@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Schema Migrations for Credit Card Vault
+Ordered, forward-only schema changes tracked in a schema_version table
+
+Each migration is a version number, a description and a list of steps.
+A step is a function that inspects the live schema and returns the SQL
+statements still needed, so a migration interrupted half-way (MySQL DDL
+commits implicitly) can simply be re-run. Index and column changes use
+online DDL (ALGORITHM=INPLACE, LOCK=NONE) and fall back to the server's
+default algorithm only when it refuses the online form.
+
+Usage:
+    python migrations.py              # apply pending migrations
+    python migrations.py --dry-run    # show the SQL that would run
+    python migrations.py --status     # list applied / pending versions
+"""
+
+import argparse
+import time
+
+import mysql.connector
+from mysql.connector import Error, errorcode
+
+from config import db_config
+import access_rollup
+import dashboard_counters
+import log_retention
+import session_store
+import ticket_revocation
+
+ONLINE_DDL = "ALGORITHM=INPLACE, LOCK=NONE"
+
+# Server refused ALGORITHM/LOCK for this particular change
+ONLINE_DDL_UNSUPPORTED = (
+    errorcode.ER_ALTER_OPERATION_NOT_SUPPORTED,
+    errorcode.ER_ALTER_OPERATION_NOT_SUPPORTED_REASON,
+)
+
+
+# ==================== SCHEMA INSPECTION ====================
+def index_exists(cursor, table, name):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, name))
+    return cursor.fetchone()[0] > 0
+
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+# ==================== STEP BUILDERS ====================
+def add_index(table, name, columns):
+    """Online ADD INDEX unless the index already exists"""
+    def step(cursor):
+        if index_exists(cursor, table, name):
+            return []
+        return [f"ALTER TABLE {table} ADD INDEX {name} {columns}, {ONLINE_DDL}"]
+    return step
+
+
+def add_column(table, column, definition):
+    """Online ADD COLUMN unless the column already exists"""
+    def step(cursor):
+        if column_exists(cursor, table, column):
+            return []
+        return [f"ALTER TABLE {table} ADD COLUMN {column} {definition}, {ONLINE_DDL}"]
+    return step
+
+
+def sql(*statements):
+    """Unconditional statements (must be idempotent, e.g. CREATE ... IF NOT EXISTS)"""
+    def step(cursor):
+        return list(statements)
+    return step
+
+
+# ==================== MIGRATIONS ====================
+MIGRATIONS = [
+    (1, "Stored last four digits for card listings", [
+        add_column('CardDetails', 'card_last4', 'CHAR(4) NULL'),
+    ]),
+    (2, "Invoice keyset pagination indexes", [
+        # InnoDB appends the invoice_id primary key to every secondary index
+        add_index('Invoices', 'idx_invoices_date', '(invoice_date)'),
+        add_index('Invoices', 'idx_invoices_merchant_date', '(merchant_id, invoice_date)'),
+        add_index('Invoices', 'idx_invoices_customer_date', '(customer_id, invoice_date)'),
+    ]),
+    (3, "Secondary indexes for hot filters", [
+        add_index('AccessLogs', 'idx_accesslogs_timestamp', '(timestamp)'),
+        add_index('CardDetails', 'idx_carddetails_user_active', '(userid, is_active)'),
+        add_index('Invoices', 'idx_invoices_status', '(status)'),
+    ]),
+    (4, "Incrementally maintained dashboard counters", [
+        sql(*dashboard_counters.TABLES),
+        sql(*dashboard_counters.trigger_statements()),
+        sql(*dashboard_counters.seed_statements()),
+    ]),
+    (5, "Hourly AccessLogs rollup (backfill with access_rollup.py --backfill)", [
+        sql(access_rollup.ROLLUP_TABLE),
+    ]),
+    (6, "Audit browser filter indexes", [
+        add_index('AccessLogs', 'idx_accesslogs_user_ts', '(userid, timestamp)'),
+        add_index('AccessLogs', 'idx_accesslogs_action_ts', '(action, timestamp)'),
+        add_index('AccessLogs', 'idx_accesslogs_ip_ts', '(ip_address, timestamp)'),
+        # An ORDER BY inside the view forced full materialisation on every read
+        sql("""
+            CREATE OR REPLACE VIEW SecurityAuditTrail AS
+            SELECT al.log_id, al.userid, u.role, u.full_name, al.action,
+                   al.table_name, al.record_id, al.ip_address, al.timestamp
+            FROM AccessLogs al
+            LEFT JOIN Users u ON al.userid = u.userid
+        """),
+    ]),
+    (7, "Monthly RANGE partitions on AccessLogs (table rebuild)", [
+        log_retention.partition_statements,
+    ]),
+    (8, "Server-side Sessions table (SESSION_BACKEND=mysql)", [
+        sql(session_store.SESSIONS_TABLE),
+    ]),
+    (9, "RevokedTickets (authoritative ticket revocation list)", [
+        sql(ticket_revocation.REVOKED_TABLE),
+    ]),
+    (10, "Card key_version and key rotation checkpoints", [
+        # 0 = legacy AES_ENCRYPT (or not yet stamped); else the vault_crypto master key id
+        add_column('CardDetails', 'key_version', 'TINYINT UNSIGNED NOT NULL DEFAULT 0'),
+        sql("""
+            CREATE TABLE IF NOT EXISTS KeyRotationCheckpoint (
+                target_key_id TINYINT UNSIGNED PRIMARY KEY,
+                last_id INT NOT NULL DEFAULT 0,
+                rows_done INT NOT NULL DEFAULT 0,
+                rows_failed INT NOT NULL DEFAULT 0,
+                started_at DATETIME NOT NULL,
+                updated_at DATETIME NOT NULL,
+                finished_at DATETIME NULL
+            )
+        """),
+    ]),
+    (11, "AccessLogs event_count (LOGIN_THROTTLED summaries)", [
+        add_column('AccessLogs', 'event_count', 'INT NOT NULL DEFAULT 1'),
+    ]),
+]
+
+
+# ==================== RUNNER ====================
+def ensure_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duration_ms INT NOT NULL
+        )
+    """)
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_version")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def execute_ddl(cursor, statement):
+    """Run one statement, retrying without the online clause if the server rejects it"""
+    try:
+        cursor.execute(statement)
+    except Error as e:
+        if e.errno not in ONLINE_DDL_UNSUPPORTED or ONLINE_DDL not in statement:
+            raise
+        fallback = statement.replace(f", {ONLINE_DDL}", "")
+        print(f"   ⚠ Online DDL not supported here ({e.msg}); running: {fallback}")
+        cursor.execute(fallback)
+
+
+def apply_migrations(conn, dry_run=False, target=None):
+    """
+    Apply pending migrations in order (up to `target` if given)
+    Returns the list of versions applied (or that would be applied)
+    """
+    cursor = conn.cursor()
+    ensure_version_table(cursor)
+    done = applied_versions(cursor)
+    applied = []
+
+    for version, description, steps in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+
+        print(f"{'[dry-run] ' if dry_run else ''}Migration {version}: {description}")
+        started = time.time()
+        for step in steps:
+            for statement in step(cursor):
+                print(f"   {statement}")
+                if not dry_run:
+                    execute_ddl(cursor, statement)
+
+        if not dry_run:
+            duration_ms = int((time.time() - started) * 1000)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description, duration_ms) VALUES (%s, %s, %s)",
+                (version, description, duration_ms)
+            )
+            conn.commit()
+            print(f"   ✓ Applied in {duration_ms} ms")
+        applied.append(version)
+
+    if not applied:
+        print("✓ Schema is up to date")
+    return applied
+
+
+def print_status(conn):
+    cursor = conn.cursor()
+    ensure_version_table(cursor)
+    cursor.execute("SELECT version, applied_at FROM schema_version")
+    done = dict(cursor.fetchall())
+    for version, description, _ in MIGRATIONS:
+        state = f"applied {done[version]}" if version in done else "pending"
+        print(f"  {version:>4}  {description:<50} {state}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply schema migrations')
+    parser.add_argument('--dry-run', action='store_true', help='print SQL without executing it')
+    parser.add_argument('--status', action='store_true', help='show applied and pending migrations')
+    parser.add_argument('--target', type=int, help='stop after this version')
+    args = parser.parse_args()
+
+    try:
+        conn = mysql.connector.connect(**db_config)
+        if args.status:
+            print_status(conn)
+        else:
+            apply_migrations(conn, dry_run=args.dry_run, target=args.target)
+        conn.close()
+        return True
+    except Error as e:
+        print(f"✗ Migration error: {e}")
+        return False
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Keyset (Cursor) Pagination Helpers for Credit Card Vault
+
+Pages are addressed by the (timestamp, id) of the last row seen instead of
+an OFFSET, so with a matching (filter..., timestamp) index every page is a
+bounded index range scan and costs the same at any depth.
+
+Cursors are opaque base64url tokens; clients pass them back unchanged as
+?after=<cursor> (older rows) or ?before=<cursor> (newer rows).
+"""
+
+import base64
+import json
+from datetime import datetime
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """Raised for cursors that were not produced by encode_cursor()"""
+
+
+def encode_cursor(timestamp, row_id):
+    """Encode a (timestamp, id) position as an opaque token"""
+    payload = json.dumps([timestamp.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a token back into (datetime, id)"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, TypeError, json.JSONDecodeError) as e:
+        raise InvalidCursor(f"Invalid page cursor: {token!r}") from e
+
+
+def page_size(value, default=PAGE_SIZE):
+    """Clamp a ?limit= argument to 1..MAX_PAGE_SIZE"""
+    try:
+        size = int(value) if value else default
+    except ValueError:
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_clause(ts_column, id_column, direction):
+    """
+    WHERE fragment and ORDER BY for one keyset step
+
+    direction 'after' walks to older rows (newest-first listing), 'before'
+    walks back to newer rows. The redundant leading range on ts_column keeps
+    the predicate sargable so MySQL uses an index range scan.
+    Takes params (timestamp, timestamp, id).
+    """
+    if direction == 'after':
+        where = f"{ts_column} <= %s AND ({ts_column} < %s OR {id_column} < %s)"
+        order = f"{ts_column} DESC, {id_column} DESC"
+    else:
+        where = f"{ts_column} >= %s AND ({ts_column} > %s OR {id_column} > %s)"
+        order = f"{ts_column} ASC, {id_column} ASC"
+    return where, order
+
+
+def build_page(rows, limit, direction, ts_key, id_key):
+    """
+    Trim the limit+1 fetched rows to one page and work out its cursors
+
+    Returns (rows_newest_first, next_cursor, prev_cursor).
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == 'before':
+        rows.reverse()
+
+    if not rows:
+        return rows, None, None
+
+    first, last = rows[0], rows[-1]
+    if direction == 'before':
+        next_cursor = encode_cursor(last[ts_key], last[id_key])
+        prev_cursor = encode_cursor(first[ts_key], first[id_key]) if has_more else None
+    else:
+        next_cursor = encode_cursor(last[ts_key], last[id_key]) if has_more else None
+        prev_cursor = encode_cursor(first[ts_key], first[id_key]) if direction == 'after' else None
+    return rows, next_cursor, prev_cursor
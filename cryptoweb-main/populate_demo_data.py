@@ -8,6 +8,9 @@ import mysql.connector
 from datetime import datetime, timedelta
 import random
 
+import storage
+import vault_crypto
+
 # Database Configuration
 db_config = {
     'host': 'localhost',
@@ -17,9 +20,6 @@ db_config = {
     'charset': 'utf8mb4'
 }
 
-# AES Encryption Key (same as in app.py)
-AES_KEY = "my-secure-aes-key-2024"
-
 # Realistic demo data
 DEMO_CUSTOMERS = [
     {
@@ -236,7 +236,7 @@ INVOICE_DESCRIPTIONS = [
 def populate_database():
     """Populate database with realistic demo data"""
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = storage.connect(db_config)
         cursor = conn.cursor()
         
         print("=" * 70)
@@ -280,22 +280,25 @@ def populate_database():
         print(f"\n   Total new merchants added: {merchant_count}")
         
         # 3. Add credit cards for customers
-        print("\n3. Adding credit cards (AES encrypted)...")
+        print("\n3. Adding credit cards (AES-GCM envelope encrypted)...")
         card_count = 0
         card_ids = []
+        data_keys = vault_crypto.DataKeyBatch()  # one wrapped data key for the whole batch
         for customer in DEMO_CUSTOMERS:
             for card in customer['cards']:
                 try:
+                    key = data_keys.next_key()
                     cursor.execute("""
                         INSERT INTO CardDetails 
                         (userid, card_number, cvv, card_holder_name, expiry_month, 
-                         expiry_year, billing_address, card_type, is_default)
-                        VALUES (%s, AES_ENCRYPT(%s, %s), AES_ENCRYPT(%s, %s), 
-                                %s, %s, %s, %s, %s, %s)
-                    """, (customer['userid'], card['card_number'], AES_KEY,
-                          card['cvv'], AES_KEY, card['holder'], 
+                         expiry_year, billing_address, card_type, is_default, card_last4,
+                         key_version)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """, (customer['userid'], key.encrypt(card['card_number'], 'card_number'),
+                          key.encrypt(card['cvv'], 'cvv'), card['holder'], 
                           card['exp_month'], card['exp_year'],
-                          card['address'], card['card_type'], card['is_default']))
+                          card['address'], card['card_type'], card['is_default'],
+                          card['card_number'][-4:], key.master_key_id))
                     card_id = cursor.lastrowid
                     card_ids.append((card_id, customer['userid']))
                     card_count += 1
@@ -0,0 +1,265 @@
+"""
+Login Throttling for Credit Card Vault
+Token buckets per client IP and per userid, checked before any MySQL work
+
+Each login POST takes one token from the caller's IP bucket, provided the
+bucket of the userid it names still has one. When either is empty the
+request is answered with 429 (and Retry-After) straight from memory: no
+credential query, no audit INSERTs, and neither bucket is charged. The
+userid bucket is only charged for failed logins (login_failed()), so a
+client hammering someone else's userid runs out of its own IP budget
+without locking that user out of their correct password.
+
+Buckets live in process memory by default. RATE_LIMIT_BACKEND=sqlite keeps
+them in a local SQLite file instead so all gunicorn workers on the host
+share one budget.
+
+Rejections are not audited one by one. They are counted per bucket and
+written every RATE_LIMIT_SUMMARY_INTERVAL seconds as one LOGIN_THROTTLED
+AccessLogs event per bucket, with the rejection count in event_count: a
+userid bucket sets userid, an IP bucket sets ip_address, and the overflow
+row past MAX_SUMMARY_KEYS sets neither. The audit flusher thread checks
+the interval, so a quiet worker still writes its counts once an attack
+stops.
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import request, render_template
+
+import local_state
+from audit_queue import get_audit_queue
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # 'memory' or 'sqlite'
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", local_state.default_path("ratelimit.db"))
+# capacity/period: a burst of `capacity` attempts, refilled evenly over `period` seconds
+LOGIN_RATE_IP = os.getenv("LOGIN_RATE_IP", "20/60")
+LOGIN_RATE_USER = os.getenv("LOGIN_RATE_USER", "5/60")
+RATE_LIMIT_SUMMARY_INTERVAL = float(os.getenv("RATE_LIMIT_SUMMARY_INTERVAL", "60"))
+MAX_SUMMARY_KEYS = 1000      # per interval; the rest are folded into one '*' event
+MEMORY_MAX_BUCKETS = 100000
+
+
+def parse_rate(spec):
+    """'20/60' -> (capacity 20, refill 20/60 tokens per second)"""
+    capacity, period = spec.split('/')
+    return float(capacity), float(capacity) / float(period)
+
+
+class MemoryBuckets:
+    """Per-process buckets: key -> [tokens, updated_at]"""
+
+    def __init__(self, max_buckets=MEMORY_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now, peek=False):
+        """Take one token; returns seconds until one is available (0 = allowed)"""
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if peek:
+                return 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rate
+            if len(self._buckets) > self.max_buckets:
+                self._prune(now)
+            return wait
+
+    def _prune(self, now):
+        # Buckets idle long enough to have refilled carry no state worth keeping
+        idle = [key for key, (_, updated) in self._buckets.items() if now - updated > 3600]
+        for key in idle:
+            del self._buckets[key]
+        if len(self._buckets) > self.max_buckets:
+            self._buckets.clear()
+
+
+class SQLiteBuckets:
+    """Host-wide buckets in a SQLite file shared by all workers"""
+
+    def __init__(self, path=RATE_LIMIT_SQLITE_PATH):
+        self.path = local_state.private_file(path)
+        self._local = threading.local()
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._takes = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def take(self, key, capacity, rate, now, peek=False):
+        conn = self._conn()
+        if peek:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = min(capacity, row[0] + (now - row[1]) * rate) if row else capacity
+            return 0.0 if tokens >= 1 else (1 - tokens) / rate
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                         (key, tokens, now))
+            self._takes += 1
+            if self._takes % 1000 == 0:
+                conn.execute("DELETE FROM buckets WHERE updated_at < ?", (now - 3600,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class LoginThrottle:
+    """IP + userid token buckets with aggregated rejection auditing"""
+
+    def __init__(self, db_config, backend, ip_rate=LOGIN_RATE_IP, user_rate=LOGIN_RATE_USER,
+                 summary_interval=RATE_LIMIT_SUMMARY_INTERVAL):
+        self.db_config = db_config
+        self.backend = backend
+        self.ip_rate = parse_rate(ip_rate)
+        self.user_rate = parse_rate(user_rate)
+        self.summary_interval = summary_interval
+
+        self._lock = threading.Lock()
+        self._rejections = Counter()   # (kind, value) -> count since the last summary
+        self._next_summary = time.time() + summary_interval
+        self._queue = None
+        self.allowed = 0
+        self.rejected = 0
+
+    def check(self, ip_address, userid):
+        """
+        Returns seconds to wait (0 = allowed). Only an allowed attempt is
+        charged, and only to the IP bucket; see login_failed()
+        """
+        now = time.time()
+        wait, rejected_by = 0.0, None
+        if userid:
+            capacity, rate = self.user_rate
+            wait = self.backend.take(f"user:{userid.lower()}", capacity, rate, now, peek=True)
+            if wait:
+                rejected_by = ('user', userid.lower())
+        if not wait:
+            capacity, rate = self.ip_rate
+            wait = self.backend.take(f"ip:{ip_address or '-'}", capacity, rate, now)
+            if wait:
+                rejected_by = ('ip', ip_address or '-')
+
+        with self._lock:
+            if rejected_by:
+                self.rejected += 1
+                self._rejections[rejected_by] += 1
+            else:
+                self.allowed += 1
+        if rejected_by and self._queue is not None:
+            self._queue.start()  # its flusher writes the summary; see attach()
+        return wait
+
+    def login_failed(self, userid):
+        """Charge the userid bucket for a failed login"""
+        if userid:
+            capacity, rate = self.user_rate
+            self.backend.take(f"user:{userid.lower()}", capacity, rate, time.time())
+
+    def attach(self, queue):
+        """Write summaries from queue's flusher thread every summary_interval"""
+        self._queue = queue
+        queue.add_tick(self.flush_if_due)
+
+    def flush_if_due(self):
+        with self._lock:
+            due = time.time() >= self._next_summary
+        return self.flush_summary() if due else 0
+
+    def flush_summary(self):
+        """Queue one LOGIN_THROTTLED event per throttled bucket"""
+        with self._lock:
+            rejections, self._rejections = self._rejections, Counter()
+            self._next_summary = time.time() + self.summary_interval
+        if not rejections:
+            return 0
+
+        now = datetime.now()
+        queue = self._queue or get_audit_queue(self.db_config)
+        top = rejections.most_common(MAX_SUMMARY_KEYS)
+        overflow = sum(rejections.values()) - sum(count for _, count in top)
+        for (kind, value), count in top:
+            userid, ip_address = (value, None) if kind == 'user' else (None, value)
+            # Same tuple layout as audit_queue.record(), counting `count` rejections
+            queue.enqueue((userid, 'LOGIN_THROTTLED', None, None, ip_address, None, now, count))
+        if overflow:
+            queue.enqueue((None, 'LOGIN_THROTTLED', None, None, None, None, now, overflow))
+        return len(top) + bool(overflow)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': type(self.backend).__name__,
+                'allowed': self.allowed,
+                'rejected': self.rejected,
+                'pending_summary_keys': len(self._rejections)
+            }
+
+
+_throttle = None
+
+
+def throttle_stats():
+    """Throttle counters (None before init_app)"""
+    return _throttle.stats() if _throttle is not None else None
+
+
+def login_failed(userid):
+    """Count a failed login against userid's bucket (call from the login view)"""
+    if _throttle is not None:
+        _throttle.login_failed(userid)
+
+
+def init_app(app, db_config, endpoints=('login',)):
+    """Throttle POSTs to endpoints before their view (and any DB access) runs"""
+    global _throttle
+    backend = SQLiteBuckets() if RATE_LIMIT_BACKEND == 'sqlite' else MemoryBuckets()
+    _throttle = LoginThrottle(db_config, backend)
+    _throttle.attach(get_audit_queue(db_config))
+    atexit.register(_throttle.flush_summary)
+    endpoints = set(endpoints)
+
+    @app.before_request
+    def throttle_login():
+        if request.method != 'POST' or request.endpoint not in endpoints:
+            return None
+        wait = _throttle.check(request.remote_addr, request.form.get('userid', '').strip())
+        if not wait:
+            return None
+        retry_after = max(1, int(wait + 0.999))
+        return (render_template('login.html', throttled=retry_after), 429,
+                {'Retry-After': str(retry_after)})
+
+    return _throttle
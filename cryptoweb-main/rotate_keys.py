@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Master Key Rotation for Credit Card Vault
+Moves every CardDetails row onto the active vault_crypto master key
+
+Rotation procedure:
+    1. Put the new key first in VAULT_MASTER_KEYS, keeping the old one:
+           VAULT_MASTER_KEYS="2:<new base64 key>,1:<old base64 key>"
+       and restart the app. New cards are written under key 2, and reads
+       keep working for both keys: every stored value names the master key
+       that wrapped its data key, so no trial decryption is needed.
+    2. Run this job. Envelope rows only get their data key re-wrapped (the
+       card ciphertext is reused); legacy AES_ENCRYPT rows are decrypted
+       with AES_KEY and re-encrypted as envelopes. Each row's key_version
+       column records the master key it is on.
+    3. When the job reports 0 rows left, drop the old key from
+       VAULT_MASTER_KEYS.
+
+The table is processed in primary-key chunks by a pool of worker threads,
+one short transaction per chunk. Progress is checkpointed in
+KeyRotationCheckpoint (the highest id below which every chunk is done), so
+an interrupted run resumes from there. Updates are conditional on the
+row's old key_version, so re-processing a chunk is harmless.
+
+Usage:
+    python rotate_keys.py [--workers 4] [--chunk-size 500] [--max-rate 2000]
+    python rotate_keys.py --status
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+import mysql.connector
+from mysql.connector import Error
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config import db_config
+from migrations import apply_migrations
+import vault_crypto
+
+REPORT_INTERVAL = 5  # seconds between progress lines
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return '--:--'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class Rotator:
+    """Re-keys id ranges of CardDetails onto one target master key"""
+
+    def __init__(self, target_key_id, records_per_key=1000, pause=0.0):
+        self.target = target_key_id
+        self.records_per_key = records_per_key
+        self.pause = pause
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = mysql.connector.connect(**db_config)
+            self._local.conn = conn
+            self._local.data_keys = vault_crypto.DataKeyBatch(self.records_per_key)
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def rekey(self, card_number, cvv):
+        """New (card_number, cvv) values under the target key"""
+        if vault_crypto.key_id_of(card_number):
+            return vault_crypto.rewrap(card_number, self.target), vault_crypto.rewrap(cvv, self.target)
+        # Legacy row: both fields under one data key, shared across the chunk
+        key = self._local.data_keys.next_key()
+        return (key.encrypt(vault_crypto.decrypt(card_number, 'card_number'), 'card_number'),
+                key.encrypt(vault_crypto.decrypt(cvv, 'cvv'), 'cvv'))
+
+    def process_chunk(self, low, high):
+        """Rotate ids in (low, high]; returns (rows rotated, rows failed)"""
+        conn = self._conn()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, card_number, cvv, key_version FROM CardDetails
+            WHERE id > %s AND id <= %s AND key_version <> %s
+        """, (low, high, self.target))
+        updates, failed = [], 0
+        for card_id, card_number, cvv, key_version in cursor.fetchall():
+            try:
+                new_number, new_cvv = self.rekey(card_number, cvv)
+            except vault_crypto.VaultCryptoError as e:
+                failed += 1
+                print(f"   ⚠ Card {card_id}: {e}")
+                continue
+            updates.append((new_number, new_cvv, self.target, card_id, key_version))
+
+        if updates:
+            cursor.executemany("""
+                UPDATE CardDetails SET card_number = %s, cvv = %s, key_version = %s
+                WHERE id = %s AND key_version = %s
+            """, updates)
+        conn.commit()
+        cursor.close()
+        if self.pause:
+            time.sleep(self.pause)
+        return len(updates), failed
+
+    def close(self):
+        for conn in self._connections:
+            try:
+                conn.close()
+            except Error:
+                pass
+
+
+# ==================== CHECKPOINTS ====================
+def load_checkpoint(cursor, target_key_id):
+    cursor.execute("""
+        SELECT last_id, rows_done, rows_failed, finished_at FROM KeyRotationCheckpoint
+        WHERE target_key_id = %s
+    """, (target_key_id,))
+    return cursor.fetchone()
+
+
+def save_checkpoint(conn, target_key_id, last_id, rows_done, rows_failed, finished=False):
+    cursor = conn.cursor()
+    now = datetime.now()
+    cursor.execute("""
+        INSERT INTO KeyRotationCheckpoint
+            (target_key_id, last_id, rows_done, rows_failed, started_at, updated_at, finished_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE last_id = VALUES(last_id), rows_done = VALUES(rows_done),
+            rows_failed = VALUES(rows_failed), updated_at = VALUES(updated_at),
+            finished_at = VALUES(finished_at)
+    """, (target_key_id, last_id, rows_done, rows_failed, now, now, now if finished else None))
+    conn.commit()
+    cursor.close()
+
+
+def chunk_bounds(cursor, start_id, chunk_size):
+    """Yield (low, high] id ranges of at most chunk_size rows, in id order"""
+    low = start_id
+    while True:
+        cursor.execute("""
+            SELECT MAX(id) FROM (
+                SELECT id FROM CardDetails WHERE id > %s ORDER BY id LIMIT %s
+            ) chunk
+        """, (low, chunk_size))
+        high = cursor.fetchone()[0]
+        if high is None:
+            return
+        yield low, high
+        low = high
+
+
+# ==================== JOB ====================
+def rotate(workers=4, chunk_size=500, max_rate=0.0, pause=0.0, restart=False):
+    """Rotate all cards onto the active master key; returns rows rotated"""
+    target = vault_crypto.ACTIVE_MASTER_KEY_ID
+    rotator = Rotator(target, pause=pause)
+    try:
+        conn = mysql.connector.connect(**db_config)
+        apply_migrations(conn, target=10)
+        cursor = conn.cursor(buffered=True)  # shared with checkpoint writes
+
+        checkpoint = None if restart else load_checkpoint(cursor, target)
+        if checkpoint and checkpoint[3] is None:
+            start_id, done, failed = checkpoint[0], checkpoint[1], checkpoint[2]
+            print(f"Resuming rotation to key {target} after id {start_id} ({done} rows already done)")
+        else:
+            start_id, done, failed = 0, 0, 0
+            save_checkpoint(conn, target, 0, 0, 0)
+
+        cursor.execute("SELECT COUNT(*) FROM CardDetails WHERE id > %s AND key_version <> %s",
+                       (start_id, target))
+        pending = cursor.fetchone()[0]
+        if not pending:
+            save_checkpoint(conn, target, start_id, done, failed, finished=True)
+            print(f"✓ Nothing to rotate - every card is on key {target}")
+            conn.close()
+            return 0
+
+        print(f"Rotating {pending} cards to master key {target} "
+              f"({workers} workers, chunk {chunk_size}"
+              f"{f', max {max_rate:.0f} rows/s' if max_rate else ''})...")
+
+        started = time.time()
+        rotated = 0
+        next_report = started + REPORT_INTERVAL
+        next_submit = started  # max_rate: earliest time the next chunk may be submitted
+        in_flight = {}     # future -> (low, high)
+        finished = {}      # low -> high for chunks done out of order
+        checkpoint_id = start_id
+
+        def drain(block):
+            nonlocal rotated, failed, checkpoint_id
+            if not in_flight:
+                return
+            ready, _ = wait(list(in_flight), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in ready:
+                low, high = in_flight.pop(future)
+                chunk_rotated, chunk_failed = future.result()
+                rotated += chunk_rotated
+                failed += chunk_failed
+                finished[low] = high
+            # The checkpoint only moves past chunks with no unfinished chunk below them
+            advanced = False
+            while checkpoint_id in finished:
+                checkpoint_id = finished.pop(checkpoint_id)
+                advanced = True
+            if advanced:
+                save_checkpoint(conn, target, checkpoint_id, done + rotated, failed)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for low, high in chunk_bounds(cursor, start_id, chunk_size):
+                while len(in_flight) >= workers * 2:
+                    drain(block=True)
+                drain(block=False)
+
+                # Throttle at submit time: each chunk spends chunk_size rows of the
+                # max_rate budget before it is queued, so the chunks kept in flight
+                # ahead of the workers cannot burst past the cap
+                if max_rate:
+                    delay = next_submit - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_submit = max(next_submit, time.time()) + chunk_size / max_rate
+
+                in_flight[pool.submit(rotator.process_chunk, low, high)] = (low, high)
+
+                now = time.time()
+                if now >= next_report:
+                    rate = rotated / max(now - started, 1e-6)
+                    eta = (pending - rotated) / rate if rate else None
+                    print(f"   ✓ ids <= {checkpoint_id}: {rotated}/{pending} rows "
+                          f"({rate:.0f} rows/s, ETA {format_eta(eta)})")
+                    next_report = now + REPORT_INTERVAL
+
+            while in_flight:
+                drain(block=True)
+
+        save_checkpoint(conn, target, checkpoint_id, done + rotated, failed, finished=not failed)
+        cursor.execute("SELECT COUNT(*) FROM CardDetails WHERE key_version <> %s", (target,))
+        remaining = cursor.fetchone()[0]
+        conn.close()
+
+        elapsed = max(time.time() - started, 1e-6)
+        print(f"\n✓ Rotated {rotated} cards to key {target} in {elapsed:.1f}s "
+              f"({rotated / elapsed:.0f} rows/s)")
+        if failed:
+            print(f"⚠ {failed} cards could not be decrypted and were left on their old key "
+                  "(fix them, then re-run with --restart)")
+        if remaining:
+            print(f"⚠ {remaining} cards are still not on key {target}; keep the old key configured")
+        else:
+            print("✓ Every card is on the new key; older master keys can be retired")
+        return rotated
+
+    except Error as e:
+        print(f"✗ Error: {e}")
+        print("  Re-run the script to resume from the last checkpoint.")
+        return None
+    finally:
+        rotator.close()
+
+
+def print_status():
+    try:
+        conn = mysql.connector.connect(**db_config)
+        cursor = conn.cursor()
+        cursor.execute("SELECT key_version, COUNT(*) FROM CardDetails GROUP BY key_version ORDER BY key_version")
+        print(f"Active master key: {vault_crypto.ACTIVE_MASTER_KEY_ID}")
+        for key_version, count in cursor.fetchall():
+            label = 'legacy AES_ENCRYPT / unstamped' if key_version == 0 else f'key {key_version}'
+            print(f"  {label:<32} {count:>10} cards")
+        cursor.execute("""
+            SELECT target_key_id, last_id, rows_done, rows_failed, updated_at, finished_at
+            FROM KeyRotationCheckpoint ORDER BY target_key_id
+        """)
+        for target, last_id, rows_done, rows_failed, updated_at, finished_at in cursor.fetchall():
+            state = f"finished {finished_at}" if finished_at else f"in progress (updated {updated_at})"
+            print(f"  rotation to key {target}: ids <= {last_id}, {rows_done} done, "
+                  f"{rows_failed} failed, {state}")
+        conn.close()
+    except Error as e:
+        print(f"✗ Error: {e}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rotate CardDetails onto the active master key')
+    parser.add_argument('--workers', type=int, default=4, help='parallel chunk workers')
+    parser.add_argument('--chunk-size', type=int, default=500, help='rows per transaction')
+    parser.add_argument('--max-rate', type=float, default=0.0, help='rows per second cap (0 = unlimited)')
+    parser.add_argument('--pause', type=float, default=0.0, help='seconds each worker sleeps after a chunk')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and scan from the start')
+    parser.add_argument('--status', action='store_true', help='show key versions and checkpoints')
+    args = parser.parse_args()
+    if args.status:
+        print_status()
+    else:
+        rotate(args.workers, args.chunk_size, args.max_rate, args.pause, args.restart)
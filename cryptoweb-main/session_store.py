@@ -0,0 +1,324 @@
+"""
+Server-Side Sessions for Credit Card Vault
+Session data (including the Kerberos TGT) stays on the server; the cookie
+only carries an opaque, random session ID
+
+Two tiers:
+- an in-process LRU of serialized sessions with TTL eviction, so a worker
+  that already holds the current version skips the payload transfer
+- a shared tier every gunicorn worker sees: a local SQLite file (default)
+  or the MySQL Sessions table (SESSION_BACKEND=mysql, migration 8)
+
+Every request checks the shared tier's version for its session ID, so
+clearing a session (logout) or revoke_user_sessions() takes effect on all
+workers immediately. Sessions expire SESSION_TTL seconds (the Kerberos
+TICKET_LIFETIME) after their last write; an idle session is re-written at
+most once per half TTL to slide the expiry.
+"""
+
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+import local_state
+from db_pool import get_connection
+from kerberos_auth import TICKET_LIFETIME
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")  # 'sqlite' or 'mysql'
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", local_state.default_path("sessions.db"))
+SESSION_LRU_SIZE = int(os.getenv("SESSION_LRU_SIZE", "10000"))
+SESSION_TTL = TICKET_LIFETIME
+PURGE_EVERY = 500  # writes between expired-session sweeps
+
+SID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{43}$")
+
+SESSIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS Sessions (
+        sid CHAR(43) PRIMARY KEY,
+        userid VARCHAR(50) NULL,
+        version BIGINT NOT NULL,
+        data MEDIUMBLOB NOT NULL,
+        expires_at DOUBLE NOT NULL,
+        KEY idx_sessions_user (userid),
+        KEY idx_sessions_expires (expires_at)
+    )
+"""
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its server-side ID and version"""
+
+    def __init__(self, initial=None, sid=None, new=False, version=None, expires_at=0.0):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.version = version
+        self.expires_at = expires_at
+        self.modified = False
+        self.rotate = False
+
+
+def regenerate(session):
+    """Issue a fresh session ID on the next save (call after login)"""
+    session.rotate = True
+
+
+# ==================== IN-PROCESS TIER ====================
+class LRUTier:
+    """sid -> (version, payload, expires_at), bounded and TTL-evicted"""
+
+    def __init__(self, maxsize=SESSION_LRU_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                del self._entries[sid]
+                return None
+            self._entries.move_to_end(sid)
+            return entry
+
+    def put(self, sid, version, payload, expires_at):
+        with self._lock:
+            self._entries[sid] = (version, payload, expires_at)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+
+# ==================== SHARED TIERS ====================
+class SQLiteTier:
+    """Shared tier in a local SQLite file (all workers on one host)"""
+
+    def __init__(self, path=SESSION_SQLITE_PATH):
+        self.path = local_state.private_file(path)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                userid TEXT,
+                version INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (userid)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def head(self, sid):
+        return self._conn().execute(
+            "SELECT version, expires_at FROM sessions WHERE sid = ?", (sid,)
+        ).fetchone()
+
+    def load(self, sid):
+        return self._conn().execute(
+            "SELECT version, data, expires_at FROM sessions WHERE sid = ?", (sid,)
+        ).fetchone()
+
+    def store(self, sid, userid, version, payload, expires_at):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (sid, userid, version, data, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (sid, userid, version, payload, expires_at)
+        )
+
+    def delete(self, sid):
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def delete_user(self, userid):
+        conn = self._conn()
+        sids = [row[0] for row in conn.execute("SELECT sid FROM sessions WHERE userid = ?", (userid,))]
+        conn.execute("DELETE FROM sessions WHERE userid = ?", (userid,))
+        return sids
+
+    def purge(self):
+        self._conn().execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+
+
+class MySQLTier:
+    """Shared tier in the MySQL Sessions table (all workers on all hosts)"""
+
+    def __init__(self, db_config):
+        self.db_config = db_config
+
+    def _execute(self, sql, params, fetch=False, commit=False):
+        conn = get_connection(self.db_config)
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        row = cursor.fetchone() if fetch else None
+        if commit:
+            conn.commit()
+        conn.close()
+        return row
+
+    def head(self, sid):
+        return self._execute("SELECT version, expires_at FROM Sessions WHERE sid = %s", (sid,), fetch=True)
+
+    def load(self, sid):
+        row = self._execute("SELECT version, data, expires_at FROM Sessions WHERE sid = %s", (sid,), fetch=True)
+        if row is None:
+            return None
+        version, data, expires_at = row
+        return version, data.decode() if isinstance(data, (bytes, bytearray)) else data, expires_at
+
+    def store(self, sid, userid, version, payload, expires_at):
+        self._execute("""
+            INSERT INTO Sessions (sid, userid, version, data, expires_at) VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE userid = VALUES(userid), version = VALUES(version),
+                data = VALUES(data), expires_at = VALUES(expires_at)
+        """, (sid, userid, version, payload, expires_at), commit=True)
+
+    def delete(self, sid):
+        self._execute("DELETE FROM Sessions WHERE sid = %s", (sid,), commit=True)
+
+    def delete_user(self, userid):
+        conn = get_connection(self.db_config)
+        cursor = conn.cursor()
+        cursor.execute("SELECT sid FROM Sessions WHERE userid = %s", (userid,))
+        sids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM Sessions WHERE userid = %s", (userid,))
+        conn.commit()
+        conn.close()
+        return sids
+
+    def purge(self):
+        self._execute("DELETE FROM Sessions WHERE expires_at < %s LIMIT 1000", (time.time(),), commit=True)
+
+
+# ==================== FLASK INTERFACE ====================
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface backed by LRU + shared tiers"""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, shared, ttl=SESSION_TTL, lru_size=SESSION_LRU_SIZE):
+        self.shared = shared
+        self.ttl = ttl
+        self.lru = LRUTier(lru_size)
+        self._writes = 0
+
+    def _new_session(self):
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not SID_PATTERN.match(sid):
+            return self._new_session()
+
+        now = time.time()
+        cached = self.lru.get(sid)
+        if cached is not None:
+            # One small lookup: is our cached copy still the current version?
+            head = self.shared.head(sid)
+            if head is None or head[1] <= now:
+                self.lru.discard(sid)
+                return self._new_session()
+            if head[0] == cached[0]:
+                version, payload, expires_at = cached
+            else:
+                cached = None
+
+        if cached is None:
+            row = self.shared.load(sid)
+            if row is None or row[2] <= now:
+                return self._new_session()
+            version, payload, expires_at = row
+            self.lru.put(sid, version, payload, expires_at)
+
+        return ServerSession(self.serializer.loads(payload), sid=sid,
+                             version=version, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                # Logout / session.clear(): gone for every worker at once
+                self.shared.delete(session.sid)
+                self.lru.discard(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.rotate and not session.new:
+            self.shared.delete(session.sid)
+            self.lru.discard(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+
+        now = time.time()
+        stale = session.expires_at - now < self.ttl / 2
+        if not (session.modified or session.new or session.rotate or stale):
+            return
+
+        payload = self.serializer.dumps(dict(session))
+        version = secrets.randbits(62)
+        expires_at = now + self.ttl
+        self.shared.store(session.sid, session.get('userid'), version, payload, expires_at)
+        self.lru.put(session.sid, version, payload, expires_at)
+
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            self.shared.purge()
+
+        expires = datetime.fromtimestamp(expires_at) if session.permanent else None
+        response.set_cookie(
+            name, session.sid, expires=expires, httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path, secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+    def stored(self, session):
+        """The shared tier's current copy of session, e.g. as saved by a parallel request"""
+        if session.new:
+            return None
+        row = self.shared.load(session.sid)
+        if row is None or row[2] <= time.time():
+            return None
+        return self.serializer.loads(row[1])
+
+    def revoke_user_sessions(self, userid):
+        """Server-side logout of every session belonging to userid"""
+        sids = self.shared.delete_user(userid)
+        for sid in sids:
+            self.lru.discard(sid)
+        return len(sids)
+
+
+def init_app(app, db_config):
+    """Install the server-side session interface on app"""
+    if SESSION_BACKEND == 'mysql':
+        shared = MySQLTier(db_config)
+    else:
+        shared = SQLiteTier(SESSION_SQLITE_PATH)
+    app.session_interface = ServerSideSessionInterface(shared)
+    return app.session_interface
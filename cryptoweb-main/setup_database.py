@@ -7,9 +7,18 @@ Creates database and all required tables
 import mysql.connector
 from mysql.connector import Error
 
+from migrations import apply_migrations
+import storage
+
 def setup_database():
     """Create database and tables"""
     
+    if storage.STORAGE_BACKEND == 'sqlite':
+        # Embedded database: the whole schema is created on first connect
+        storage.connect(None).close()
+        print(f"✓ SQLite database ready at {storage.STORAGE_SQLITE_PATH}")
+        return
+    
     # Connect without database first
     try:
         conn = mysql.connector.connect(
@@ -58,6 +67,8 @@ def setup_database():
                 is_default BOOLEAN DEFAULT FALSE,
                 is_active BOOLEAN DEFAULT TRUE,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                card_last4 CHAR(4) NULL,
+                key_version TINYINT UNSIGNED NOT NULL DEFAULT 0,
                 FOREIGN KEY (userid) REFERENCES Users(userid) ON DELETE CASCADE
             )
         """)
@@ -94,6 +105,7 @@ def setup_database():
                 ip_address VARCHAR(45),
                 user_agent TEXT,
                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                event_count INT NOT NULL DEFAULT 1,
                 FOREIGN KEY (userid) REFERENCES Users(userid) ON DELETE SET NULL
             )
         """)
@@ -152,7 +164,6 @@ def setup_database():
                 al.timestamp
             FROM AccessLogs al
             LEFT JOIN Users u ON al.userid = u.userid
-            ORDER BY al.timestamp DESC
         """)
         print("✓ Database views created")
         
@@ -194,6 +205,10 @@ def setup_database():
             print(f"\n✓ Database already has {user_count} users")
         
         conn.commit()
+        
+        # Indexes and later schema changes
+        print("\nApplying schema migrations...")
+        apply_migrations(conn)
         conn.close()
         
         print("\n" + "=" * 70)
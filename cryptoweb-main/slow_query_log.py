@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Slow Query Log for Credit Card Vault
+Statements over SLOW_QUERY_MS with their route, row count and EXPLAIN plan
+
+Every statement on a pooled connection is timed by db_pool's cursor hook.
+Statements slower than the threshold are handed to a background thread
+(the request only pays for a queue append), which:
+- normalises the SQL into a fingerprint (literals, placeholders, IN lists
+  and multi-row VALUES collapsed) so repeats of one query group together
+- runs EXPLAIN FORMAT=JSON for SELECT/UPDATE/DELETE statements, at most
+  once per fingerprint every SLOW_QUERY_EXPLAIN_INTERVAL seconds
+  (EXPLAIN QUERY PLAN on the SQLite storage backend)
+- appends one JSON line to the worker's rotating log file
+
+Parameters are used for EXPLAIN only and never written to the log: they
+carry card data and passwords.
+
+Each worker process writes its own file (SLOW_QUERY_LOG with the pid
+before the extension), so size-based rotation never races between
+workers. The report reads all of them, rotated files included.
+
+Usage:
+    python slow_query_log.py [--top 20] [--endpoint dashboard] [--since 2026-10-01]
+    python slow_query_log.py --show <fingerprint id>    # full SQL + latest plan
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from flask import has_request_context, request
+
+import db_pool
+import local_state
+import storage
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", local_state.default_path("slow_queries.log"))
+SLOW_QUERY_LOG_BYTES = int(os.getenv("SLOW_QUERY_LOG_BYTES", str(10 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "5"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1") != "0"
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "600"))
+SLOW_QUERY_QUEUE_SIZE = 1000
+
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+MAX_SQL_CHARS = 4000
+
+
+# ==================== FINGERPRINTS ====================
+_COMMENTS = re.compile(r"/\*.*?\*/|--[^\n]*", re.DOTALL)
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"%s|\?")
+_IN_LIST = re.compile(r"\bin\s*\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES_ROWS = re.compile(r"(\bvalues\s*\([^()]*\))(?:\s*,\s*\([^()]*\))+")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+    """Normalised SQL: the same query with different values maps to one fingerprint"""
+    sql = _COMMENTS.sub(' ', statement)
+    sql = _STRINGS.sub('?', sql)
+    sql = _NUMBERS.sub('?', sql)
+    sql = _PLACEHOLDERS.sub('?', sql)
+    sql = _SPACES.sub(' ', sql).strip().lower()
+    sql = _IN_LIST.sub('in (...)', sql)
+    sql = _VALUES_ROWS.sub(r'\1, ...', sql)
+    return sql
+
+
+def fingerprint_id(fingerprint_sql):
+    return hashlib.sha1(fingerprint_sql.encode()).hexdigest()[:16]
+
+
+# ==================== CAPTURE ====================
+class PrivateRotatingFileHandler(RotatingFileHandler):
+    """Log files (rotated ones included) are created 0600 and must be ours"""
+
+    def _open(self):
+        local_state.private_file(self.baseFilename)
+        return super()._open()
+
+
+class SlowQueryLog:
+    """Background writer: EXPLAIN + log line for each slow statement"""
+
+    def __init__(self, db_config, path=SLOW_QUERY_LOG, threshold_ms=SLOW_QUERY_MS,
+                 explain=SLOW_QUERY_EXPLAIN, explain_interval=SLOW_QUERY_EXPLAIN_INTERVAL):
+        self.db_config = db_config
+        self.path = path
+        self.threshold = threshold_ms / 1000.0
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self._queue = queue.Queue(maxsize=SLOW_QUERY_QUEUE_SIZE)
+        self._explained = {}  # fingerprint id -> time of last EXPLAIN
+        self._logger = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.dropped = 0
+
+    # ---------- request side ----------
+    def on_query(self, statement, params, seconds, rowcount):
+        """db_pool query listener"""
+        if seconds < self.threshold or statement.lstrip()[:7].upper() == 'EXPLAIN':
+            return
+        endpoint = (request.endpoint or '(unmatched)') if has_request_context() else '(background)'
+        if isinstance(params, list):  # executemany: explain the first row
+            params = params[0] if params else ()
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((time.time(), statement, params, seconds, rowcount, endpoint))
+        except queue.Full:
+            self.dropped += 1
+
+    # ---------- writer side ----------
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Threads and file handles do not survive fork; one log file per worker
+            root, ext = os.path.splitext(self.path)
+            handler = PrivateRotatingFileHandler(f"{root}.{os.getpid()}{ext}", maxBytes=SLOW_QUERY_LOG_BYTES,
+                                                 backupCount=SLOW_QUERY_LOG_BACKUPS)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger = logging.getLogger(f"cardvault.slow_query.{os.getpid()}")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            logger.handlers = [handler]
+            self._logger = logger
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='slow-query-log', daemon=True).start()
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            try:
+                self._write(*event)
+            except Exception as e:
+                print(f"Slow query log error: {e}")
+
+    def _explain(self, statement, params):
+        conn = db_pool.get_pool(self.db_config).acquire(timeout=1)
+        try:
+            cursor = conn.cursor()
+            if storage.STORAGE_BACKEND == 'sqlite':
+                cursor.execute("EXPLAIN QUERY PLAN " + statement, params)
+                return [row[-1] for row in cursor.fetchall()]
+            cursor.execute("EXPLAIN FORMAT=JSON " + statement, params)
+            return json.loads(cursor.fetchone()[0])
+        finally:
+            conn.close()
+
+    def _write(self, logged_at, statement, params, seconds, rowcount, endpoint):
+        fingerprint_sql = fingerprint(statement)
+        fid = fingerprint_id(fingerprint_sql)
+        record = {
+            'ts': datetime.fromtimestamp(logged_at).isoformat(timespec='milliseconds'),
+            'fingerprint_id': fid,
+            'fingerprint': fingerprint_sql,
+            'sql': _SPACES.sub(' ', statement).strip()[:MAX_SQL_CHARS],
+            'endpoint': endpoint,
+            'ms': round(seconds * 1000, 2),
+            'rows': rowcount,
+        }
+        if self.explain and fingerprint_sql.split(' ', 1)[0].upper() in EXPLAINABLE \
+                and logged_at - self._explained.get(fid, 0) >= self.explain_interval:
+            self._explained[fid] = logged_at
+            try:
+                record['explain'] = self._explain(statement, params)
+            except Exception as e:
+                record['explain_error'] = str(e)
+        self._logger.info(json.dumps(record, default=str))
+        self.recorded += 1
+
+    def stats(self):
+        return {'threshold_ms': self.threshold * 1000, 'pending': self._queue.qsize(),
+                'recorded': self.recorded, 'dropped': self.dropped}
+
+
+_log = None
+
+
+def slow_query_stats():
+    """Slow query counters (None before init_app)"""
+    return _log.stats() if _log is not None else None
+
+
+def init_app(app, db_config):
+    """Time every pooled statement and log those over SLOW_QUERY_MS"""
+    global _log
+    if SLOW_QUERY_MS <= 0:
+        return None
+    _log = SlowQueryLog(db_config)
+    db_pool.add_query_listener(_log.on_query)
+    return _log
+
+
+# ==================== REPORT ====================
+def read_entries(path=SLOW_QUERY_LOG):
+    """Every record from all workers' log files, rotated ones included"""
+    root, ext = os.path.splitext(path)
+    for log_file in sorted(glob.glob(f"{root}*{ext}*")):
+        with open(log_file) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # torn line from a killed worker
+
+
+def summarize(entries, endpoint=None, since=None):
+    """Per-fingerprint totals, slowest total time first"""
+    groups = {}
+    for entry in entries:
+        if endpoint and entry['endpoint'] != endpoint:
+            continue
+        if since and entry['ts'] < since:
+            continue
+        group = groups.setdefault(entry['fingerprint_id'], {
+            'fingerprint_id': entry['fingerprint_id'], 'fingerprint': entry['fingerprint'],
+            'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'endpoints': set(),
+            'last_seen': '', 'explain': None,
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['ms']
+        group['max_ms'] = max(group['max_ms'], entry['ms'])
+        group['rows'] += entry.get('rows') or 0
+        group['endpoints'].add(entry['endpoint'])
+        if entry['ts'] >= group['last_seen']:
+            group['last_seen'] = entry['ts']
+        if 'explain' in entry:
+            group['explain'] = entry['explain']
+    return sorted(groups.values(), key=lambda g: g['total_ms'], reverse=True)
+
+
+def print_report(groups, top):
+    print("=" * 100)
+    print(f"SLOW QUERIES BY TOTAL TIME ({len(groups)} fingerprints, threshold {SLOW_QUERY_MS:.0f} ms)")
+    print("=" * 100)
+    print(f"{'fingerprint':<18}{'count':>7}{'total ms':>12}{'avg ms':>10}{'max ms':>10}{'avg rows':>10}  endpoints")
+    for group in groups[:top]:
+        print(f"{group['fingerprint_id']:<18}{group['count']:>7}{group['total_ms']:>12.1f}"
+              f"{group['total_ms'] / group['count']:>10.1f}{group['max_ms']:>10.1f}"
+              f"{group['rows'] / group['count']:>10.0f}  {', '.join(sorted(group['endpoints']))}")
+        print(f"   {group['fingerprint'][:95]}")
+    print("=" * 100)
+    if groups:
+        print("Details: python slow_query_log.py --show <fingerprint>")
+
+
+def print_group(groups, fid):
+    for group in groups:
+        if group['fingerprint_id'] == fid:
+            print(f"Fingerprint {fid}: {group['count']} slow executions, "
+                  f"{group['total_ms']:.1f} ms total, last {group['last_seen']}")
+            print(f"Endpoints: {', '.join(sorted(group['endpoints']))}\n")
+            print(group['fingerprint'] + "\n")
+            if group['explain'] is None:
+                print("(no EXPLAIN captured)")
+            else:
+                print(json.dumps(group['explain'], indent=2))
+            return
+    print(f"✗ No slow queries with fingerprint {fid}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rank slow query fingerprints by total time')
+    parser.add_argument('--top', type=int, default=20, help='fingerprints to show')
+    parser.add_argument('--endpoint', help='only statements run by this Flask endpoint')
+    parser.add_argument('--since', help='only entries at or after this ISO date/time')
+    parser.add_argument('--show', metavar='FINGERPRINT', help='full SQL and latest EXPLAIN for one fingerprint')
+    parser.add_argument('--log', default=SLOW_QUERY_LOG, help='log path (as SLOW_QUERY_LOG)')
+    args = parser.parse_args()
+
+    summary = summarize(read_entries(args.log), args.endpoint, args.since)
+    if args.show:
+        print_group(summary, args.show)
+    else:
+        print_report(summary, args.top)
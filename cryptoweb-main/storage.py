@@ -0,0 +1,644 @@
+#!/usr/bin/env python3
+"""
+Storage Backends for Credit Card Vault
+MySQL in production, an embedded SQLite database for benchmarks and CI
+
+STORAGE_BACKEND selects the backend for every connection db_pool hands
+out (and for the scripts that call storage.connect):
+
+    mysql   mysql.connector, the default
+    sqlite  one SQLite file (STORAGE_SQLITE_PATH, ':memory:' for a shared
+            in-memory database), created with the full schema and the
+            default accounts on first use - the app boots in-process with
+            no server
+
+The SQLite connection mimics the parts of the mysql.connector API the app
+uses: %s placeholders, dictionary cursors, buffered results, lastrowid,
+and mysql.connector exception classes (IntegrityError, ...), so route code
+and its error handling do not change. The few MySQL-only constructs in
+runtime SQL are translated once per statement (ON DUPLICATE KEY UPDATE,
+INSERT IGNORE, DELETE ... LIMIT, FOR UPDATE, IF(), DATE_SUB/DATE_ADD with
+INTERVAL, START TRANSACTION), and MySQL-only syntax with no rewrite here
+(information_schema, LOCK IN SHARE MODE, index hints, other date
+functions, ...) raises UntranslatedSQL instead of reaching SQLite, where it
+would fail obscurely or, worse, mean something else. The MySQL functions the app calls are registered as SQLite
+user functions with MySQL's results: SHA2, AES_ENCRYPT/AES_DECRYPT
+(vault_crypto's compatible implementation), NOW, UNIX_TIMESTAMP,
+DATE_FORMAT, DATE_ADD/DATE_SUB, CONCAT, VERSION, DATABASE.
+
+Usage:
+    STORAGE_BACKEND=sqlite python storage.py --init     # create schema + default users
+    STORAGE_BACKEND=sqlite python populate_demo_data.py
+    STORAGE_BACKEND=sqlite gunicorn app:app
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+import mysql.connector
+from mysql.connector import errors
+
+import dashboard_counters
+import local_state
+import vault_crypto
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mysql")  # 'mysql' or 'sqlite'
+STORAGE_SQLITE_PATH = os.getenv("STORAGE_SQLITE_PATH", local_state.default_path("cardvault.sqlite3"))
+
+# Same accounts as setup_database.py
+DEFAULT_USERS = [
+    ('admin', 'admin123', 'admin', 'System Administrator', 'admin@cardvault.com'),
+    ('merchant1', 'merchant123', 'merchant', 'Demo Merchant', 'merchant@demo.com'),
+    ('customer1', 'customer123', 'customer', 'Demo Customer', 'customer@demo.com'),
+    ('auditor1', 'auditor123', 'auditor', 'Demo Auditor', 'auditor@demo.com'),
+]
+
+_NOW_DEFAULT = "(datetime('now', 'localtime'))"  # MySQL CURRENT_TIMESTAMP is session-local time
+
+# SQLite dialect of setup_database.py plus migrations 1-11
+SQLITE_SCHEMA_VERSION = 11  # recorded in schema_version, so migrations.py has nothing to apply
+# Columns added after SQLITE_SCHEMA first shipped; added to older database files on connect
+SQLITE_ADDED_COLUMNS = [
+    ('AccessLogs', 'event_count', 'INT NOT NULL DEFAULT 1'),
+]
+
+SQLITE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS Users (
+        userid VARCHAR(50) PRIMARY KEY,
+        password_hash VARCHAR(64) NOT NULL,
+        role TEXT NOT NULL DEFAULT 'customer' CHECK (role IN ('admin', 'merchant', 'customer', 'auditor')),
+        full_name VARCHAR(100) NOT NULL,
+        email VARCHAR(100) UNIQUE NOT NULL,
+        created_at TIMESTAMP DEFAULT {now},
+        phone VARCHAR(20),
+        last_login TIMESTAMP NULL,
+        is_active BOOLEAN DEFAULT TRUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS CardDetails (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        userid VARCHAR(50) NOT NULL REFERENCES Users(userid) ON DELETE CASCADE,
+        card_number BLOB NOT NULL,
+        cvv BLOB NOT NULL,
+        card_holder_name VARCHAR(100) NOT NULL,
+        expiry_month VARCHAR(2) NOT NULL,
+        expiry_year VARCHAR(4) NOT NULL,
+        billing_address TEXT NOT NULL,
+        card_type TEXT DEFAULT 'visa' CHECK (card_type IN ('visa', 'mastercard', 'amex', 'discover')),
+        is_default BOOLEAN DEFAULT FALSE,
+        is_active BOOLEAN DEFAULT TRUE,
+        created_at TIMESTAMP DEFAULT {now},
+        card_last4 CHAR(4) NULL,
+        key_version INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Invoices (
+        invoice_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        merchant_id VARCHAR(50) NOT NULL REFERENCES Users(userid),
+        customer_id VARCHAR(50) NOT NULL REFERENCES Users(userid),
+        card_id INT REFERENCES CardDetails(id),
+        amount DECIMAL(10,2) NOT NULL,
+        description TEXT,
+        status TEXT DEFAULT 'pending' CHECK (status IN ('pending', 'paid', 'failed', 'refunded')),
+        invoice_date TIMESTAMP DEFAULT {now}
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS AccessLogs (
+        log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        userid VARCHAR(50),
+        action VARCHAR(100) NOT NULL,
+        table_name VARCHAR(50),
+        record_id INT,
+        ip_address VARCHAR(45),
+        user_agent TEXT,
+        timestamp TIMESTAMP DEFAULT {now},
+        event_count INT NOT NULL DEFAULT 1
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_invoices_date ON Invoices (invoice_date)",
+    "CREATE INDEX IF NOT EXISTS idx_invoices_merchant_date ON Invoices (merchant_id, invoice_date)",
+    "CREATE INDEX IF NOT EXISTS idx_invoices_customer_date ON Invoices (customer_id, invoice_date)",
+    "CREATE INDEX IF NOT EXISTS idx_invoices_status ON Invoices (status)",
+    "CREATE INDEX IF NOT EXISTS idx_invoices_card ON Invoices (card_id)",  # InnoDB indexes the FK itself
+    "CREATE INDEX IF NOT EXISTS idx_carddetails_user_active ON CardDetails (userid, is_active)",
+    "CREATE INDEX IF NOT EXISTS idx_accesslogs_timestamp ON AccessLogs (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_accesslogs_user_ts ON AccessLogs (userid, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_accesslogs_action_ts ON AccessLogs (action, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_accesslogs_ip_ts ON AccessLogs (ip_address, timestamp)",
+    """
+    CREATE TABLE IF NOT EXISTS DashboardCounters (
+        counter_name VARCHAR(50) PRIMARY KEY,
+        value DECIMAL(18,2) NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT {now}
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS MerchantStats (
+        merchant_id VARCHAR(50) PRIMARY KEY,
+        total_invoices BIGINT NOT NULL DEFAULT 0,
+        total_amount DECIMAL(18,2) NOT NULL DEFAULT 0,
+        unique_customers INT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS MerchantCustomers (
+        merchant_id VARCHAR(50) NOT NULL,
+        customer_id VARCHAR(50) NOT NULL,
+        invoice_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (merchant_id, customer_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS AccessLogRollup (
+        hour_start DATETIME NOT NULL,
+        action VARCHAR(100) NOT NULL,
+        userid VARCHAR(50) NOT NULL DEFAULT '',
+        event_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour_start, action, userid)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_rollup_user_hour ON AccessLogRollup (userid, hour_start)",
+    """
+    CREATE TABLE IF NOT EXISTS Sessions (
+        sid CHAR(43) PRIMARY KEY,
+        userid VARCHAR(50) NULL,
+        version BIGINT NOT NULL,
+        data BLOB NOT NULL,
+        expires_at DOUBLE NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_sessions_user ON Sessions (userid)",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON Sessions (expires_at)",
+    """
+    CREATE TABLE IF NOT EXISTS RevokedTickets (
+        ticket_id CHAR(32) PRIMARY KEY,
+        userid VARCHAR(50) NULL,
+        reason VARCHAR(50) NOT NULL DEFAULT 'logout',
+        expires_at DATETIME NOT NULL,
+        revoked_at DATETIME NOT NULL DEFAULT {now}
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_revoked_expires ON RevokedTickets (expires_at)",
+    "CREATE INDEX IF NOT EXISTS idx_revoked_at ON RevokedTickets (revoked_at)",
+    """
+    CREATE TABLE IF NOT EXISTS KeyRotationCheckpoint (
+        target_key_id INTEGER PRIMARY KEY,
+        last_id INT NOT NULL DEFAULT 0,
+        rows_done INT NOT NULL DEFAULT 0,
+        rows_failed INT NOT NULL DEFAULT 0,
+        started_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL,
+        finished_at DATETIME NULL
+    )
+    """,
+    """
+    CREATE VIEW IF NOT EXISTS UserRoleSummary AS
+    SELECT role, COUNT(*) as user_count,
+           SUM(CASE WHEN is_active = TRUE THEN 1 ELSE 0 END) as active_users
+    FROM Users GROUP BY role
+    """,
+    """
+    CREATE VIEW IF NOT EXISTS CardStatistics AS
+    SELECT card_type, COUNT(*) as card_count, COUNT(DISTINCT userid) as unique_users
+    FROM CardDetails WHERE is_active = TRUE GROUP BY card_type
+    """,
+    """
+    CREATE VIEW IF NOT EXISTS InvoiceSummary AS
+    SELECT status, COUNT(*) as invoice_count, SUM(amount) as total_amount, AVG(amount) as avg_amount
+    FROM Invoices GROUP BY status
+    """,
+    """
+    CREATE VIEW IF NOT EXISTS SecurityAuditTrail AS
+    SELECT al.log_id, al.userid, u.role, u.full_name, al.action,
+           al.table_name, al.record_id, al.ip_address, al.timestamp
+    FROM AccessLogs al LEFT JOIN Users u ON al.userid = u.userid
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        description VARCHAR(200) NOT NULL,
+        applied_at TIMESTAMP DEFAULT {now},
+        duration_ms INT NOT NULL
+    )
+    """,
+]
+
+
+# ==================== SQLITE FUNCTIONS ====================
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def _format_datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _sha2(value, bits):
+    if value is None:
+        return None
+    digest = {0: hashlib.sha256, 224: hashlib.sha224, 256: hashlib.sha256,
+              384: hashlib.sha384, 512: hashlib.sha512}.get(int(bits))
+    if digest is None:
+        return None
+    data = value if isinstance(value, bytes) else str(value).encode()
+    return digest(data).hexdigest()
+
+
+def _aes_encrypt(value, key):
+    if value is None or key is None:
+        return None
+    return vault_crypto.mysql_aes_encrypt(value, key)
+
+
+def _aes_decrypt(value, key):
+    if value is None or key is None:
+        return None
+    try:
+        return vault_crypto.mysql_aes_decrypt(value, key)
+    except vault_crypto.VaultCryptoError:
+        return None  # MySQL returns NULL for a wrong key
+
+
+def _unix_timestamp(value=None):
+    if value is None:
+        return int(time.time())
+    return int(_as_datetime(value).timestamp())
+
+
+_DATE_FORMAT_CODES = {'%i': '%M', '%s': '%S', '%M': '%B', '%W': '%A', '%h': '%I', '%r': '%I:%M:%S %p',
+                      '%T': '%H:%M:%S', '%e': '%d', '%c': '%m', '%k': '%H', '%l': '%I'}
+
+
+def _date_format(value, fmt):
+    if value is None:
+        return None
+    python_fmt = re.sub(r'%.', lambda m: _DATE_FORMAT_CODES.get(m.group(0), m.group(0)), fmt)
+    return _as_datetime(value).strftime(python_fmt)
+
+
+_INTERVAL_UNITS = {'SECOND': 'seconds', 'MINUTE': 'minutes', 'HOUR': 'hours', 'DAY': 'days', 'WEEK': 'weeks'}
+
+
+def _date_add(value, amount, unit, sign=1):
+    if value is None:
+        return None
+    delta = timedelta(**{_INTERVAL_UNITS[unit.upper()]: sign * float(amount)})
+    return _format_datetime(_as_datetime(value) + delta)
+
+
+def _concat(*values):
+    if any(value is None for value in values):
+        return None
+    return ''.join(value.decode() if isinstance(value, bytes) else str(value) for value in values)
+
+
+def _register_functions(conn, database):
+    functions = [
+        ('SHA2', 2, _sha2), ('AES_ENCRYPT', 2, _aes_encrypt), ('AES_DECRYPT', 2, _aes_decrypt),
+        ('NOW', 0, lambda: _format_datetime(datetime.now())),
+        ('UNIX_TIMESTAMP', 0, _unix_timestamp), ('UNIX_TIMESTAMP', 1, _unix_timestamp),
+        ('DATE_FORMAT', 2, _date_format),
+        ('DATE_ADD', 3, _date_add), ('DATE_SUB', 3, lambda v, n, u: _date_add(v, n, u, sign=-1)),
+        ('CONCAT', -1, _concat),
+        ('VERSION', 0, lambda: f"{sqlite3.sqlite_version}-sqlite"),
+        ('DATABASE', 0, lambda: database),
+    ]
+    for name, arity, fn in functions:
+        conn.create_function(name, arity, fn, deterministic=name in ('SHA2', 'CONCAT'))
+
+
+class _Double(float):
+    """Value read from a DOUBLE/FLOAT column (MySQL returns these as float)"""
+
+
+def _mysql_value(value):
+    # SQLite has no exact decimal type, so SUM/AVG/arithmetic over money come
+    # back as float; MySQL returns Decimal for those (and float only for
+    # DOUBLE columns, which the converter below tags)
+    if type(value) is float:
+        return Decimal(repr(round(value, 6)))
+    return value
+
+
+# Column types the MySQL driver returns as objects rather than strings/floats
+sqlite3.register_converter('DOUBLE', lambda raw: _Double(raw))
+sqlite3.register_converter('FLOAT', lambda raw: _Double(raw))
+sqlite3.register_adapter(datetime, _format_datetime)
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter('TIMESTAMP', lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter('DATETIME', lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter('DECIMAL', lambda raw: Decimal(raw.decode()).quantize(Decimal('0.01')))
+
+
+# ==================== DIALECT ====================
+class UntranslatedSQL(errors.ProgrammingError):
+    """MySQL-only syntax translate() has no SQLite rewrite for"""
+
+
+_DELETE_LIMIT = re.compile(r"^\s*DELETE\s+FROM\s+(\w+)\s+(WHERE\s+.*?)\s+LIMIT\s+(\d+|\?)\s*$",
+                           re.IGNORECASE | re.DOTALL)
+_INTERVAL = re.compile(r",\s*INTERVAL\s+([^\s)]+)\s+(\w+)\s*\)", re.IGNORECASE)
+_EXPLAIN = re.compile(r"^\s*EXPLAIN\s+QUERY\s+PLAN\s+", re.IGNORECASE)
+_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+
+# Checked after translation, outside string literals: anything still here is
+# MySQL syntax the rewrites above do not cover
+_MYSQL_ONLY = [(re.compile(pattern, re.IGNORECASE | re.DOTALL), name) for pattern, name in [
+    (r"\bON\s+DUPLICATE\s+KEY\b", "a second ON DUPLICATE KEY UPDATE"),
+    (r"\bLOCK\s+IN\s+SHARE\s+MODE\b|\bFOR\s+SHARE\b", "LOCK IN SHARE MODE / FOR SHARE"),
+    (r"\bNOWAIT\b|\bSKIP\s+LOCKED\b", "NOWAIT / SKIP LOCKED"),
+    (r"\binformation_schema\s*\.", "information_schema"),
+    (r"@@", "system variables (@@)"),
+    (r"^\s*(SHOW|SET|DELIMITER|LOCK|UNLOCK|TRUNCATE|OPTIMIZE|ANALYZE\s+TABLE)\b", "MySQL statement"),
+    (r"^\s*ALTER\s+TABLE\s+\w+\s+(?!ADD\s+COLUMN\b|RENAME\b)", "ALTER TABLE beyond ADD COLUMN / RENAME"),
+    (r"\bCREATE\s+OR\s+REPLACE\b", "CREATE OR REPLACE"),
+    (r"\b(ALGORITHM|LOCK|ENGINE)\s*=", "table options (ALGORITHM= / LOCK= / ENGINE=)"),
+    (r"\bAUTO_INCREMENT\b|\bUNSIGNED\b|\bON\s+UPDATE\s+CURRENT_TIMESTAMP\b", "MySQL column definition"),
+    (r"\bPARTITION\b", "partitions"),
+    (r"\b(FORCE|USE|IGNORE)\s+(INDEX|KEY)\b|\bSTRAIGHT_JOIN\b", "index hints / STRAIGHT_JOIN"),
+    (r"\bSQL_CALC_FOUND_ROWS\b|\bFOUND_ROWS\s*\(|\bLAST_INSERT_ID\s*\(|\bROW_COUNT\s*\(", "session functions"),
+    (r"\bINTERVAL\b", "INTERVAL outside DATE_ADD/DATE_SUB"),
+    (r"\b(CURDATE|CURTIME|SYSDATE|UTC_TIMESTAMP|UTC_DATE|FROM_UNIXTIME|STR_TO_DATE|TIMESTAMPDIFF|DATEDIFF"
+     r"|YEAR|MONTH|DAY|DAYOFWEEK|WEEK|QUARTER|HOUR|MINUTE|LAST_DAY)\s*\(", "MySQL date function"),
+    (r"\bSEPARATOR\b|\bREGEXP\b|\bRLIKE\b|\bAGAINST\s*\(|\bCONVERT\s*\(|\bBINARY\s", "MySQL operator"),
+    (r"\bCAST\s*\([^)]*\bAS\s+(UNSIGNED|SIGNED|CHAR|DATETIME|DATE)\b", "MySQL CAST type"),
+    (r"\bEND\s+IF\b|\bELSEIF\b", "procedural IF (MySQL trigger body)"),
+    (r"^\s*(UPDATE|DELETE)\b[^()]*\b(LIMIT|ORDER\s+BY)\b", "UPDATE/DELETE with ORDER BY or LIMIT"),
+    (r"^\s*CREATE\s+TABLE\b.*,\s*(UNIQUE\s+)?(KEY|INDEX)\s+\w+\s*\(", "inline KEY in CREATE TABLE"),
+]]
+
+
+def _check_translated(original, sql):
+    code = _LITERAL.sub("''", sql)
+    for pattern, name in _MYSQL_ONLY:
+        if pattern.search(code):
+            raise UntranslatedSQL(msg=f"No SQLite translation for {name} in: {' '.join(original.split())[:200]}")
+
+
+@lru_cache(maxsize=1024)
+def translate(sql):
+    """
+    MySQL statement -> SQLite statement (cached per distinct SQL text)
+    Raises UntranslatedSQL for MySQL-only syntax it cannot rewrite.
+    """
+    match = _EXPLAIN.match(sql)
+    if match:
+        return match.group(0) + translate(sql[match.end():])
+    original = sql
+    sql = sql.replace('%s', '?')
+    # Deferred BEGIN: the first read fixes the snapshot (WAL)
+    sql = re.sub(r"^\s*START\s+TRANSACTION(\s+WITH\s+CONSISTENT\s+SNAPSHOT)?\s*$", "BEGIN", sql,
+                 flags=re.IGNORECASE)
+    sql = re.sub(r"\bINSERT\s+IGNORE\b", "INSERT OR IGNORE", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\s+FOR\s+UPDATE\b", "", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bIF\s*\(", "IIF(", sql)
+    sql = _INTERVAL.sub(r", \1, '\2')", sql)
+
+    parts = re.split(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", sql, maxsplit=1, flags=re.IGNORECASE)
+    if len(parts) == 2:
+        head, update = parts
+        update = re.sub(r"\bVALUES\((\w+)\)", r"excluded.\1", update)
+        sql = f"{head} ON CONFLICT DO UPDATE SET {update}"
+
+    match = _DELETE_LIMIT.match(sql)
+    if match:
+        table, where, limit = match.groups()
+        sql = f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} {where} LIMIT {limit})"
+    _check_translated(original, sql)
+    return sql
+
+
+def _mysql_error(exc):
+    """sqlite3 exception -> the mysql.connector class route code already catches"""
+    if isinstance(exc, sqlite3.IntegrityError):
+        return errors.IntegrityError(msg=str(exc))
+    if isinstance(exc, sqlite3.OperationalError):
+        return errors.OperationalError(msg=str(exc))
+    if isinstance(exc, sqlite3.ProgrammingError):
+        return errors.ProgrammingError(msg=str(exc))
+    return errors.DatabaseError(msg=str(exc))
+
+
+class SQLiteCursor:
+    """Buffered cursor with the mysql.connector surface (dictionary rows optional)"""
+
+    def __init__(self, conn, dictionary=False):
+        self._cursor = conn.cursor()
+        self._dictionary = dictionary
+        self._rows = []
+        self._pos = 0
+        self.rowcount = -1
+        self.lastrowid = None
+        self.description = None
+
+    @property
+    def column_names(self):
+        return tuple(column[0] for column in self.description or ())
+
+    @property
+    def with_rows(self):
+        return self.description is not None
+
+    def _buffer(self):
+        self.description = self._cursor.description
+        self.lastrowid = self._cursor.lastrowid
+        if self.description is None:
+            self._rows = []
+            self.rowcount = self._cursor.rowcount
+        else:
+            rows = [tuple(_mysql_value(value) for value in row) for row in self._cursor.fetchall()]
+            if self._dictionary:
+                names = self.column_names
+                rows = [dict(zip(names, row)) for row in rows]
+            self._rows = rows
+            self.rowcount = len(rows)
+        self._pos = 0
+
+    def execute(self, sql, params=()):
+        try:
+            self._cursor.execute(translate(sql), tuple(params or ()))
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+        self._buffer()
+
+    def executemany(self, sql, seq_params):
+        try:
+            self._cursor.executemany(translate(sql), [tuple(params) for params in seq_params])
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+        self._buffer()
+
+    def fetchone(self):
+        if self._pos >= len(self._rows):
+            return None
+        row = self._rows[self._pos]
+        self._pos += 1
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """sqlite3 connection behind the mysql.connector connection methods the app calls"""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def cursor(self, dictionary=False, buffered=None, **kwargs):
+        return SQLiteCursor(self._raw, dictionary=dictionary)
+
+    @property
+    def in_transaction(self):
+        return self._raw.in_transaction
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def ping(self, reconnect=False, **kwargs):
+        try:
+            self._raw.execute("SELECT 1")
+        except sqlite3.Error as e:
+            raise errors.InterfaceError(msg=str(e)) from e
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        self._raw.close()
+
+
+# ==================== BACKENDS ====================
+class MySQLBackend:
+    name = 'mysql'
+
+    def connect(self, db_config):
+        return mysql.connector.connect(**db_config)
+
+
+class SQLiteBackend:
+    """Embedded database; the schema and default accounts are created on first connect"""
+
+    name = 'sqlite'
+
+    def __init__(self, path=STORAGE_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._ready = False
+        self._keeper = None  # holds a shared in-memory database open
+
+    def _open(self):
+        if self.path == ':memory:':
+            target, uri = 'file:cardvault?mode=memory&cache=shared', True
+        else:
+            target, uri = self.path, False
+        raw = sqlite3.connect(target, uri=uri, timeout=5, check_same_thread=False,
+                              detect_types=sqlite3.PARSE_DECLTYPES)
+        raw.execute("PRAGMA foreign_keys = ON")
+        if not uri:
+            raw.execute("PRAGMA journal_mode = WAL")
+            raw.execute("PRAGMA synchronous = NORMAL")
+        _register_functions(raw, os.path.splitext(os.path.basename(self.path))[0])
+        return raw
+
+    def connect(self, db_config=None):
+        with self._lock:
+            if not self._ready:
+                if self.path != ':memory:':
+                    local_state.private_file(self.path)
+                raw = self._open()
+                self.ensure_schema(raw)
+                if self.path == ':memory:':
+                    self._keeper = raw
+                else:
+                    raw.close()
+                self._ready = True
+        return SQLiteConnection(self._open())
+
+    def ensure_schema(self, raw):
+        """Create every table, index, view and counter trigger; add default users to an empty db"""
+        for statement in SQLITE_SCHEMA:
+            raw.execute(statement.format(now=_NOW_DEFAULT))
+        for table, column, definition in SQLITE_ADDED_COLUMNS:
+            if column not in {row[1] for row in raw.execute(f"PRAGMA table_info({table})")}:
+                raw.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        for statement in dashboard_counters.sqlite_trigger_statements():
+            raw.execute(statement)
+        if raw.execute("SELECT COUNT(*) FROM Users").fetchone()[0] == 0:
+            raw.executemany(
+                "INSERT INTO Users (userid, password_hash, role, full_name, email) VALUES (?, ?, ?, ?, ?)",
+                [(userid, _sha2(password, 256), role, full_name, email)
+                 for userid, password, role, full_name, email in DEFAULT_USERS]
+            )
+        raw.executemany(
+            "INSERT OR IGNORE INTO schema_version (version, description, duration_ms) VALUES (?, ?, 0)",
+            [(version, 'Included in the SQLite schema') for version in range(1, SQLITE_SCHEMA_VERSION + 1)]
+        )
+        if raw.execute("SELECT COUNT(*) FROM DashboardCounters").fetchone()[0] < len(dashboard_counters.COUNTER_QUERIES):
+            for name, query in dashboard_counters.COUNTER_QUERIES.items():
+                raw.execute(f"INSERT OR REPLACE INTO DashboardCounters (counter_name, value) SELECT '{name}', ({query})")
+        raw.commit()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """This process's backend (STORAGE_BACKEND)"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = SQLiteBackend() if STORAGE_BACKEND == 'sqlite' else MySQLBackend()
+        return _backend
+
+
+def connect(db_config):
+    """New raw connection from the configured backend"""
+    return get_backend().connect(db_config)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Storage backend utilities')
+    parser.add_argument('--init', action='store_true', help='create the SQLite schema and default users')
+    args = parser.parse_args()
+    if not args.init:
+        parser.print_help()
+    elif STORAGE_BACKEND != 'sqlite':
+        print("✗ --init is for STORAGE_BACKEND=sqlite; use setup_database.py for MySQL")
+    else:
+        conn = connect(None)
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM Users")
+        print(f"✓ SQLite database ready at {STORAGE_SQLITE_PATH} ({cursor.fetchone()[0]} users)")
+        conn.close()
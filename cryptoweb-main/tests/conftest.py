@@ -0,0 +1,55 @@
+"""
+Shared fixtures: the app on the embedded SQLite backend, no MySQL needed
+
+Settings are read when modules are imported, so the environment is set
+here, before anything imports app.py. Every file the app keeps (database,
+sessions, revocation filter, metrics, slow query log) goes to a throwaway
+state directory.
+"""
+
+import os
+import sys
+import tempfile
+
+STATE_DIR = tempfile.mkdtemp(prefix='cardvault-tests-')
+
+os.environ.update({
+    'STORAGE_BACKEND': 'sqlite',
+    'CARDVAULT_STATE_DIR': STATE_DIR,
+    'REVOCATION_PATH': os.path.join(STATE_DIR, 'revoked.bloom'),
+    'SESSION_BACKEND': 'sqlite',
+    'RATE_LIMIT_BACKEND': 'memory',
+    'SLOW_QUERY_MS': '0',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+CLIENT_IP = '127.0.0.1'
+
+
+@pytest.fixture(scope='session')
+def app():
+    import app as cardvault
+    cardvault.app.config['TESTING'] = True
+    return cardvault.app
+
+
+@pytest.fixture(autouse=True)
+def fresh_login_buckets(app):
+    """Every test starts with full login token buckets"""
+    import rate_limit
+    rate_limit._throttle.backend = rate_limit.MemoryBuckets()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """login(userid, password) -> response of the login POST"""
+    def do_login(userid='admin', password='admin123'):
+        return client.post('/', data={'userid': userid, 'password': password})
+    return do_login
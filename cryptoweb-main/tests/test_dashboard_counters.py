@@ -0,0 +1,80 @@
+from decimal import Decimal
+
+import pytest
+
+import dashboard_counters
+import storage
+
+
+@pytest.fixture
+def conn(app):
+    connection = storage.connect(None)
+    cursor = connection.cursor()
+    cursor.executemany("INSERT INTO Invoices (merchant_id, customer_id, amount, status) VALUES (%s, %s, %s, %s)",
+                       [('merchant1', 'customer1', 10, 'paid'), ('merchant1', 'customer1', 5, 'pending'),
+                        ('merchant1', 'admin', 7, 'paid')])
+    connection.commit()
+    cursor.execute("SELECT MAX(invoice_id) FROM Invoices")
+    last_id = cursor.fetchone()[0]
+    yield connection
+    cursor.execute("DELETE FROM Invoices WHERE invoice_id > %s", (last_id - 3,))
+    connection.commit()
+    connection.close()
+
+
+def _merchant(cursor, merchant_id='merchant1'):
+    cursor.execute("SELECT total_invoices, total_amount, unique_customers FROM MerchantStats WHERE merchant_id = %s",
+                   (merchant_id,))
+    return tuple(cursor.fetchone())
+
+
+def test_triggers_keep_counters_in_step(conn):
+    assert dashboard_counters.reconcile(conn, fix=False) == []
+
+
+def test_reconcile_corrects_drift(conn):
+    cursor = conn.cursor()
+    expected = _merchant(cursor)
+    cursor.execute("SELECT value FROM DashboardCounters WHERE counter_name = 'invoices_total'")
+    invoices_total = cursor.fetchone()[0]
+    # Drift the way a cascade would: base rows change, counters don't
+    cursor.execute("UPDATE DashboardCounters SET value = value + 3 WHERE counter_name = 'invoices_total'")
+    cursor.execute("DELETE FROM DashboardCounters WHERE counter_name = 'revenue_paid'")
+    cursor.execute("UPDATE MerchantStats SET total_invoices = 99, unique_customers = 0 WHERE merchant_id = 'merchant1'")
+    cursor.execute("DELETE FROM MerchantCustomers WHERE merchant_id = 'merchant1' AND customer_id = 'admin'")
+    cursor.execute("INSERT INTO MerchantCustomers (merchant_id, customer_id, invoice_count) "
+                   "VALUES ('merchant1', 'auditor1', 4)")
+    conn.commit()
+
+    found = dashboard_counters.reconcile(conn, fix=False)
+    assert {name for name, _, _ in found} == {'invoices_total', 'revenue_paid', 'merchant:merchant1'}
+
+    fixed = dashboard_counters.reconcile(conn)
+    assert {name for name, _, _ in fixed} == {'invoices_total', 'revenue_paid', 'merchant:merchant1'}
+    assert dashboard_counters.reconcile(conn, fix=False) == []
+
+    cursor.execute("SELECT value FROM DashboardCounters WHERE counter_name = 'invoices_total'")
+    assert cursor.fetchone()[0] == invoices_total
+    assert _merchant(cursor) == expected
+    cursor.execute("SELECT customer_id, invoice_count FROM MerchantCustomers WHERE merchant_id = 'merchant1' "
+                   "ORDER BY customer_id")
+    assert cursor.fetchall() == [('admin', 1), ('customer1', 2)]
+
+
+def test_rebuild_skips_a_merchant_already_in_step(conn):
+    cursor = conn.cursor()
+    assert dashboard_counters._rebuild_merchant(cursor, 'merchant1') is None
+    conn.rollback()
+
+
+def test_rebuild_of_a_merchant_without_invoices(conn):
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO MerchantStats (merchant_id, total_invoices, total_amount, unique_customers) "
+                   "VALUES ('ghost', 2, 20, 1)")
+    conn.commit()
+    before, after = dashboard_counters._rebuild_merchant(cursor, 'ghost')
+    conn.commit()
+    assert before == (2, Decimal('20.00'), 1) and after == (0, 0, 0)
+    assert _merchant(cursor, 'ghost') == (0, 0, 0)
+    cursor.execute("DELETE FROM MerchantStats WHERE merchant_id = 'ghost'")
+    conn.commit()
@@ -0,0 +1,42 @@
+import pytest
+
+import migrations
+import storage
+
+
+@pytest.fixture
+def conn(app):
+    connection = storage.connect(None)
+    yield connection
+    connection.close()
+
+
+def test_sqlite_schema_includes_every_migration():
+    assert storage.SQLITE_SCHEMA_VERSION == max(version for version, _, _ in migrations.MIGRATIONS)
+
+
+def test_apply_migrations_is_a_no_op_on_the_sqlite_schema(conn):
+    assert migrations.apply_migrations(conn) == []
+    assert migrations.apply_migrations(conn) == []
+
+
+def test_apply_migrations_runs_each_version_once(conn, monkeypatch):
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM schema_version WHERE version > 100")
+    conn.commit()
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [
+        (101, "Test table", [migrations.sql("CREATE TABLE IF NOT EXISTS migration_probe (id INT PRIMARY KEY)")]),
+        (102, "Test rows", [migrations.sql("INSERT OR IGNORE INTO migration_probe (id) VALUES (1)")]),
+        (103, "Beyond the target", [migrations.sql("INSERT OR IGNORE INTO migration_probe (id) VALUES (2)")]),
+    ])
+
+    assert migrations.apply_migrations(conn, dry_run=True) == [101, 102, 103]
+    assert migrations.apply_migrations(conn, target=102) == [101, 102]
+    assert migrations.apply_migrations(conn, target=102) == []
+    assert migrations.apply_migrations(conn) == [103]
+    assert migrations.apply_migrations(conn) == []
+
+    cursor.execute("SELECT id FROM migration_probe ORDER BY id")
+    assert [row[0] for row in cursor.fetchall()] == [1, 2]
+    cursor.execute("SELECT version FROM schema_version WHERE version > 100 ORDER BY version")
+    assert [row[0] for row in cursor.fetchall()] == [101, 102, 103]
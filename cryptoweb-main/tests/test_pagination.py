@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import pagination
+import storage
+from pagination import InvalidCursor, build_page, decode_cursor, encode_cursor, keyset_clause, page_size
+
+BASE = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 5, 6, 7, 8, 9, 123456)
+    token = encode_cursor(timestamp, 42)
+    assert '=' not in token
+    assert decode_cursor(token) == (timestamp, 42)
+
+
+@pytest.mark.parametrize('token', ['', 'not-a-cursor', encode_cursor(BASE, 1)[:-3], 'WyJ4IiwxXQ'])
+def test_decode_rejects_foreign_cursors(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token)
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, pagination.PAGE_SIZE),
+    ('', pagination.PAGE_SIZE),
+    ('abc', pagination.PAGE_SIZE),
+    ('10', 10),
+    ('0', 1),
+    ('-5', 1),
+    ('100000', pagination.MAX_PAGE_SIZE),
+])
+def test_page_size_is_clamped(value, expected):
+    assert page_size(value) == expected
+
+
+@pytest.fixture
+def rows(app):
+    """Seven rows, two pairs sharing a timestamp so the id tie-break matters"""
+    conn = storage.connect(None)
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("DROP TABLE IF EXISTS pagination_probe")
+    cursor.execute("CREATE TABLE pagination_probe (id INT PRIMARY KEY, created_at DATETIME)")
+    offsets = [0, 1, 1, 2, 3, 3, 4]
+    cursor.executemany("INSERT INTO pagination_probe (id, created_at) VALUES (%s, %s)",
+                       [(row_id, BASE + timedelta(minutes=m)) for row_id, m in enumerate(offsets, 1)])
+    conn.commit()
+
+    def fetch(direction=None, cursor_token=None, limit=2):
+        where, order = keyset_clause('created_at', 'id', direction or 'after')
+        if cursor_token:
+            ts, row_id = decode_cursor(cursor_token)
+            cursor.execute(f"SELECT id, created_at FROM pagination_probe WHERE {where} ORDER BY {order} LIMIT %s",
+                           (ts, ts, row_id, limit + 1))
+        else:
+            cursor.execute(f"SELECT id, created_at FROM pagination_probe ORDER BY {order} LIMIT %s", (limit + 1,))
+        page, next_cursor, prev_cursor = build_page(cursor.fetchall(), limit, direction, 'created_at', 'id')
+        return [row['id'] for row in page], next_cursor, prev_cursor
+
+    yield fetch
+    cursor.execute("DROP TABLE pagination_probe")
+    conn.commit()
+    conn.close()
+
+
+def test_keyset_walk_visits_every_row_once(rows):
+    ids, token, prev_cursor = rows()
+    assert prev_cursor is None
+    pages = [ids]
+    while token:
+        ids, token, prev_cursor = rows('after', token)
+        assert prev_cursor is not None
+        pages.append(ids)
+    assert pages == [[7, 6], [5, 4], [3, 2], [1]]
+
+
+def test_keyset_walk_back_returns_the_previous_page(rows):
+    _, token, _ = rows()
+    second, token, prev_cursor = rows('after', token)
+    assert second == [5, 4]
+
+    back, next_cursor, newer = rows('before', prev_cursor)
+    assert back == [7, 6]
+    assert newer is None  # nothing newer than the first page
+    assert rows('after', next_cursor)[0] == [5, 4]
+
+
+def test_keyset_clause_directions():
+    where, order = keyset_clause('ts', 'id', 'after')
+    assert where == "ts <= %s AND (ts < %s OR id < %s)"
+    assert order == "ts DESC, id DESC"
+    where, order = keyset_clause('ts', 'id', 'before')
+    assert where == "ts >= %s AND (ts > %s OR id > %s)"
+    assert order == "ts ASC, id ASC"
+
+
+def test_build_page_of_nothing():
+    assert build_page([], 10, 'after', 'ts', 'id') == ([], None, None)
@@ -0,0 +1,150 @@
+import time
+
+import pytest
+
+import rate_limit
+from rate_limit import LoginThrottle, MemoryBuckets, SQLiteBuckets, parse_rate
+
+
+def test_parse_rate():
+    assert parse_rate('20/60') == (20.0, 20.0 / 60)
+
+
+def test_failed_logins_get_429_with_retry_after(login):
+    for _ in range(5):
+        response = login('merchant1', 'wrong-password')
+        assert response.status_code == 200
+        assert b'Too many login attempts' not in response.data
+
+    response = login('merchant1', 'wrong-password')
+    assert response.status_code == 429
+    retry_after = int(response.headers['Retry-After'])
+    assert 1 <= retry_after <= 60
+    assert f'Try again in {retry_after} seconds'.encode() in response.data
+
+    # The right password does not get past an exhausted userid bucket either
+    assert login('merchant1', 'merchant123').status_code == 429
+    # Other accounts from the same address are unaffected
+    assert login('customer1', 'customer123').status_code == 302
+
+
+def test_successful_logins_are_not_charged_to_the_userid(client, login):
+    for _ in range(8):
+        assert login('auditor1', 'auditor123').status_code == 302
+        client.get('/logout')
+
+
+def test_ip_bucket_returns_429(login, monkeypatch):
+    monkeypatch.setattr(rate_limit._throttle, 'ip_rate', parse_rate('2/60'))
+    assert login('admin', 'nope').status_code == 200
+    assert login('customer1', 'nope').status_code == 200
+    response = login('merchant1', 'merchant123')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def throttle(request, tmp_path):
+    backend = MemoryBuckets() if request.param == 'memory' else SQLiteBuckets(str(tmp_path / 'ratelimit.db'))
+    return LoginThrottle(None, backend, ip_rate='2/60', user_rate='3/60', summary_interval=3600)
+
+
+def test_throttled_ip_does_not_drain_the_userid_bucket(throttle):
+    assert throttle.check('10.0.0.1', 'victim') == 0
+    assert throttle.check('10.0.0.1', 'victim') == 0
+    for _ in range(10):
+        assert throttle.check('10.0.0.1', 'victim') > 0
+
+    # The owner, from other addresses, still has every userid token
+    for host in range(2, 5):
+        assert throttle.check(f'10.0.0.{host}', 'Victim') == 0
+        throttle.login_failed('Victim')
+    assert throttle.check('10.0.0.5', 'victim') > 0
+    assert throttle.stats()['rejected'] == 11
+
+
+def test_userid_rejection_does_not_charge_the_ip(throttle):
+    for _ in range(3):
+        throttle.login_failed('victim')
+    for _ in range(5):
+        assert throttle.check('10.0.0.1', 'victim') > 0
+    assert throttle.check('10.0.0.1', 'someone-else') == 0
+    assert throttle.check('10.0.0.1', 'someone-else') == 0
+    assert throttle.check('10.0.0.1', 'someone-else') > 0
+
+
+def test_bucket_refills(throttle):
+    backend = throttle.backend
+    assert backend.take('k', 1, 0.5, now=100.0) == 0
+    assert backend.take('k', 1, 0.5, now=100.0) == pytest.approx(2.0)
+    assert backend.take('k', 1, 0.5, now=101.0, peek=True) == pytest.approx(1.0)
+    assert backend.take('k', 1, 0.5, now=102.0) == 0
+
+
+def test_summary_counts_rejections_in_event_count(app, monkeypatch):
+    import app as cardvault
+    import audit_queue
+    import storage
+
+    queue = audit_queue.AuditQueue(cardvault.db_config, flush_interval=0.05)
+    throttle = LoginThrottle(cardvault.db_config, MemoryBuckets(), ip_rate='1/600', user_rate='5/60',
+                             summary_interval=0.1)
+    throttle.attach(queue)
+    throttle.check('198.51.100.7', 'summary-user')
+    for _ in range(4):
+        assert throttle.check('198.51.100.7', 'summary-user') > 0
+    for _ in range(5):
+        throttle.login_failed('summary-victim')
+    for host in range(1, 3):
+        assert throttle.check(f'198.51.100.{host + 10}', 'summary-victim') > 0
+    assert queue._thread is not None and queue._thread.is_alive()
+
+    # No further login POSTs: the flusher thread writes the summary on its own
+    conn = storage.connect(None)
+    cursor = conn.cursor(dictionary=True)
+    rows = []
+    deadline = time.time() + 5
+    while len(rows) < 2 and time.time() < deadline:
+        time.sleep(0.05)
+        conn.rollback()
+        cursor.execute("""
+            SELECT userid, table_name, record_id, ip_address, user_agent, event_count FROM AccessLogs
+            WHERE action = 'LOGIN_THROTTLED' AND (ip_address = '198.51.100.7' OR userid = 'summary-victim')
+            ORDER BY event_count DESC
+        """)
+        rows = cursor.fetchall()
+    queue.shutdown()
+
+    assert rows == [
+        {'userid': None, 'table_name': None, 'record_id': None, 'ip_address': '198.51.100.7',
+         'user_agent': None, 'event_count': 4},
+        {'userid': 'summary-victim', 'table_name': None, 'record_id': None, 'ip_address': None,
+         'user_agent': None, 'event_count': 2},
+    ]
+    cursor.execute("SELECT SUM(event_count) AS total FROM AccessLogRollup WHERE action = 'LOGIN_THROTTLED'")
+    assert cursor.fetchone()['total'] >= 6
+    conn.close()
+
+
+def test_overflow_summary_row(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'MAX_SUMMARY_KEYS', 1)
+    queued = []
+
+    class Queue:
+        def add_tick(self, callback):
+            pass
+
+        def start(self):
+            pass
+
+        def enqueue(self, event):
+            queued.append(event)
+
+    throttle = LoginThrottle(None, MemoryBuckets(), ip_rate='1/600', user_rate='5/60')
+    throttle.attach(Queue())
+    for ip in ('10.1.0.1', '10.1.0.1', '10.1.0.1', '10.1.0.2', '10.1.0.2', '10.1.0.3', '10.1.0.3'):
+        throttle.check(ip, None)
+    assert throttle.flush_if_due() == 0  # interval not reached yet
+    assert throttle.flush_summary() == 2
+    assert [(event[4], event[7]) for event in queued] == [('10.1.0.1', 2), (None, 2)]
+    assert all(event[1] == 'LOGIN_THROTTLED' and event[3] is None and event[5] is None for event in queued)
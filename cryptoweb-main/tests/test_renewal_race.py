@@ -0,0 +1,106 @@
+import secrets
+import time
+from datetime import datetime
+
+import flask
+import pytest
+
+import auth_middleware
+import ticket_revocation
+from db_pool import get_connection
+from kerberos_auth import KIND_TGT, TGT_SERVICE, KerberosTicket, encode_ticket, parse_ticket
+from tests.conftest import CLIENT_IP
+
+
+@pytest.fixture(autouse=True)
+def logged_out(client):
+    yield
+    client.get('/logout')
+
+
+def _session_ticket(client):
+    with client.session_transaction() as session:
+        return session.get('kerberos_ticket')
+
+
+def _request_with_ticket(app, client, ticket):
+    """
+    Run the auth pipeline as a request that loaded the session while it
+    still held `ticket` (e.g. one in flight in another worker)
+    """
+    sid = client.get_cookie('session').value
+    with app.test_request_context('/dashboard', headers={'Cookie': f'session={sid}'},
+                                  environ_base={'REMOTE_ADDR': CLIENT_IP}):
+        session = flask.session._get_current_object()
+        dict.__setitem__(session, 'kerberos_ticket', ticket)
+        denied = auth_middleware.authenticate_request()
+        app.session_interface.save_session(app, session, app.response_class())
+        return denied, flask.g.principal
+
+
+def test_automatic_renewal_keeps_the_old_ticket_valid(app, client, login):
+    login('merchant1', 'merchant123')
+    now = int(time.time())
+    expiring, _ = encode_ticket(KIND_TGT, 'merchant1', 'merchant', TGT_SERVICE, now - 1700, now + 100, CLIENT_IP)
+    with client.session_transaction() as session:
+        session['kerberos_ticket'] = expiring
+
+    assert client.get('/dashboard').status_code == 200
+    renewed = _session_ticket(client)
+    assert renewed != expiring
+    assert parse_ticket(renewed)['expires_at'] > now + 100
+
+    # A parallel request still carrying the expiring ticket is not logged out
+    with app.app_context():
+        assert KerberosTicket.validate_ticket(expiring, CLIENT_IP)[0] is True
+    denied, principal = _request_with_ticket(app, client, expiring)
+    assert denied is None and principal['userid'] == 'merchant1'
+    assert client.get('/dashboard').status_code == 200
+
+
+def test_request_racing_a_manual_renewal_uses_the_new_ticket(app, client, login):
+    login('customer1', 'customer123')
+    old = _session_ticket(client)
+    client.post('/renew-ticket')
+    new = _session_ticket(client)
+    assert new != old
+    with app.app_context():
+        assert KerberosTicket.validate_ticket(old, CLIENT_IP) == (False, "Ticket revoked")
+
+    denied, principal = _request_with_ticket(app, client, old)
+    assert denied is None
+    assert principal['ticket']['ticket_id'] == parse_ticket(new)['ticket_id']
+    # The shared session survived the stale request
+    assert _session_ticket(client) == new
+    assert client.get('/dashboard').status_code == 200
+
+
+def test_revoked_ticket_without_a_newer_one_clears_the_session(app, client, login):
+    login('auditor1', 'auditor123')
+    ticket = _session_ticket(client)
+    with app.app_context():
+        KerberosTicket.revoke(ticket)
+
+    response = client.get('/dashboard')
+    assert response.status_code == 302
+    assert _session_ticket(client) is None
+
+
+def test_cleared_false_positive_expires(app, monkeypatch):
+    """Another worker's revocation is seen once the cached false positive expires"""
+    monkeypatch.setattr(ticket_revocation, 'REVOCATION_CLEARED_TTL', 0.05)
+    ticket_id, expires_at = secrets.token_hex(16), int(time.time()) + 600
+    ticket_revocation.get_filter().add(ticket_id, expires_at)  # a Bloom hit the table does not confirm
+
+    with app.app_context():
+        assert ticket_revocation.is_revoked(ticket_id, expires_at) is False
+        # Revoked by another worker: table row + Bloom bits, none of this process's caches
+        conn = get_connection(ticket_revocation._db_config)
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO RevokedTickets (ticket_id, userid, reason, expires_at) VALUES (%s, %s, %s, %s)",
+                       (ticket_id, None, 'test', datetime.fromtimestamp(expires_at)))
+        conn.commit()
+        conn.close()
+        assert ticket_revocation.is_revoked(ticket_id, expires_at) is False  # cached, within the TTL
+        time.sleep(0.1)
+        assert ticket_revocation.is_revoked(ticket_id, expires_at) is True
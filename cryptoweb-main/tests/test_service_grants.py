@@ -0,0 +1,96 @@
+import pytest
+
+import kerberos_auth
+import storage
+import vault_crypto
+
+
+@pytest.fixture(autouse=True)
+def logged_out(client):
+    yield
+    client.get('/logout')
+
+
+@pytest.fixture
+def cards(app):
+    """Three of customer1's cards; merchant1 has invoiced the first two"""
+    conn = storage.connect(None)
+    cursor = conn.cursor()
+    ids = []
+    for last4 in ('1111', '2222', '3333'):
+        record = vault_crypto.encrypt_record({'card_number': '411111111111' + last4, 'cvv': '123'})
+        cursor.execute("""
+            INSERT INTO CardDetails (userid, card_number, cvv, card_holder_name, expiry_month,
+                                     expiry_year, billing_address, card_last4)
+            VALUES ('customer1', %s, %s, 'Demo Customer', '12', '2030', '1 Test St', %s)
+        """, (record['card_number'], record['cvv'], last4))
+        ids.append(cursor.lastrowid)
+    for card_id in ids[:2]:
+        cursor.execute("INSERT INTO Invoices (merchant_id, customer_id, card_id, amount) VALUES (%s, %s, %s, %s)",
+                       ('merchant1', 'customer1', card_id, 10))
+    conn.commit()
+    yield ids
+    cursor.execute(f"DELETE FROM Invoices WHERE card_id IN ({', '.join(['%s'] * len(ids))})", ids)
+    cursor.execute(f"DELETE FROM CardDetails WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+    conn.commit()
+    conn.close()
+
+
+def _entry(client):
+    with client.session_transaction() as session:
+        return session['service_tickets']['card-view']
+
+
+def test_merchant_sees_only_invoiced_cards(client, login, cards):
+    login('merchant1', 'merchant123')
+    before = kerberos_auth.service_ticket_stats()
+
+    assert client.get(f'/card-details/{cards[0]}').status_code == 200
+    assert client.get(f'/card-details/{cards[0]}').status_code == 200
+    assert client.get(f'/card-details/{cards[2]}').status_code == 302
+
+    stats = kerberos_auth.service_ticket_stats()
+    assert stats['grant_fallbacks'] - before['grant_fallbacks'] == 2  # one query per card, not per view
+    assert stats['denied'] - before['denied'] == 1
+    assert _entry(client)['checked'] == [cards[0]]
+
+
+def test_grant_cache_answers_without_the_session(client, login, cards):
+    login('merchant1', 'merchant123')
+    assert client.get(f'/card-details/{cards[1]}').status_code == 200
+    # Another worker's copy of the session has not seen the card yet
+    with client.session_transaction() as session:
+        tickets = session['service_tickets']
+        tickets['card-view']['checked'] = []
+        session['service_tickets'] = tickets
+
+    before = kerberos_auth.service_ticket_stats()
+    assert client.get(f'/card-details/{cards[1]}').status_code == 200
+    stats = kerberos_auth.service_ticket_stats()
+    assert stats['grant_cache_hits'] - before['grant_cache_hits'] == 1
+    assert stats['grant_fallbacks'] == before['grant_fallbacks']
+
+
+def test_session_keeps_a_bounded_list(client, login, cards, monkeypatch):
+    monkeypatch.setattr(kerberos_auth, 'SESSION_GRANTS_MAX', 1)
+    login('merchant1', 'merchant123')
+    client.get(f'/card-details/{cards[0]}')
+    client.get(f'/card-details/{cards[1]}')
+    assert _entry(client)['checked'] == [cards[1]]
+
+
+def test_grant_cache_is_capped(monkeypatch):
+    monkeypatch.setattr(kerberos_auth, 'GRANT_CACHE_SIZE', 2)
+    monkeypatch.setattr(kerberos_auth, '_grant_cache', kerberos_auth.OrderedDict())
+    for resource_id in range(3):
+        kerberos_auth._cache_grant('ticket', resource_id)
+    assert not kerberos_auth._grant_cached('ticket', 0)
+    assert kerberos_auth._grant_cached('ticket', 2)
+    assert not kerberos_auth._grant_cached('other-ticket', 2)
+
+
+def test_admin_is_unrestricted(client, login, cards):
+    login('admin', 'admin123')
+    before = kerberos_auth.service_ticket_stats()
+    assert client.get(f'/card-details/{cards[2]}').status_code == 200
+    assert kerberos_auth.service_ticket_stats()['grant_fallbacks'] == before['grant_fallbacks']
@@ -0,0 +1,199 @@
+import ast
+import os
+import re
+
+import pytest
+
+import access_rollup
+import audit_queue
+import dashboard_counters
+import storage
+from storage import UntranslatedSQL, translate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# One row per statement shape the app issues: MySQL in, SQLite out
+SHAPES = [
+    # placeholders, plain DML
+    ("SELECT * FROM Users WHERE userid = %s",
+     "SELECT * FROM Users WHERE userid = ?"),
+    ("UPDATE Users SET password_hash = SHA2(%s, 256) WHERE userid = %s",
+     "UPDATE Users SET password_hash = SHA2(?, 256) WHERE userid = ?"),
+    # INSERT IGNORE
+    ("INSERT IGNORE INTO RevokedTickets (ticket_id, userid, reason, expires_at) VALUES (%s, %s, %s, %s)",
+     "INSERT OR IGNORE INTO RevokedTickets (ticket_id, userid, reason, expires_at) VALUES (?, ?, ?, ?)"),
+    # ON DUPLICATE KEY UPDATE with VALUES() and with plain expressions
+    ("INSERT INTO DashboardCounters (counter_name, value) VALUES (%s, %s) "
+     "ON DUPLICATE KEY UPDATE value = value + VALUES(value)",
+     "INSERT INTO DashboardCounters (counter_name, value) VALUES (?, ?)  "
+     "ON CONFLICT DO UPDATE SET  value = value + excluded.value"),
+    ("INSERT INTO Sessions (sid, data) VALUES (%s, %s) ON DUPLICATE KEY UPDATE data = VALUES(data), hits = hits + 1",
+     "INSERT INTO Sessions (sid, data) VALUES (?, ?)  ON CONFLICT DO UPDATE SET  data = excluded.data, hits = hits + 1"),
+    # FOR UPDATE (SQLite writers are serialised anyway)
+    ("SELECT customer_id FROM MerchantCustomers WHERE merchant_id = %s FOR UPDATE",
+     "SELECT customer_id FROM MerchantCustomers WHERE merchant_id = ?"),
+    # IF() -> IIF()
+    ("SELECT IF(is_active, 1, 0) FROM CardDetails",
+     "SELECT IIF(is_active, 1, 0) FROM CardDetails"),
+    # DATE_SUB / DATE_ADD with INTERVAL
+    ("SELECT COUNT(*) FROM AccessLogs WHERE timestamp >= DATE_SUB(NOW(), INTERVAL 7 DAY)",
+     "SELECT COUNT(*) FROM AccessLogs WHERE timestamp >= DATE_SUB(NOW(), 7, 'DAY')"),
+    ("SELECT DATE_ADD(%s, INTERVAL %s HOUR)",
+     "SELECT DATE_ADD(?, ?, 'HOUR')"),
+    # DELETE ... LIMIT
+    ("DELETE FROM RevokedTickets WHERE expires_at < NOW() LIMIT 1000",
+     "DELETE FROM RevokedTickets WHERE rowid IN (SELECT rowid FROM RevokedTickets WHERE expires_at < NOW() LIMIT 1000)"),
+    ("DELETE FROM Sessions WHERE expires_at < %s LIMIT %s",
+     "DELETE FROM Sessions WHERE rowid IN (SELECT rowid FROM Sessions WHERE expires_at < ? LIMIT ?)"),
+    # transactions
+    ("START TRANSACTION WITH CONSISTENT SNAPSHOT", "BEGIN"),
+    ("START TRANSACTION", "BEGIN"),
+    # EXPLAIN (slow query log) translates the statement it wraps
+    ("EXPLAIN QUERY PLAN SELECT * FROM Invoices WHERE merchant_id = %s FOR UPDATE",
+     "EXPLAIN QUERY PLAN SELECT * FROM Invoices WHERE merchant_id = ?"),
+    # literals are left alone
+    ("SELECT DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00') FROM AccessLogs WHERE action LIKE %s ESCAPE '!'",
+     "SELECT DATE_FORMAT(timestamp, '%Y-%m-%d %H:00:00') FROM AccessLogs WHERE action LIKE ? ESCAPE '!'"),
+    ("SELECT 'lock in share mode' AS note, 'it''s' AS quoted",
+     "SELECT 'lock in share mode' AS note, 'it''s' AS quoted"),
+    # keyset pagination
+    ("SELECT log_id FROM AccessLogs WHERE timestamp <= %s AND (timestamp < %s OR log_id < %s) "
+     "ORDER BY timestamp DESC, log_id DESC LIMIT %s",
+     "SELECT log_id FROM AccessLogs WHERE timestamp <= ? AND (timestamp < ? OR log_id < ?) "
+     "ORDER BY timestamp DESC, log_id DESC LIMIT ?"),
+]
+
+
+@pytest.mark.parametrize('mysql, sqlite', SHAPES)
+def test_translate(mysql, sqlite):
+    assert translate(mysql) == sqlite
+
+
+# MySQL-only syntax with no rewrite: must fail here, not inside SQLite
+UNTRANSLATED = [
+    "SELECT * FROM Users WHERE userid = %s LOCK IN SHARE MODE",
+    "SELECT * FROM Users WHERE userid = %s FOR SHARE",
+    "SELECT * FROM Sessions FOR UPDATE SKIP LOCKED",
+    "SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_NAME = %s",
+    "SELECT @@transaction_isolation",
+    "SHOW TABLES",
+    "SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED",
+    "TRUNCATE TABLE AccessLogs",
+    "ALTER TABLE AccessLogs ADD INDEX idx_x (userid)",
+    "ALTER TABLE AccessLogs ADD COLUMN x INT, ALGORITHM=INPLACE, LOCK=NONE",
+    "ALTER TABLE AccessLogs REORGANIZE PARTITION pmax INTO (PARTITION p1 VALUES LESS THAN (1))",
+    "CREATE OR REPLACE VIEW v AS SELECT 1",
+    "CREATE TABLE t (id INT AUTO_INCREMENT PRIMARY KEY)",
+    "CREATE TABLE t (id INT PRIMARY KEY, userid VARCHAR(50), KEY idx_user (userid))",
+    "CREATE TABLE t (id INT) ENGINE=InnoDB",
+    "SELECT * FROM AccessLogs PARTITION (p202501)",
+    "SELECT * FROM Invoices FORCE INDEX (idx_invoices_date)",
+    "SELECT STRAIGHT_JOIN * FROM Invoices JOIN Users",
+    "SELECT SQL_CALC_FOUND_ROWS * FROM Invoices LIMIT 10",
+    "SELECT LAST_INSERT_ID()",
+    "SELECT * FROM AccessLogs WHERE timestamp > NOW() - INTERVAL 1 DAY",
+    "SELECT * FROM Invoices WHERE invoice_date >= CURDATE()",
+    "SELECT YEAR(invoice_date), MONTH(invoice_date) FROM Invoices",
+    "SELECT DATEDIFF(NOW(), created_at) FROM Users",
+    "SELECT FROM_UNIXTIME(%s)",
+    "SELECT GROUP_CONCAT(userid SEPARATOR ',') FROM Users",
+    "SELECT * FROM Users WHERE email REGEXP %s",
+    "SELECT CAST(amount AS UNSIGNED) FROM Invoices",
+    "SELECT * FROM Users WHERE BINARY userid = %s",
+    "UPDATE CardDetails SET is_active = FALSE WHERE userid = %s LIMIT 10",
+    "DELETE FROM AccessLogs ORDER BY timestamp LIMIT 100",
+    "CREATE TRIGGER t AFTER INSERT ON Users FOR EACH ROW BEGIN IF NEW.is_active THEN SET @x = 1; END IF; END",
+    "INSERT INTO a (x) VALUES (1) ON DUPLICATE KEY UPDATE x = 1 ON DUPLICATE KEY UPDATE x = 2",
+]
+
+
+@pytest.mark.parametrize('mysql', UNTRANSLATED)
+def test_mysql_only_syntax_fails_loudly(mysql):
+    with pytest.raises(UntranslatedSQL, match='No SQLite translation'):
+        translate(mysql)
+
+
+def test_untranslated_sql_is_a_mysql_error(app):
+    from mysql.connector import Error
+    conn = storage.connect(None)
+    try:
+        with pytest.raises(Error):
+            conn.cursor().execute("SELECT * FROM Users LOCK IN SHARE MODE")
+    finally:
+        conn.close()
+
+
+# ---------- every statement the app sends through the SQLite backend ----------
+# Modules whose SQL reaches storage.SQLiteConnection (db_pool / storage.connect)
+RUNTIME_MODULES = [
+    'app.py', 'auth_middleware.py', 'kerberos_auth.py', 'session_store.py', 'ticket_revocation.py',
+    'audit_queue.py', 'access_rollup.py', 'dashboard_counters.py', 'health_checks.py', 'slow_query_log.py',
+    'populate_demo_data.py', 'rotate_keys.py', 'backfill_card_last4.py', 'migrations.py',
+]
+# (module, function) whose SQL only ever runs on MySQL
+MYSQL_ONLY = {
+    ('migrations.py', 'index_exists'),   # migration steps: every version is already in the SQLite schema
+    ('migrations.py', 'column_exists'),
+}
+
+
+def _constant_statements():
+    """(module:line, SQL) for every string literal passed to execute()/executemany()"""
+    found = []
+    for module in RUNTIME_MODULES:
+        tree = ast.parse(open(os.path.join(ROOT, module)).read())
+        for function in [tree] + [n for n in ast.walk(tree) if isinstance(n, ast.FunctionDef)]:
+            name = getattr(function, 'name', None)
+            if (module, name) in MYSQL_ONLY:
+                continue
+            body = function.body if name else [n for n in tree.body if not isinstance(n, ast.FunctionDef)]
+            for node in (child for statement in body for child in ast.walk(statement)):
+                if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                        and node.func.attr in ('execute', 'executemany') and node.args
+                        and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+                    found.append((f"{module}:{node.lineno}", node.args[0].value))
+    return sorted(set(found))
+
+
+def _dynamic_statements():
+    """Statements assembled at runtime, built by the same code the app uses"""
+    statements = [(f"COUNTER_QUERIES[{name}]", query) for name, query in dashboard_counters.COUNTER_QUERIES.items()]
+    statements.append(('audit_queue batch', audit_queue.INSERT_PREFIX + ", ".join([audit_queue.ROW_PLACEHOLDERS] * 3)))
+
+    class Recorder:
+        def execute(self, sql, params=()):
+            statements.append(('access_rollup.record_batch', sql))
+
+    from datetime import datetime
+    access_rollup.record_batch(Recorder(), [('u', 'A', None, None, None, None, datetime.now(), 1),
+                                            (None, 'B', None, None, None, None, datetime.now(), 3)])
+    return statements
+
+
+STATEMENTS = _constant_statements() + _dynamic_statements()
+
+
+def test_sweep_finds_the_app_sql():
+    # Guard against the sweep silently finding nothing
+    assert len(STATEMENTS) > 60
+    assert any('SHA2' in sql for _, sql in STATEMENTS)
+
+
+@pytest.fixture(scope='module')
+def raw(app):
+    conn = storage.connect(None)
+    yield conn._raw
+    conn.close()
+
+
+@pytest.mark.parametrize('where, sql', STATEMENTS, ids=[where for where, _ in STATEMENTS])
+def test_app_statement_compiles_on_sqlite(raw, where, sql):
+    translated = translate(sql)
+    if translated == 'BEGIN':
+        return
+    # EXPLAIN compiles the statement against the real schema without running it
+    raw.execute(f"EXPLAIN {translated}", (None,) * len(re.findall(r"\?", _strip_literals(translated))))
+
+
+def _strip_literals(sql):
+    return storage._LITERAL.sub("''", sql)
@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+import kerberos_auth
+from kerberos_auth import KIND_TGT, TGT_SERVICE, KerberosTicket, TicketError, encode_ticket, parse_ticket
+
+IP = '10.0.0.5'
+
+
+@pytest.fixture(autouse=True)
+def app_context(app):
+    # Revocation checks use the request-scoped connection pool
+    with app.app_context():
+        yield
+
+
+def test_encode_parse_round_trip():
+    now = int(time.time())
+    token, ticket_id = encode_ticket(KIND_TGT, 'merchant1', 'merchant', TGT_SERVICE, now, now + 60, IP)
+    fields = parse_ticket(token)
+    assert fields['userid'] == 'merchant1'
+    assert fields['role'] == 'merchant'
+    assert fields['service'] == TGT_SERVICE
+    assert fields['issued_at'] == now
+    assert fields['expires_at'] == now + 60
+    assert fields['client_address'] == IP
+    assert fields['ticket_id'] == ticket_id
+
+
+def test_tampered_ticket_is_rejected():
+    token = KerberosTicket.generate_ticket('customer1', 'customer', IP)
+    tampered = token[:20] + ('A' if token[20] != 'A' else 'B') + token[21:]
+    with pytest.raises(TicketError):
+        parse_ticket(tampered)
+    with pytest.raises(TicketError):
+        parse_ticket('not-a-ticket')
+
+
+def test_unknown_role_raises_ticket_error():
+    with pytest.raises(TicketError):
+        KerberosTicket.generate_ticket('root', 'superuser', IP)
+
+
+def test_validate_checks_expiry_and_address():
+    now = int(time.time())
+    expired, _ = encode_ticket(KIND_TGT, 'admin', 'admin', TGT_SERVICE, now - 120, now - 60, IP)
+    assert KerberosTicket.validate_ticket(expired, IP)[0] is False
+
+    token = KerberosTicket.generate_ticket('admin', 'admin', IP)
+    assert KerberosTicket.validate_ticket(token, IP) == (True, "Ticket valid")
+    assert KerberosTicket.validate_ticket(token, '10.0.0.6')[0] is False
+    assert KerberosTicket.validate_ticket(None, IP)[0] is False
+
+
+@pytest.mark.parametrize('issued_for, presented_from', [
+    ('10.0.0.5', '::ffff:10.0.0.5'),
+    ('::ffff:10.0.0.5', '10.0.0.5'),
+    ('2001:DB8::1', '2001:db8:0:0::1'),
+])
+def test_address_spellings_match(issued_for, presented_from):
+    token = KerberosTicket.generate_ticket('admin', 'admin', issued_for)
+    assert KerberosTicket.validate_ticket(token, presented_from)[0] is True
+
+
+def test_renew_revokes_the_old_ticket_by_default():
+    old = KerberosTicket.generate_ticket('auditor1', 'auditor', IP)
+    new, _ = KerberosTicket.renew_ticket(old, IP)
+    assert new and new != old
+    assert KerberosTicket.validate_ticket(new, IP)[0] is True
+    assert KerberosTicket.validate_ticket(old, IP) == (False, "Ticket revoked")
+
+
+def test_renew_without_revoking_keeps_the_old_ticket_valid():
+    old = KerberosTicket.generate_ticket('auditor1', 'auditor', IP)
+    new, _ = KerberosTicket.renew_ticket(old, IP, revoke_old=False)
+    assert KerberosTicket.validate_ticket(new, IP)[0] is True
+    assert KerberosTicket.validate_ticket(old, IP)[0] is True
+
+
+def test_revoke():
+    token = KerberosTicket.generate_ticket('customer1', 'customer', IP)
+    assert KerberosTicket.revoke(token) is True
+    assert KerberosTicket.validate_ticket(token, IP) == (False, "Ticket revoked")
+    assert KerberosTicket.revoke('garbage') is False
+
+
+def test_renew_of_a_revoked_ticket_fails():
+    token = KerberosTicket.generate_ticket('customer1', 'customer', IP)
+    KerberosTicket.revoke(token)
+    new, message = KerberosTicket.renew_ticket(token, IP)
+    assert new is None
+    assert message == "Ticket revoked"
+
+
+def test_service_keys_rotation():
+    token = KerberosTicket.generate_ticket('admin', 'admin', IP)
+    keys, active = dict(kerberos_auth.SERVICE_KEYS), kerberos_auth.ACTIVE_KEY_ID
+    try:
+        kerberos_auth.set_service_keys({**keys, 99: b'k' * 32}, 99)
+        assert parse_ticket(token)['userid'] == 'admin'  # old key still verifies
+        kerberos_auth.set_service_keys({99: b'k' * 32}, 99)
+        with pytest.raises(TicketError):
+            parse_ticket(token)
+    finally:
+        kerberos_auth.set_service_keys(keys, active)
@@ -0,0 +1,128 @@
+import pytest
+
+import vault_crypto
+from vault_crypto import VaultCryptoError, decrypt, encrypt, key_id_of, mysql_aes_encrypt, rewrap
+
+CARD = '4111111111111111'
+
+
+@pytest.fixture
+def master_keys():
+    """Swap in keys 1 (active) and 2; the module's own keys come back afterwards"""
+    keys, active = dict(vault_crypto.MASTER_KEYS), vault_crypto.ACTIVE_MASTER_KEY_ID
+    vault_crypto.set_master_keys({1: b'1' * 32, 2: b'2' * 32}, 1)
+    yield
+    vault_crypto.set_master_keys(keys, active)
+
+
+def test_envelope_round_trip(master_keys):
+    blob = encrypt(CARD, 'card_number')
+    assert vault_crypto.is_envelope(blob)
+    assert CARD.encode() not in blob
+    assert key_id_of(blob) == 1
+    assert decrypt(blob, 'card_number') == CARD
+    assert decrypt(bytearray(blob), 'card_number') == CARD
+    assert decrypt(None, 'card_number') is None
+
+
+def test_record_fields_share_one_data_key(master_keys):
+    record = vault_crypto.encrypt_record({'card_number': CARD, 'cvv': '123', 'expiry_date': '12/30'})
+    headers = {blob[:vault_crypto.HEADER.size] for blob in record.values()}
+    assert len(headers) == 1
+    assert {field: decrypt(blob, field) for field, blob in record.items()} == {
+        'card_number': CARD, 'cvv': '123', 'expiry_date': '12/30'}
+
+
+def test_batch_rotates_data_keys(master_keys):
+    batch = vault_crypto.DataKeyBatch(records_per_key=2)
+    keys = [batch.next_key() for _ in range(5)]
+    assert keys[0] is keys[1]
+    assert keys[1] is not keys[2]
+    blobs = [encrypt(str(i), 'cvv', key) for i, key in enumerate(keys)]
+    assert vault_crypto.decrypt_many(blobs, 'cvv') == ['0', '1', '2', '3', '4']
+
+
+def test_legacy_round_trip():
+    blob = mysql_aes_encrypt(CARD)
+    assert len(blob) == 32
+    assert vault_crypto.is_legacy(blob) and not vault_crypto.is_envelope(blob)
+    assert key_id_of(blob) == 0
+    assert decrypt(blob, 'card_number') == CARD
+
+
+def test_legacy_key_is_folded_like_mysql():
+    # MySQL XORs the key into 16 bytes: a 32-byte key of one repeated byte folds to zeros
+    assert mysql_aes_encrypt(CARD, 'a' * 32) == mysql_aes_encrypt(CARD, bytes(16))
+
+
+def test_tampered_envelope_is_rejected(master_keys):
+    blob = bytearray(encrypt(CARD, 'card_number'))
+    blob[-1] ^= 1
+    with pytest.raises(VaultCryptoError, match='Envelope decrypt failed for card_number'):
+        decrypt(bytes(blob), 'card_number')
+
+
+def test_truncated_envelope_is_rejected(master_keys):
+    blob = encrypt(CARD, 'card_number')
+    with pytest.raises(VaultCryptoError, match=r'\(truncated\)'):
+        decrypt(blob[:vault_crypto.HEADER.size + 4], 'card_number')
+
+
+def test_field_is_bound_as_associated_data(master_keys):
+    with pytest.raises(VaultCryptoError, match='Envelope decrypt failed for card_number'):
+        decrypt(encrypt('123', 'cvv'), 'card_number')
+
+
+def test_unknown_master_key(master_keys):
+    blob = encrypt(CARD, 'card_number', vault_crypto.DataKey(master_key_id=2))
+    vault_crypto.set_master_keys({1: b'1' * 32}, 1)
+    with pytest.raises(VaultCryptoError, match='Unknown master key id 2'):
+        decrypt(blob, 'card_number')
+
+
+def test_wrong_master_key(master_keys):
+    blob = encrypt(CARD, 'card_number')
+    vault_crypto.set_master_keys({1: b'x' * 32}, 1)
+    with pytest.raises(VaultCryptoError, match='wrong master key'):
+        decrypt(blob, 'card_number')
+
+
+@pytest.mark.parametrize('blob', [b'', b'short', b'x' * 17])
+def test_unrecognised_ciphertext(blob):
+    with pytest.raises(VaultCryptoError, match='Unrecognised ciphertext'):
+        decrypt(blob, 'card_number')
+    if blob:
+        with pytest.raises(VaultCryptoError, match='Not a legacy ciphertext'):
+            vault_crypto.mysql_aes_decrypt(blob)
+
+
+def test_legacy_with_the_wrong_key():
+    with pytest.raises(VaultCryptoError):
+        decrypt(mysql_aes_encrypt(CARD, 'some-other-key'), 'card_number')
+
+
+def test_non_utf8_plaintext():
+    with pytest.raises(VaultCryptoError, match='not valid UTF-8'):
+        decrypt(mysql_aes_encrypt(b'\xff\xfe\xfd'), 'card_number')
+
+
+def test_rewrap_moves_to_the_active_key(master_keys):
+    record = vault_crypto.encrypt_record({'card_number': CARD, 'cvv': '123'})
+    vault_crypto.set_master_keys({1: b'1' * 32, 2: b'2' * 32}, 2)
+
+    moved = {field: rewrap(blob) for field, blob in record.items()}
+    assert {key_id_of(blob) for blob in moved.values()} == {2}
+    # The field ciphertext is reused; fields that shared a DEK still share one header
+    assert all(moved[f][vault_crypto.HEADER.size:] == record[f][vault_crypto.HEADER.size:] for f in record)
+    assert len({blob[:vault_crypto.HEADER.size] for blob in moved.values()}) == 1
+    assert rewrap(moved['cvv']) == moved['cvv']
+
+    vault_crypto.set_master_keys({2: b'2' * 32}, 2)
+    assert decrypt(moved['card_number'], 'card_number') == CARD
+    assert decrypt(moved['cvv'], 'cvv') == '123'
+
+
+@pytest.mark.parametrize('key_id', [0, 256, -1])
+def test_master_key_ids_must_fit_the_header(master_keys, key_id):
+    with pytest.raises(ValueError, match='1-255'):
+        vault_crypto.set_master_keys({key_id: b'k' * 32}, key_id)
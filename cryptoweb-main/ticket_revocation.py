@@ -0,0 +1,291 @@
+"""
+Ticket Revocation for Credit Card Vault
+Host-wide Bloom filter in front of the authoritative RevokedTickets table
+
+A revoked ticket ID is written to MySQL (RevokedTickets, migration 9) and
+set in a Bloom filter kept in a memory-mapped file under /dev/shm, which
+every gunicorn worker on the host maps. Checking a ticket is a few bit
+tests in that shared mapping; only a Bloom hit (a revoked ticket or a
+rare false positive) costs a database lookup.
+
+Entries expire with their tickets: the filter is split into slots by
+expiry window (REVOCATION_WINDOW seconds). A slot is wiped and reused
+once every ticket in its old window has expired, and table rows past
+expires_at are ignored and purged.
+
+A fresh segment (e.g. after a reboot) is rebuilt from the table. With
+several hosts, set REVOCATION_SYNC_INTERVAL so each worker pulls recent
+revocations from the table at that interval.
+
+A Bloom hit the table does not confirm is remembered per worker as a
+false positive for at most REVOCATION_CLEARED_TTL seconds (and until the
+next sync), so a ticket revoked later by another worker is rejected
+everywhere within that window.
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import local_state
+from db_pool import get_connection
+
+REVOCATION_PATH = os.getenv(
+    "REVOCATION_PATH",
+    os.path.join("/dev/shm", "cardvault_revoked.bloom") if os.path.isdir("/dev/shm")
+    else local_state.default_path("revoked.bloom")
+)
+REVOCATION_BLOOM_BITS = int(os.getenv("REVOCATION_BLOOM_BITS", str(1 << 20)))  # per slot (128 KiB)
+REVOCATION_BLOOM_HASHES = 7          # ~1% false positives at 100k revocations per window
+REVOCATION_WINDOW = 600              # seconds of expiry time per slot
+REVOCATION_SLOTS = 5                 # tickets may live up to (SLOTS - 2) * WINDOW = 1800s
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", "0"))  # 0 = single host
+REVOCATION_CLEARED_TTL = float(os.getenv("REVOCATION_CLEARED_TTL", "5"))  # trust a false positive this long
+PURGE_EVERY = 100                    # revocations between expired-row purges
+
+MAX_TICKET_LIFETIME = (REVOCATION_SLOTS - 2) * REVOCATION_WINDOW
+
+REVOKED_TABLE = """
+    CREATE TABLE IF NOT EXISTS RevokedTickets (
+        ticket_id CHAR(32) PRIMARY KEY,
+        userid VARCHAR(50) NULL,
+        reason VARCHAR(50) NOT NULL DEFAULT 'logout',
+        expires_at DATETIME NOT NULL,
+        revoked_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        KEY idx_revoked_expires (expires_at),
+        KEY idx_revoked_at (revoked_at)
+    )
+"""
+
+MAGIC = b'CVREVOK1'
+HEADER = struct.Struct('<8sIIII')  # magic, bits, hashes, window, slots
+SLOT_WINDOW = struct.Struct('<q')
+
+
+class RevocationFilter:
+    """Windowed Bloom filter in a shared, memory-mapped file"""
+
+    def __init__(self, path=REVOCATION_PATH, bits=REVOCATION_BLOOM_BITS,
+                 hashes=REVOCATION_BLOOM_HASHES, window=REVOCATION_WINDOW, slots=REVOCATION_SLOTS):
+        self.path = path
+        self.bits = bits
+        self.hashes = hashes
+        self.window = window
+        self.slots = slots
+        self.slot_size = SLOT_WINDOW.size + bits // 8
+        self.size = HEADER.size + slots * self.slot_size
+
+        self._thread_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', mode=0o700, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+        if os.fstat(self._fd).st_uid != os.getuid():
+            os.close(self._fd)
+            raise local_state.UnsafePathError(f"{path} is owned by another user; refusing to map it")
+        header = HEADER.pack(MAGIC, bits, hashes, window, slots)
+        with self._locked():
+            # A missing or differently-sized segment is (re)initialised once
+            self.fresh = os.fstat(self._fd).st_size != self.size or os.pread(self._fd, HEADER.size, 0) != header
+            if self.fresh:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self.size)
+                os.pwrite(self._fd, header, 0)
+        self._mm = mmap.mmap(self._fd, self.size)
+
+    @contextmanager
+    def _locked(self):
+        """Thread lock plus a POSIX record lock (excludes other workers)"""
+        with self._thread_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _positions(self, ticket_id):
+        # Ticket IDs are 128 random bits already: split them for double hashing
+        raw = bytes.fromhex(ticket_id)
+        h1 = int.from_bytes(raw[:8], 'little')
+        h2 = int.from_bytes(raw[8:16], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def _slot(self, expires_at):
+        window = int(expires_at) // self.window
+        return window, HEADER.size + (window % self.slots) * self.slot_size
+
+    def add(self, ticket_id, expires_at):
+        window, offset = self._slot(expires_at)
+        base = offset + SLOT_WINDOW.size
+        with self._locked():
+            if SLOT_WINDOW.unpack_from(self._mm, offset)[0] != window:
+                # Every ticket of the slot's previous window has expired
+                self._mm[base:base + self.bits // 8] = bytes(self.bits // 8)
+                SLOT_WINDOW.pack_into(self._mm, offset, window)
+            for pos in self._positions(ticket_id):
+                self._mm[base + (pos >> 3)] |= 1 << (pos & 7)
+
+    def might_contain(self, ticket_id, expires_at):
+        window, offset = self._slot(expires_at)
+        if SLOT_WINDOW.unpack_from(self._mm, offset)[0] != window:
+            return False
+        base = offset + SLOT_WINDOW.size
+        mm = self._mm
+        for pos in self._positions(ticket_id):
+            if not mm[base + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+# ==================== PER-PROCESS STATE ====================
+_db_config = None
+_filter = None
+_filter_pid = None
+_state_lock = threading.Lock()
+_confirmed = {}      # ticket_id -> expires_at, revocations confirmed by the table
+_cleared = {}        # ticket_id -> recheck time, Bloom false positives
+_last_sync = 0.0
+_stats = {'checks': 0, 'bloom_hits': 0, 'store_lookups': 0, 'false_positives': 0, 'revoked': 0}
+
+
+def configure(db_config):
+    """Set the database holding RevokedTickets (called once by the app)"""
+    global _db_config
+    _db_config = db_config
+
+
+def get_filter():
+    """This host's shared filter, rebuilt from the table if newly created"""
+    global _filter, _filter_pid
+    if _filter is None or _filter_pid != os.getpid():
+        with _state_lock:
+            if _filter is None or _filter_pid != os.getpid():
+                _filter = RevocationFilter()
+                _filter_pid = os.getpid()
+                if _filter.fresh and _db_config is not None:
+                    try:
+                        _load_from_store(_filter)
+                    except Exception as e:
+                        print(f"Revocation rebuild error: {e}")
+    return _filter
+
+
+def _load_from_store(bloom, since=None):
+    conn = get_connection(_db_config)
+    cursor = conn.cursor()
+    sql = "SELECT ticket_id, UNIX_TIMESTAMP(expires_at) FROM RevokedTickets WHERE expires_at > NOW()"
+    params = ()
+    if since is not None:
+        sql += " AND revoked_at >= %s"
+        params = (since,)
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    conn.close()
+    for ticket_id, expires_at in rows:
+        bloom.add(ticket_id, int(expires_at))
+    return len(rows)
+
+
+def _maybe_sync(bloom, now):
+    """Pull revocations made on other hosts (REVOCATION_SYNC_INTERVAL > 0)"""
+    global _last_sync
+    if now - _last_sync < REVOCATION_SYNC_INTERVAL:
+        return
+    since = datetime.fromtimestamp(_last_sync - REVOCATION_SYNC_INTERVAL) if _last_sync else None
+    _last_sync = now
+    with _state_lock:
+        _cleared.clear()  # a synced revocation may be one of them
+    try:
+        _load_from_store(bloom, since)
+    except Exception as e:
+        print(f"Revocation sync error: {e}")
+
+
+def _prune(cache, now):
+    for ticket_id in [t for t, expires_at in cache.items() if expires_at < now]:
+        cache.pop(ticket_id, None)
+
+
+# ==================== API ====================
+def revoke(ticket_id, expires_at, userid=None, reason='logout'):
+    """Revoke a ticket until it expires; visible to every worker at once"""
+    now = time.time()
+    if expires_at <= now:
+        return False
+    if expires_at - now > MAX_TICKET_LIFETIME:
+        raise ValueError(f"Tickets living over {MAX_TICKET_LIFETIME}s cannot be revoked by the filter")
+
+    get_filter().add(ticket_id, expires_at)
+    with _state_lock:
+        _confirmed[ticket_id] = expires_at
+        _cleared.pop(ticket_id, None)
+        _stats['revoked'] += 1
+        purge = _stats['revoked'] % PURGE_EVERY == 0
+
+    if _db_config is None:
+        return True
+    try:
+        conn = get_connection(_db_config)
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT IGNORE INTO RevokedTickets (ticket_id, userid, reason, expires_at)
+            VALUES (%s, %s, %s, %s)
+        """, (ticket_id, userid, reason, datetime.fromtimestamp(expires_at)))
+        if purge:
+            cursor.execute("DELETE FROM RevokedTickets WHERE expires_at < NOW() LIMIT 1000")
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        # The host-wide filter already rejects the ticket
+        print(f"Revocation store error: {e}")
+    return True
+
+
+def is_revoked(ticket_id, expires_at):
+    """O(1) check: Bloom bits first, the table only on a Bloom hit"""
+    now = time.time()
+    bloom = get_filter()
+    if REVOCATION_SYNC_INTERVAL:
+        _maybe_sync(bloom, now)
+
+    _stats['checks'] += 1
+    if not bloom.might_contain(ticket_id, expires_at):
+        return False
+
+    _stats['bloom_hits'] += 1
+    if ticket_id in _confirmed:
+        return True
+    if _cleared.get(ticket_id, 0) > now:
+        return False
+
+    if _db_config is None:
+        return True  # fail closed: cannot tell a false positive apart
+    _stats['store_lookups'] += 1
+    try:
+        conn = get_connection(_db_config)
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM RevokedTickets WHERE ticket_id = %s", (ticket_id,))
+        revoked = cursor.fetchone() is not None
+        conn.close()
+    except Exception as e:
+        print(f"Revocation lookup error: {e}")
+        return True
+
+    with _state_lock:
+        _prune(_confirmed, now)
+        _prune(_cleared, now)
+        if revoked:
+            _confirmed[ticket_id] = expires_at
+        else:
+            _stats['false_positives'] += 1
+            _cleared[ticket_id] = min(expires_at, now + REVOCATION_CLEARED_TTL)
+    return revoked
+
+
+def revocation_stats():
+    """Revocation check counters for this process"""
+    with _state_lock:
+        return dict(_stats)
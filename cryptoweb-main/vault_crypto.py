@@ -0,0 +1,276 @@
+"""
+Application-Side Card Encryption for Credit Card Vault
+AES-256-GCM envelope encryption; MySQL only stores opaque ciphertext
+
+Each record (or each batch, see DataKeyBatch) gets a random 256-bit data
+key (DEK). Fields are encrypted with the DEK; the DEK is wrapped with a
+master key (AES-GCM) and stored next to the ciphertext with the master key
+ID, so keys can be rotated without touching the master key material:
+
+    magic 'CVE1' | master key id (1) | wrapped DEK (12 nonce + 32 + 16 tag) |
+    nonce (12) | ciphertext + tag (16)
+
+The field name is bound as associated data, so a CVV ciphertext cannot be
+swapped into the card_number column.
+
+Master keys come from VAULT_MASTER_KEYS ("2:<base64 32 bytes>,1:<...>",
+first entry encrypts, all decrypt). Without it a single key 1 is derived
+from AES_KEY so development setups keep working.
+
+Rows written by MySQL AES_ENCRYPT (AES-128-ECB, folded key, PKCS#7) are
+still readable through the legacy path until they are re-encrypted.
+"""
+
+import base64
+import hashlib
+import os
+import secrets
+import struct
+import threading
+from collections import OrderedDict
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AES_KEY = os.getenv("AES_KEY", "my-secure-aes-key-2024")  # legacy MySQL AES_ENCRYPT key
+
+MAGIC = b'CVE1'
+NONCE_SIZE = 12
+WRAPPED_DEK_SIZE = NONCE_SIZE + 32 + 16
+HEADER = struct.Struct(f'>4sB{WRAPPED_DEK_SIZE}s')
+DEK_CACHE_SIZE = 4096
+
+
+class VaultCryptoError(ValueError):
+    """Ciphertext could not be decrypted with any known key"""
+
+
+def _check_key_id(key_id):
+    # One header byte; 0 is what key_id_of() reports for legacy ciphertext
+    if not 1 <= key_id <= 255:
+        raise ValueError(f"Master key id must be 1-255, got {key_id}")
+    return key_id
+
+
+def _load_master_keys():
+    spec = os.getenv("VAULT_MASTER_KEYS")
+    if not spec:
+        return {1: hashlib.sha256(AES_KEY.encode()).digest()}, 1
+    keys = {}
+    for item in spec.split(','):
+        key_id, _, key = item.strip().partition(':')
+        keys[_check_key_id(int(key_id))] = base64.b64decode(key)
+    return keys, int(spec.split(':', 1)[0])
+
+
+MASTER_KEYS, ACTIVE_MASTER_KEY_ID = _load_master_keys()
+
+# Key schedules are built once: master keys up front, DEKs on first use
+_master_ciphers = {key_id: AESGCM(key) for key_id, key in MASTER_KEYS.items()}
+_dek_cache = OrderedDict()   # (key id, wrapped DEK) -> AESGCM
+_rewrap_cache = {}           # (old key id, wrapped DEK, new key id) -> new header
+_dek_lock = threading.Lock()
+
+
+def set_master_keys(keys, active_key_id):
+    """Replace the master key set (key rotation); drops cached data keys"""
+    global MASTER_KEYS, ACTIVE_MASTER_KEY_ID, _master_ciphers
+    MASTER_KEYS = {_check_key_id(int(k)): v for k, v in keys.items()}
+    ACTIVE_MASTER_KEY_ID = int(active_key_id)
+    _master_ciphers = {key_id: AESGCM(key) for key_id, key in MASTER_KEYS.items()}
+    with _dek_lock:
+        _dek_cache.clear()
+        _rewrap_cache.clear()
+
+
+# ==================== DATA KEYS ====================
+class DataKey:
+    """A fresh DEK, wrapped under the active master key"""
+
+    def __init__(self, master_key_id=None):
+        self.master_key_id = ACTIVE_MASTER_KEY_ID if master_key_id is None else master_key_id
+        dek = AESGCM.generate_key(bit_length=256)
+        self.header = _wrap(dek, self.master_key_id)
+        self.cipher = AESGCM(dek)
+
+    def encrypt(self, plaintext, field):
+        if isinstance(plaintext, str):
+            plaintext = plaintext.encode()
+        nonce = secrets.token_bytes(NONCE_SIZE)
+        return self.header + nonce + self.cipher.encrypt(nonce, plaintext, field.encode())
+
+
+class DataKeyBatch:
+    """
+    One DEK for many records (bulk loads): wrap once, encrypt many
+    Rotates to a new DEK every `records_per_key` calls to next_key().
+    """
+
+    def __init__(self, records_per_key=1000):
+        self.records_per_key = records_per_key
+        self._key = None
+        self._used = 0
+
+    def next_key(self):
+        if self._key is None or self._used >= self.records_per_key:
+            self._key = DataKey()
+            self._used = 0
+        self._used += 1
+        return self._key
+
+
+def _wrap(dek, master_key_id):
+    """Envelope header carrying `dek` wrapped under a master key"""
+    nonce = secrets.token_bytes(NONCE_SIZE)
+    wrapped = nonce + _master_ciphers[master_key_id].encrypt(nonce, dek, MAGIC)
+    return HEADER.pack(MAGIC, master_key_id, wrapped)
+
+
+def _unwrap_dek(master_key_id, wrapped):
+    master = _master_ciphers.get(master_key_id)
+    if master is None:
+        raise VaultCryptoError(f"Unknown master key id {master_key_id}")
+    try:
+        return master.decrypt(wrapped[:NONCE_SIZE], wrapped[NONCE_SIZE:], MAGIC)
+    except InvalidTag:
+        raise VaultCryptoError("Data key unwrap failed (wrong master key)")
+
+
+def _unwrap(master_key_id, wrapped):
+    cache_key = (master_key_id, wrapped)
+    with _dek_lock:
+        cipher = _dek_cache.get(cache_key)
+        if cipher is not None:
+            _dek_cache.move_to_end(cache_key)
+            return cipher
+
+    cipher = AESGCM(_unwrap_dek(master_key_id, wrapped))
+
+    with _dek_lock:
+        _dek_cache[cache_key] = cipher
+        while len(_dek_cache) > DEK_CACHE_SIZE:
+            _dek_cache.popitem(last=False)
+    return cipher
+
+
+# ==================== LEGACY (MySQL AES_ENCRYPT) ====================
+def _mysql_key(key):
+    """MySQL folds the key into 16 bytes by XOR"""
+    folded = bytearray(16)
+    for i, byte in enumerate(key.encode() if isinstance(key, str) else key):
+        folded[i % 16] ^= byte
+    return bytes(folded)
+
+
+_legacy_key = _mysql_key(AES_KEY)
+
+
+def mysql_aes_encrypt(plaintext, key=None):
+    """Same result as MySQL AES_ENCRYPT(plaintext, key) in the default aes-128-ecb mode"""
+    if isinstance(plaintext, str):
+        plaintext = plaintext.encode()
+    encryptor = Cipher(algorithms.AES(_mysql_key(key) if key else _legacy_key), modes.ECB()).encryptor()
+    padder = padding.PKCS7(128).padder()
+    padded = padder.update(plaintext) + padder.finalize()
+    return encryptor.update(padded) + encryptor.finalize()
+
+
+def mysql_aes_decrypt(blob, key=None):
+    """Same result as MySQL AES_DECRYPT(blob, key) in the default aes-128-ecb mode"""
+    if not is_legacy(blob):
+        raise VaultCryptoError("Not a legacy ciphertext (length is not a multiple of 16)")
+    decryptor = Cipher(algorithms.AES(_mysql_key(key) if key else _legacy_key), modes.ECB()).decryptor()
+    unpadder = padding.PKCS7(128).unpadder()
+    try:
+        return unpadder.update(decryptor.update(blob) + decryptor.finalize()) + unpadder.finalize()
+    except ValueError:
+        raise VaultCryptoError("Legacy ciphertext did not decrypt (wrong AES_KEY?)")
+
+
+def is_envelope(blob):
+    return bytes(blob[:4]) == MAGIC
+
+
+def is_legacy(blob):
+    return len(blob) > 0 and len(blob) % 16 == 0
+
+
+# ==================== API ====================
+def encrypt(plaintext, field, key=None):
+    """Encrypt one field under `key` (a DataKey; a fresh one if omitted)"""
+    return (key or DataKey()).encrypt(plaintext, field)
+
+
+def encrypt_record(fields):
+    """Encrypt several fields of one record under a single DEK: {field: plaintext} -> {field: blob}"""
+    key = DataKey()
+    return {field: key.encrypt(value, field) for field, value in fields.items()}
+
+
+def decrypt(blob, field):
+    """Decrypt one stored value (envelope or legacy) to str"""
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    if is_envelope(blob):
+        if len(blob) < HEADER.size + NONCE_SIZE + 16:
+            raise VaultCryptoError(f"Envelope decrypt failed for {field} (truncated)")
+        _, master_key_id, wrapped = HEADER.unpack_from(blob)
+        body = blob[HEADER.size:]
+        cipher = _unwrap(master_key_id, wrapped)
+        try:
+            plaintext = cipher.decrypt(body[:NONCE_SIZE], body[NONCE_SIZE:], field.encode())
+        except InvalidTag:
+            raise VaultCryptoError(f"Envelope decrypt failed for {field}")
+    elif is_legacy(blob):
+        plaintext = mysql_aes_decrypt(blob)
+    else:
+        raise VaultCryptoError(f"Unrecognised ciphertext for {field}")
+    try:
+        return plaintext.decode()
+    except UnicodeDecodeError:
+        raise VaultCryptoError(f"Decrypted {field} is not valid UTF-8 (wrong key?)")
+
+
+def decrypt_many(blobs, field):
+    """
+    Decrypt a page of values; DEKs shared by a batch are unwrapped once
+    (cached key schedules), so the cost is one AES-GCM open per value
+    """
+    return [decrypt(blob, field) for blob in blobs]
+
+
+def rewrap(blob, master_key_id=None):
+    """
+    Move an envelope value to another master key (the active one by default)
+    Only the wrapped DEK changes; the field ciphertext is reused as is. Values
+    that shared a DEK keep sharing one new wrapped DEK.
+    """
+    blob = bytes(blob)
+    target = ACTIVE_MASTER_KEY_ID if master_key_id is None else master_key_id
+    _, old_key_id, wrapped = HEADER.unpack_from(blob)
+    if old_key_id == target:
+        return blob
+    cache_key = (old_key_id, wrapped, target)
+    with _dek_lock:
+        header = _rewrap_cache.get(cache_key)
+    if header is None:
+        header = _wrap(_unwrap_dek(old_key_id, wrapped), target)
+        with _dek_lock:
+            if len(_rewrap_cache) >= DEK_CACHE_SIZE:
+                _rewrap_cache.clear()
+            _rewrap_cache[cache_key] = header
+    return header + blob[HEADER.size:]
+
+
+def key_id_of(blob):
+    """Master key ID of a stored value (0 for legacy MySQL ciphertext)"""
+    blob = bytes(blob)
+    if is_envelope(blob) and len(blob) > HEADER.size:
+        return blob[4]
+    return 0